@@ -12,6 +12,7 @@ from . import (
     CacheDependency,
     TestList,
 )
+from . import stamps
 
 class ClearingHandler(object):
     
@@ -74,8 +75,10 @@ class ClearingHandler(object):
         if not self.kwargs_tests.test(kwargs):
             return
         
+        self.clear_for(kwargs['instance'])
+    
+    def clear_for(self, inst):
         to_remove = set()
-        inst = kwargs['instance']
         
         for testlist, keys in self.cache_keys['any'].items():
             if testlist.test(inst):
@@ -133,6 +136,19 @@ class CacheClearer(object):
     def remove(self, key):
         for h in self.handlers.values():
             h.remove_cache_key(key)
+    
+    def instances_changed(self, instances, change_type='update'):
+        '''\
+        Clears the cache keys that depend on the given instances, for changes
+        that were made without sending the usual signals (e.g. with
+        QuerySet.update()).
+        '''
+        
+        for inst in instances:
+            selector = (inst.__class__, change_type)
+            if selector in self.handlers:
+                self.handlers[selector].clear_for(inst)
+        stamps.changed(instances)
 
 class Cache(object):
     
@@ -0,0 +1,225 @@
+'''\
+Version stamps for model instances, so that views can answer conditional GETs
+without rendering anything.
+
+Each instance has a stamp in the (shared) Django cache: a random token and the
+time it was made. A stamp is thrown away whenever its instance is saved,
+deleted, or has its many-to-many relations changed, along with the stamps of
+the instances that depend on it (see register_dependents). The next time the
+stamp is asked for, a new one is made. Since a missing stamp is just made
+again, losing cache entries only costs a page render.
+
+For models that many pages show (e.g. Taxa), register_global makes changes to
+them throw away a single global stamp instead, which every page's ETag
+includes.
+
+Changes made during a request are thrown away again after the request's
+transaction is committed (see StampMiddleware), so that a page rendered
+between the save and the commit isn't remembered as current.
+
+Note that this needs a cache that's shared by all the processes serving
+requests (i.e. not 'locmem://').
+'''
+
+from inspect import getmro
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db.models import signals as model_signals
+
+from django.contrib.auth.models import (
+    Group,
+    Permission,
+    User,
+)
+
+# stamps are only thrown away on changes, so keep them for as long as the
+# cache allows (memcached's maximum is 30 days)
+STAMP_TIMEOUT = 30 * 24 * 60 * 60
+
+# model -> [<function>, ...]
+_dependents = {}
+# models whose changes throw away the global stamp
+_global_models = set()
+
+_pending = threading.local()
+
+def _root_model(model):
+    # the model at the top of the multi-table inheritance chain, so that e.g. a
+    # Case and its Entanglement share a stamp
+    while model._meta.pk.rel and model._meta.pk.rel.parent_link:
+        model = model._meta.pk.rel.to
+    return model
+
+def stamp_key(model, pk):
+    '''\
+    Returns the cache key of the stamp of the instance of the given model with
+    the given primary key.
+    '''
+
+    model = _root_model(model)
+    return u'stamp__%s__%s__%s' % (
+        model._meta.app_label,
+        model._meta.object_name.lower(),
+        pk,
+    )
+
+def global_stamp_key():
+    '''\
+    Returns the cache key of the global stamp. It's different for each version
+    of the code, since pages change with the code too.
+    '''
+
+    return u'stamp__global__%s' % getattr(settings, 'GLOBAL_ETAG', u'')
+
+def register_dependents(model, dependents):
+    '''\
+    Makes changes to instances of the given model (or its subclasses) throw
+    away the stamps of the instances returned by dependents(<instance>), as
+    well as their own. Use this for instances that are shown on the pages of
+    other instances. Changes to models that aren't registered (here or with
+    register_global) are ignored.
+    '''
+
+    _dependents.setdefault(model, []).append(dependents)
+
+def register_global(model):
+    '''\
+    Makes changes to instances of the given model (or its subclasses) throw
+    away the global stamp.
+    '''
+
+    _global_models.add(model)
+
+def _classes(model):
+    return [c for c in getmro(model) if c in _dependents or c in _global_models]
+
+def _keys_to_bump(instances):
+    keys = set()
+    seen = set()
+    to_visit = list(instances)
+    while to_visit:
+        inst = to_visit.pop()
+        if inst is None or inst.pk is None:
+            continue
+
+        key = stamp_key(inst.__class__, inst.pk)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        is_global = False
+        for c in _classes(inst.__class__):
+            if c in _global_models:
+                is_global = True
+            else:
+                for dependents in _dependents[c]:
+                    to_visit.extend(dependents(inst))
+
+        if is_global:
+            keys.add(global_stamp_key())
+        else:
+            keys.add(key)
+
+    return keys
+
+def _bump_keys(keys):
+    for key in keys:
+        django_cache.delete(key)
+
+def changed(instances):
+    '''\
+    Throws away the stamps of the given instances and those that depend on
+    them. Call this for changes that were made without sending the usual
+    signals (e.g. with QuerySet.update()).
+    '''
+
+    keys = _keys_to_bump(instances)
+    _bump_keys(keys)
+    if hasattr(_pending, 'keys'):
+        _pending.keys |= keys
+
+def get_stamps(keys):
+    '''\
+    Returns a list of the stamps with the given keys, as (<token>, <time>)
+    tuples, making new ones for any that don't exist.
+    '''
+
+    found = django_cache.get_many(keys)
+    stamps = []
+    for key in keys:
+        stamp = found.get(key)
+        if stamp is None:
+            stamp = (uuid.uuid4().hex, int(time.time()))
+            if not django_cache.add(key, stamp, STAMP_TIMEOUT):
+                # another request made one in the meantime
+                stamp = django_cache.get(key, stamp)
+        stamps.append(stamp)
+    return stamps
+
+def instance_stamps(instances):
+    '''\
+    Returns a list of the stamps of the given instances, followed by the
+    global stamp.
+    '''
+
+    keys = [stamp_key(inst.__class__, inst.pk) for inst in instances]
+    keys.append(global_stamp_key())
+    return get_stamps(keys)
+
+class StampMiddleware(object):
+    '''\
+    Throws away the stamps changed during a request once more after the
+    request's transaction has been committed. Must come before
+    TransactionMiddleware in MIDDLEWARE_CLASSES.
+    '''
+
+    def process_request(self, request):
+        _pending.keys = set()
+
+    def process_response(self, request, response):
+        keys = getattr(_pending, 'keys', None)
+        if keys:
+            _bump_keys(keys)
+        _pending.keys = set()
+        return response
+
+def _post_save(sender, instance, **kwargs):
+    if _classes(sender):
+        changed([instance])
+
+def _pre_delete(sender, instance, **kwargs):
+    # before the delete, so that the dependents can still be found
+    if _classes(sender):
+        changed([instance])
+
+def _m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action in ('post_add', 'post_remove', 'post_clear'):
+        return
+    instances = []
+    if _classes(instance.__class__):
+        instances.append(instance)
+    if pk_set and _classes(model):
+        instances += model._default_manager.in_bulk(list(pk_set)).values()
+    changed(instances)
+
+model_signals.post_save.connect(
+    receiver= _post_save,
+    dispatch_uid= 'clean_cache__stamps__post_save',
+)
+model_signals.pre_delete.connect(
+    receiver= _pre_delete,
+    dispatch_uid= 'clean_cache__stamps__pre_delete',
+)
+model_signals.m2m_changed.connect(
+    receiver= _m2m_changed,
+    dispatch_uid= 'clean_cache__stamps__m2m_changed',
+)
+
+# pages differ by the user's permissions
+register_dependents(User, lambda u: [])
+register_global(Group)
+register_global(Permission)
@@ -0,0 +1,92 @@
+'''\
+The 'cachefragment' tag, for caching the rendered parts of detail pages that
+only depend on some model instances and the user's permissions. The cached
+fragments are keyed by the instances' version stamps (see
+clean_cache.stamps), so changes to the instances (or to the ones they show)
+make new keys, and the old fragments just time out of the cache.
+'''
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+
+from django import template
+from django.core.cache import cache as django_cache
+
+from cetacean_incidents.apps.clean_cache import CACHE_TIMEOUT
+from cetacean_incidents.apps.clean_cache.stamps import instance_stamps
+
+register = template.Library()
+
+def _perms_key(user):
+    # what the 'perms' context variable and has_perm depend on
+    if user is None:
+        return None
+    return (
+        user.is_active,
+        user.is_superuser,
+        tuple(sorted(user.get_all_permissions())),
+    )
+
+def fragment_key(name, instances, user):
+    '''\
+    Returns the cache key of the fragment with the given name, for the given
+    model instances as shown to the given user (who may be None). Users with
+    the same permissions share fragments.
+    '''
+
+    classes = [
+        (inst._meta.app_label, inst._meta.object_name)
+        for inst in instances
+    ]
+    tokens = [token for token, made in instance_stamps(instances)]
+    key = repr((name, classes, tokens, _perms_key(user)))
+    return u'fragment__%s' % sha1(key).hexdigest()
+
+class CacheFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, instance_exprs):
+        self.nodelist = nodelist
+        self.name = name
+        self.instance_exprs = instance_exprs
+
+    def render(self, context):
+        instances = []
+        for expr in self.instance_exprs:
+            inst = expr.resolve(context)
+            if not inst is None:
+                instances.append(inst)
+
+        key = fragment_key(self.name, instances, context.get('user'))
+        value = django_cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            django_cache.set(key, value, CACHE_TIMEOUT)
+        return value
+
+@register.tag
+def cachefragment(parser, token):
+    '''\
+    {% cachefragment <name> <instance> [<instance> ...] %} ...
+    {% endcachefragment %}
+
+    Caches the contents until any of the given model instances change. The
+    name only has to be unique among the fragments for the same instances.
+    The contents may use the 'perms' context variable, but nothing else
+    about the user, nor anything that isn't shown through the instances (or
+    those registered as their dependents).
+    '''
+
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            "%r tag requires a name and at least one instance" % bits[0]
+        )
+    name = bits[1]
+    instance_exprs = [parser.compile_filter(b) for b in bits[2:]]
+
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(nodelist, name, instance_exprs)
+
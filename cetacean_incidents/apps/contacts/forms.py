@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django import forms
 from django.db.models import Q
 from django.forms.formsets import formset_factory
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
-from django.contrib.admin.widgets import FilteredSelectMultiple
+from cetacean_incidents.apps.generic_templates.templatetags.html_filter import html
+
+from cetacean_incidents.apps.jquery_ui.widgets import ModelAutocomplete
 
 from cetacean_incidents.apps.merge_form.forms import MergeForm
 
@@ -28,6 +33,71 @@ class EmailInput(forms.TextInput):
 
     input_type = 'email'
 
+class ContactAutocomplete(ModelAutocomplete):
+    '''\
+    For choosing a Contact by typing its name, instead of listing every
+    contact in a select element.
+    '''
+    
+    model = Contact
+    
+    def __init__(self, attrs=None):
+        super(ContactAutocomplete, self).__init__(
+            attrs=attrs,
+            source= 'contact_autocomplete_source',
+            options= {
+                'minLength': 2,
+            },
+        )
+    
+    def id_to_html_display(self, id):
+        return html(Contact.objects.get(id=id))
+    
+    def render(self, name, value, attrs=None):
+        return super(ContactAutocomplete, self).render(
+            name=name,
+            value=value,
+            attrs=attrs,
+            extra_js= '''\
+            contact_autocomplete_source_url = "%s";
+            ''' % reverse('contact_search_json'),
+        )
+    
+    class Media:
+        css = {'all': (settings.JQUERYUI_CSS_FILE,)}
+        js = (settings.JQUERY_FILE, settings.JQUERYUI_JS_FILE, 'contact_autocomplete.js')
+
+class OrganizationsAutocomplete(forms.SelectMultiple):
+    '''\
+    For choosing several Organizations by typing their names. Only the
+    organizations already chosen are fetched when rendering.
+    '''
+    
+    def render(self, name, value, attrs=None, choices=()):
+        if value is None:
+            value = []
+        ids = []
+        for v in value:
+            if isinstance(v, Organization):
+                v = v.pk
+            try:
+                ids.append(int(v))
+            except (TypeError, ValueError):
+                pass
+        orgs = Organization.objects.in_bulk(ids)
+        
+        final_attrs = self.build_attrs(attrs, name=name)
+        return mark_safe(render_to_string('contacts/organizations_autocomplete.html', {
+            'id': final_attrs['id'],
+            'name': name,
+            'chosen': [orgs[i] for i in ids if i in orgs],
+            'source_url': reverse('organization_search_json'),
+        }))
+    
+    class Media:
+        css = {'all': (settings.JQUERYUI_CSS_FILE,)}
+        js = (settings.JQUERY_FILE, settings.JQUERYUI_JS_FILE, 'contact_autocomplete.js')
+
 class OrganizationForm(forms.ModelForm):
 
     class Meta:
@@ -86,12 +156,11 @@ class ContactForm(forms.ModelForm):
     def is_multipart(self):
         return super(ContactForm, self).is_multipart() or self.new_affs.is_multipart()
 
+    # note that ModelMultipleChoiceField only fetches the submitted
+    # organizations when cleaning
     affiliations = forms.ModelMultipleChoiceField(
         queryset= Organization.objects.all(),
-        widget= FilteredSelectMultiple(
-            verbose_name= Contact.affiliations.field.verbose_name,
-            is_stacked= False,
-        ),
+        widget= OrganizationsAutocomplete,
         required = not Contact.affiliations.field.blank,
         help_text = Contact.affiliations.field.help_text,
     )
@@ -133,14 +202,7 @@ class ContactForm(forms.ModelForm):
     
     @property
     def media(self):
-        # the FilteredSelectMultiple assumes jsi18n catalog and admin-specific
-        # css have been loaded. The CSS rules that it needs have been placed in    
-        # our own site-media file 'selectfilter.css'. The jsi18n catalog is
-        # available at a urlconf named 'jsi18n'
-        return forms.Media(
-            css = {'all': ('selectfilter.css',)},
-            js = (reverse('jsi18n'),),
-        ) + self.fields['affiliations'].widget.media + self.new_affs.media
+        return super(ContactForm, self).media + self.new_affs.media
     
     class Meta:
         model = Contact
@@ -150,27 +212,15 @@ class ContactForm(forms.ModelForm):
 
 class ContactMergeForm(MergeForm):
     
+    # note that ModelMultipleChoiceField only fetches the submitted
+    # organizations when cleaning
     affiliations = forms.ModelMultipleChoiceField(
         queryset= Organization.objects.all(),
-        widget= FilteredSelectMultiple(
-            verbose_name= Contact.affiliations.field.verbose_name,
-            is_stacked= False,
-        ),
+        widget= OrganizationsAutocomplete,
         required = not Contact.affiliations.field.blank,
         help_text = Contact.affiliations.field.help_text,
     )
     
-    @property
-    def media(self):
-        # the FilteredSelectMultiple assumes jsi18n catalog and admin-specific
-        # css have been loaded. The CSS rules that it needs have been placed in    
-        # our own site-media file 'selectfilter.css'. The jsi18n catalog is
-        # available at a urlconf named 'jsi18n'
-        return forms.Media(
-            css = {'all': ('selectfilter.css',)},
-            js = (reverse('jsi18n'),),
-        ) + self.fields['affiliations'].widget.media
-    
     class Meta:
         model = Contact
         widgets = {
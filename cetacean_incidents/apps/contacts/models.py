@@ -5,6 +5,7 @@ from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import register_global
 
 from cetacean_incidents.apps.documents.models import Documentable
 
@@ -162,3 +163,4 @@ class Contact(AbstractContact, Documentable):
     class Meta:
         ordering = ('sort_name', 'name', 'documentable_ptr')
 
+register_global(Organization)
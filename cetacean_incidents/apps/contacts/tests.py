@@ -1,6 +1,19 @@
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
+
+from django.http import HttpRequest
 from django.test import TestCase
 
+from cetacean_incidents.apps.duplicates.models import SearchKey
+
 from forms import ContactForm
+from models import (
+    Contact,
+    Organization,
+)
+from views import _search_json
 
 class ContactFormTestCase(TestCase):
 
@@ -9,4 +22,44 @@ class ContactFormTestCase(TestCase):
 
     def test_instantiation(self):
         f = ContactForm()
+    
+    def test_affiliations(self):
+        chosen = Organization.objects.create(name='NOAA')
+        other = Organization.objects.create(name='Coast Guard')
+        
+        f = ContactForm({
+            'name': 'someone',
+            'affiliations': [unicode(chosen.id)],
+            'new_affs-TOTAL_FORMS': '0',
+            'new_affs-INITIAL_FORMS': '0',
+        })
+        self.assertEqual(f.is_valid(), True)
+        self.assertEqual(list(f.cleaned_data['affiliations']), [chosen])
+        
+        # only the chosen organizations are rendered
+        rendered = unicode(f['affiliations'])
+        self.assertTrue(u'NOAA' in rendered)
+        self.assertFalse(u'Coast Guard' in rendered)
 
+class SearchJSONTestCase(TestCase):
+    
+    def _search(self, model, query):
+        request = HttpRequest()
+        request.GET['q'] = query
+        response = _search_json(request, model)
+        return [e['id'] for e in json.loads(response.content)]
+    
+    def test_search(self):
+        c = Contact.objects.create(name='NOAA Fisheries')
+        Contact.objects.create(name='Coast Guard')
+        
+        self.assertEqual(self._search(Contact, u'noaa'), [c.id])
+        self.assertEqual(self._search(Contact, u'#%d' % c.id), [c.id])
+    
+    def test_empty_index(self):
+        c = Contact.objects.create(name='NOAA Fisheries')
+        Contact.objects.create(name='Coast Guard')
+        # as if 'manage.py rebuild_search_keys' hadn't been run yet
+        SearchKey.objects.filter(index_name='contact_name').delete()
+        
+        self.assertEqual(self._search(Contact, u'noaa'), [c.id])
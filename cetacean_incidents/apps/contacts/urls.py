@@ -29,5 +29,12 @@ urlpatterns += patterns('',
         'merge_contact',
     ),
     (r'^search$', views.contact_search, {}, 'contact_search'),
+    (r'^search_json$', views.contact_search_json, {}, 'contact_search_json'),
+    (
+        r'^organizations/search_json$',
+        views.organization_search_json,
+        {},
+        'organization_search_json',
+    ),
 )
 
@@ -1,3 +1,8 @@
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
+
 from django.conf import settings
 from django.core.paginator import (
     Paginator,
@@ -5,6 +10,7 @@ from django.core.paginator import (
     EmptyPage,
 )
 from django.forms import Media
+from django.http import HttpResponse
 from django.shortcuts import (
     redirect,
     render_to_response,
@@ -23,12 +29,25 @@ from cetacean_incidents.forms import (
     PagingForm,
 )
 
+from cetacean_incidents.apps.duplicates.models import (
+    index_is_empty,
+    prefix_search,
+)
+
+from cetacean_incidents.apps.generic_templates.templatetags.html_filter import html
+
 from forms import (
     ContactForm,
     ContactMergeForm,
     ContactSearchForm,
 )
-from models import Contact
+from models import (
+    Contact,
+    Organization,
+)
+
+# the most entries the autocomplete searches return
+SEARCH_JSON_LIMIT = 20
 
 @login_required
 def contact_detail(request, contact_id):
@@ -190,3 +209,52 @@ def contact_search(request):
         context_instance= RequestContext(request),
     )
 
+def _search_json(request, model):
+    # Contacts and Organizations share the 'contact_name' search-key index,
+    # which is what makes these lookups cheap: only the matching entries are
+    # fetched. Until the index has been built, fall back to searching the
+    # names themselves.
+    query = request.GET.get('q', u'')
+    
+    if index_is_empty('contact_name', model):
+        results = model.objects.filter(name__istartswith=query.strip())
+        results = list(results.order_by('name')[:SEARCH_JSON_LIMIT])
+    else:
+        results = list(prefix_search('contact_name', model, query, SEARCH_JSON_LIMIT))
+    
+    # an ID can be given instead of a name
+    words = query.split()
+    if words:
+        try:
+            pk = int(words[0].lstrip('#'))
+            results = list(model.objects.filter(pk=pk)) + [r for r in results if r.pk != pk]
+        except ValueError:
+            pass
+    
+    entries = []
+    for result in results:
+        entries.append({
+            'id': result.id,
+            'plain_name': unicode(result),
+            'html_name': html(result),
+        })
+    
+    return HttpResponse(json.dumps(entries), mimetype='application/json')
+
+@login_required
+def contact_search_json(request):
+    '''\
+    Given a request with a query in the 'q' key of the GET string, returns a
+    JSON list of the Contacts whose names start with it.
+    '''
+    
+    return _search_json(request, Contact)
+
+@login_required
+def organization_search_json(request):
+    '''\
+    Given a request with a query in the 'q' key of the GET string, returns a
+    JSON list of the Organizations whose names start with it.
+    '''
+    
+    return _search_json(request, Organization)
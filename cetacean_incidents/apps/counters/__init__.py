@@ -0,0 +1,121 @@
+'''\
+A registry of row counts for big tables, so that pages can show them without
+a COUNT(*) over the whole table every time. Each count is kept in the cache
+and adjusted as entries are created and deleted. Since adjustments can be
+missed (e.g. for creations whose transaction is rolled back, or deletes made
+with raw SQL), the cached counts expire after RECONCILE_TIMEOUT seconds and
+are counted again from the database the next time they're needed.
+
+The adjustments need a cache that's shared by all the processes serving
+requests (i.e. not 'locmem://'); with one that isn't, the counts are still
+never more than RECONCILE_TIMEOUT seconds out of date.
+'''
+
+from django.core.cache import cache
+from django.db import models
+
+# how long a count can go without being checked against the database
+RECONCILE_TIMEOUT = 60 * 60 # one hour
+
+class Counter(object):
+
+    def __init__(self, name, model, senders):
+        '''\
+        Counts the entries of 'model'. 'senders' is an iterable of the models
+        whose post_save and post_delete signals mean an entry of 'model' was
+        created or deleted. Usually that's just 'model' and its subclasses.
+        
+        Deleting an instance of a subclass sends post_delete for each of its
+        models, including 'model', so post_delete is only listened to for
+        senders that aren't subclasses of 'model'.
+        '''
+        self.name = name
+        self.model = model
+        self.senders = tuple(senders)
+
+    @property
+    def cache_key(self):
+        return u'counters_%s' % self.name
+
+    def reconcile(self):
+        '''\
+        Counts the entries in the database and caches the result. Returns the
+        count.
+        '''
+        count = self.model._default_manager.count()
+        cache.set(self.cache_key, count, RECONCILE_TIMEOUT)
+        return count
+
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = self.reconcile()
+        return count
+
+    def _adjust(self, delta):
+        # note that incrementing doesn't reset the timeout, so the count is
+        # still reconciled on schedule
+        try:
+            if delta > 0:
+                cache.incr(self.cache_key, delta)
+            else:
+                cache.decr(self.cache_key, -delta)
+        except ValueError:
+            # the count isn't cached; it'll be counted when it's next needed
+            pass
+
+    def saved(self, created, **kwargs):
+        if created:
+            self._adjust(1)
+
+    def deleted(self, **kwargs):
+        self._adjust(-1)
+
+    def __repr__(self):
+        return '<Counter: %s>' % self.name
+
+# name -> Counter, in the order they were registered
+_counters = {}
+_counter_order = []
+
+def register_counter(name, model, senders=None):
+    '''\
+    Adds a counter to the registry. See Counter for the arguments; 'senders'
+    defaults to just 'model'.
+    '''
+
+    if senders is None:
+        senders = (model,)
+    counter = Counter(name, model, senders)
+    if not name in _counters:
+        _counter_order.append(name)
+    _counters[name] = counter
+
+    for sender in counter.senders:
+        for signal_name, receiver in (
+            ('post_save', counter.saved),
+            ('post_delete', counter.deleted),
+        ):
+            is_subclass = sender is not model and issubclass(sender, model)
+            if signal_name == 'post_delete' and is_subclass:
+                continue
+            signal = getattr(models.signals, signal_name)
+            signal.connect(
+                sender= sender,
+                receiver= receiver,
+                weak= False,
+                dispatch_uid= u'counters__%s__%s__%s__%s' % (
+                    name,
+                    sender._meta.app_label,
+                    sender._meta.object_name.lower(),
+                    signal_name,
+                ),
+            )
+
+    return counter
+
+def get_counter(name):
+    return _counters[name]
+
+def all_counters():
+    return [_counters[name] for name in _counter_order]
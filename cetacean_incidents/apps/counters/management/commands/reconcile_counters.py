@@ -0,0 +1,30 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from cetacean_incidents.apps.counters import (
+    all_counters,
+    get_counter,
+)
+
+class Command(BaseCommand):
+    args = '[<counter name> ...]'
+    help = 'Counts the entries for the cached row counts (like the ones on the home page) again from the database. Does all of them if none are given. Meant to be run periodically, e.g. from cron.'
+
+    def handle(self, *names, **options):
+        if names:
+            try:
+                counters = map(get_counter, names)
+            except KeyError, e:
+                raise CommandError("no such counter: %s" % e.args[0])
+        else:
+            counters = all_counters()
+
+        for counter in counters:
+            cached = counter.count()
+            count = counter.reconcile()
+            if cached == count:
+                print "%s: %d" % (counter.name, count)
+            else:
+                print "%s: %d (was %d)" % (counter.name, count, cached)
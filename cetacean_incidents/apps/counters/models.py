@@ -0,0 +1,29 @@
+from cetacean_incidents.apps.entanglements.models import Entanglement
+
+from cetacean_incidents.apps.incidents.models import (
+    Animal,
+    Case,
+    Observation,
+)
+
+from cetacean_incidents.apps.shipstrikes.models import Shipstrike
+
+from . import register_counter
+
+register_counter(
+    name= 'animals',
+    model= Animal,
+)
+
+# the post_save and post_delete signals for a Case subclass are only sent with
+# the subclass as the sender
+register_counter(
+    name= 'cases',
+    model= Case,
+    senders= (Case, Entanglement, Shipstrike),
+)
+
+register_counter(
+    name= 'observations',
+    model= Observation,
+)
@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from cetacean_incidents.apps.entanglements.models import Entanglement
+
+from cetacean_incidents.apps.incidents.models import (
+    Animal,
+    Case,
+)
+
+from . import get_counter
+
+class CountersTestCase(TestCase):
+
+    def test_animals(self):
+        counter = get_counter('animals')
+        count = counter.count()
+        self.assertEqual(count, Animal.objects.count())
+
+        a = Animal.objects.create()
+        self.assertEqual(counter.count(), count + 1)
+
+        # saving an existing entry doesn't change the count
+        a.save()
+        self.assertEqual(counter.count(), count + 1)
+
+        a.delete()
+        self.assertEqual(counter.count(), count)
+
+    def test_case_subclasses(self):
+        counter = get_counter('cases')
+        count = counter.count()
+
+        a = Animal.objects.create()
+        Case.objects.create(animal=a)
+        e = Entanglement.objects.create(animal=a)
+        self.assertEqual(counter.count(), count + 2)
+        self.assertEqual(counter.count(), Case.objects.count())
+        
+        # deleting a subclass instance sends post_delete for each of its
+        # models, but only one case is gone
+        e = Entanglement.objects.get(id=e.id)
+        e.delete()
+        self.assertEqual(counter.count(), count + 1)
+        self.assertEqual(counter.count(), Case.objects.count())
+
+    def test_reconcile(self):
+        counter = get_counter('animals')
+        counter.count()
+
+        # an adjustment that was missed
+        cache.set(counter.cache_key, -1)
+        self.assertEqual(counter.reconcile(), Animal.objects.count())
+        self.assertEqual(counter.count(), Animal.objects.count())
+
+        # a count that isn't cached isn't adjusted
+        cache.delete(counter.cache_key)
+        Animal.objects.create()
+        self.assertEqual(counter.count(), Animal.objects.count())
@@ -11,3 +11,14 @@ class UnrecognizedFieldError(ValueError):
     def __init__(self, column_name, *args, **kwargs):
         super(UnrecognizedFieldError, self).__init__(u'"%s"' % column_name, *args, **kwargs)
 
+
+class CSVParseError(ValueError):
+    
+    # require a list of (<row number>, <error message>) pairs
+    def __init__(self, errors, *args, **kwargs):
+        self.errors = errors
+        super(CSVParseError, self).__init__(
+            u'; '.join([u'row %d: %s' % e for e in errors]),
+            *args,
+            **kwargs
+        )
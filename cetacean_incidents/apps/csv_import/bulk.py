@@ -0,0 +1,114 @@
+'''\
+Helpers for saving lots of imported entries at once.
+
+Django doesn't have a way to insert many model instances in one query, so
+these only handle the simple tables (tags and many-to-many links) that don't
+need their primary keys back and don't use model inheritance.
+'''
+
+import datetime
+import time
+
+from django.db import (
+    connection,
+    transaction,
+)
+
+from reversion import revision
+
+from cetacean_incidents.apps.integrity import models_changed
+
+from cetacean_incidents.apps.tags.models import Tag
+
+from . import CURRENT_IMPORT_TAG
+
+def _executemany(table, columns, rows):
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(table),
+        ', '.join(map(qn, columns)),
+        ', '.join(['%s'] * len(columns)),
+    )
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.set_dirty()
+
+def bulk_tag(entries, user, tag_text=CURRENT_IMPORT_TAG):
+    '''\
+    Tags all the given Documentable instances with one INSERT query. The entries
+    must not already have the given tag from the given user. The new Tags are
+    added to the current revision, if there is one.
+    '''
+
+    entries = list(entries)
+    if not entries:
+        return
+
+    now = connection.ops.value_to_db_datetime(datetime.datetime.now())
+    _executemany(
+        Tag._meta.db_table,
+        [Tag._meta.get_field(f).column for f in ('entry', 'user', 'datetime_tagged', 'tag_text')],
+        [(e.pk, user.pk, now, tag_text) for e in entries],
+    )
+
+    if revision.is_active():
+        tags = Tag.objects.filter(
+            entry__in= [e.pk for e in entries],
+            user= user,
+            tag_text= tag_text,
+        )
+        for t in tags:
+            revision.add(t)
+
+def bulk_add_m2m(model, fieldname, pairs):
+    '''\
+    Adds links for the given ManyToManyField with one INSERT query. 'pairs' is
+    an iterable of (<instance of model>, <instance of the related model>)
+    tuples. No m2m_changed signals are sent, but the integrity checks that
+    depend on the links are cleared.
+    '''
+
+    field = model._meta.get_field(fieldname)
+    pairs = list(pairs)
+    _executemany(
+        field.m2m_db_table(),
+        [field.m2m_column_name(), field.m2m_reverse_name()],
+        [(inst.pk, other.pk) for inst, other in pairs],
+    )
+    if pairs:
+        models_changed([field.rel.through])
+
+class Throughput(object):
+    '''\
+    Keeps track of how fast rows are being processed.
+    '''
+
+    def __init__(self):
+        self.started = time.time()
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+
+    @property
+    def seconds(self):
+        return time.time() - self.started
+
+    @property
+    def rows_per_second(self):
+        seconds = self.seconds
+        if not seconds:
+            return None
+        return self.rows / seconds
+
+    def __unicode__(self):
+        rate = self.rows_per_second
+        if rate is None:
+            return u"%d rows" % self.rows
+        return u"%d rows in %.1f seconds (%.1f rows/second)" % (
+            self.rows,
+            self.seconds,
+            rate,
+        )
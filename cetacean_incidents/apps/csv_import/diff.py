@@ -0,0 +1,223 @@
+'''\
+Comparing parsed CSV rows to the animals already in the database without
+saving anything. The existing animals are read once into dictionaries keyed on
+their normalized identifiers, so checking each row is a few dictionary lookups
+instead of a query. Names match anywhere in another name, so they're looked up
+by their n-grams (see the duplicates app) and then checked.
+
+The import itself uses the same AnimalIndex to find the animals it notes as
+possible duplicates, so a dry run reports the same matches the import will.
+'''
+
+from cetacean_incidents.apps.duplicates import NGRAM_LENGTH
+
+from cetacean_incidents.apps.entanglements.models import Entanglement
+
+from cetacean_incidents.apps.incidents.models import Animal
+
+# the columns NMFS ids are found in, for the different years' spreadsheets
+NMFS_ID_COLUMNS = (
+    'NMFS Database # ',
+    'NMFS # ',
+    'NMFS #',
+)
+
+def normalize_key(value):
+    return value.strip().lower()
+
+def _name_grams(name):
+    # the substrings of 'name' it's indexed by: all the ones of length
+    # NGRAM_LENGTH, and the shorter ones too, so that short names can be
+    # looked up
+    grams = set()
+    for length in range(1, NGRAM_LENGTH + 1):
+        for i in range(len(name) - length + 1):
+            grams.add(name[i:i + length])
+    return grams
+
+class AnimalIndex(object):
+    '''\
+    Normalized field numbers, names and NMFS ids of a set of animals. Each
+    animal is described by a dictionary with 'id', 'row_num', 'field_number'
+    and 'name' keys; 'id' is None for animals that would be created by earlier
+    rows of the file being compared, and 'row_num' is None for existing ones.
+    '''
+
+    def __init__(self):
+        # exact field number -> animal
+        self.field_numbers = {}
+        # normalized field number -> [animal, ...]
+        self.by_field_number = {}
+        # [(lowercased name, animal), ...]
+        self.names = []
+        # n-gram -> [<index in self.names>, ...]; names match anywhere in
+        # another name, so the n-grams narrow down the names to check
+        self.names_by_gram = {}
+        # normalized NMFS id -> [animal, ...]
+        self.by_nmfs_id = {}
+
+    @classmethod
+    def load(cls):
+        '''\
+        Returns an AnimalIndex of all the existing animals, using two queries.
+        '''
+
+        index = cls()
+
+        nmfs_ids = {}
+        for animal_id, nmfs_id in Entanglement.objects.exclude(
+            nmfs_id= '',
+        ).values_list('animal', 'nmfs_id'):
+            nmfs_ids.setdefault(animal_id, []).append(nmfs_id)
+
+        for animal_id, field_number, name in Animal.objects.values_list('id', 'field_number', 'name'):
+            index.add(
+                {
+                    'id': animal_id,
+                    'row_num': None,
+                    'field_number': field_number,
+                    'name': name,
+                },
+                nmfs_ids.get(animal_id, ()),
+            )
+
+        return index
+
+    def add(self, animal, nmfs_ids=()):
+        field_number = animal['field_number']
+        if field_number:
+            self.field_numbers.setdefault(field_number, animal)
+            self.by_field_number.setdefault(normalize_key(field_number), []).append(animal)
+        if animal['name']:
+            name = animal['name'].lower()
+            for gram in _name_grams(name):
+                self.names_by_gram.setdefault(gram, []).append(len(self.names))
+            self.names.append((name, animal))
+        for nmfs_id in nmfs_ids:
+            if nmfs_id.strip():
+                self.by_nmfs_id.setdefault(normalize_key(nmfs_id), []).append(animal)
+
+    def conflict(self, field_number):
+        '''\
+        Returns the animal that already has the given field number, if any.
+        Field numbers aren't required to be unique (Animal.clean's check is
+        switched off), so this is only a warning.
+        '''
+
+        if not field_number:
+            return None
+        return self.field_numbers.get(field_number)
+
+    def matches(self, field_number, name, nmfs_ids):
+        '''\
+        Returns a list of the animals that might be the same as one with the
+        given identifiers, without duplicates. Those are the ones with the
+        same field number or NMFS id, or whose name contains the given name
+        (ignoring case).
+        '''
+
+        found = []
+        # the animals are dictionaries, so tell them apart by identity
+        seen = set()
+        def _add(animals):
+            for animal in animals:
+                if not id(animal) in seen:
+                    seen.add(id(animal))
+                    found.append(animal)
+
+        if field_number:
+            _add(self.by_field_number.get(normalize_key(field_number), ()))
+        name = normalize_key(name)
+        if name:
+            _add(self._name_matches(name))
+        for nmfs_id in nmfs_ids:
+            _add(self.by_nmfs_id.get(normalize_key(nmfs_id), ()))
+
+        return found
+
+    def _name_matches(self, name):
+        # any name containing 'name' contains all of its n-grams, so only the
+        # names with its rarest n-gram need to be checked
+        length = min(len(name), NGRAM_LENGTH)
+        candidates = None
+        for i in range(len(name) - length + 1):
+            with_gram = self.names_by_gram.get(name[i:i + length], ())
+            if candidates is None or len(with_gram) < len(candidates):
+                candidates = with_gram
+            if not candidates:
+                return []
+
+        return [
+            self.names[i][1] for i in candidates if name in self.names[i][0]
+        ]
+
+def row_nmfs_ids(row):
+    ids = []
+    for k in NMFS_ID_COLUMNS:
+        if k in row and row[k]:
+            ids.append(row[k])
+    return ids
+
+def diff_results(results, index=None):
+    '''\
+    Given an iterable of row results like those from strandings_parse.parse_csv,
+    yields a copy of each one with these keys added:
+
+        'status': 'new' or 'mergeable'
+        'matches': a list of animals (see AnimalIndex) that might be the same
+            animal as the row's
+        'conflict': the animal whose field number the row's animal would
+            duplicate, if any. Such rows are still imported, like any other
+            'mergeable' row, since the animal with that field number is one
+            of the matches.
+
+    Rows are compared to each other as well as to the animals in the index,
+    which defaults to one of all the existing animals. Nothing is saved.
+    '''
+
+    if index is None:
+        index = AnimalIndex.load()
+
+    for r in results:
+        a = r['data']['animal']
+        field_number = a.get('field_number', '')
+        name = a.get('name', '')
+        nmfs_ids = row_nmfs_ids(r['row'])
+
+        diffed = dict(r)
+        diffed['conflict'] = index.conflict(field_number)
+        diffed['matches'] = index.matches(field_number, name, nmfs_ids)
+        if diffed['matches']:
+            diffed['status'] = 'mergeable'
+        else:
+            diffed['status'] = 'new'
+
+        # later rows are compared to the animals earlier rows would create
+        index.add(
+            {
+                'id': None,
+                'row_num': r['row_num'],
+                'field_number': field_number,
+                'name': name,
+            },
+            nmfs_ids,
+        )
+
+        yield diffed
+
+def diff_summary(diffed_results):
+    '''\
+    Returns a dictionary of the number of rows with each status, and the
+    number with a 'conflict' under 'field_number_taken'.
+    '''
+
+    summary = {
+        'new': 0,
+        'mergeable': 0,
+        'field_number_taken': 0,
+    }
+    for r in diffed_results:
+        summary[r['status']] += 1
+        if r['conflict']:
+            summary['field_number_taken'] += 1
+    return summary
@@ -0,0 +1,128 @@
+'''\
+Running ImportJobs outside of a web request. See the run_import_jobs
+management command.
+'''
+
+import csv
+import datetime
+import traceback
+
+from . import CSVParseError
+
+from models import ImportJob
+
+import observations_parse
+import strandings_parse
+
+# a running job that hasn't been updated in this long is assumed to have been
+# abandoned by a worker that crashed
+STALE_AFTER = datetime.timedelta(minutes=15)
+
+def _count_rows(csv_file):
+    csv_file.seek(0)
+    count = 0
+    for row in csv.DictReader(csv_file, dialect='excel'):
+        count += 1
+    csv_file.seek(0)
+    return count
+
+def claim_next_job():
+    '''\
+    Marks the oldest waiting (or abandoned) ImportJob as running and returns it,
+    or returns None if there aren't any. Safe to call from several workers at
+    once; only one of them will get a given job.
+    '''
+
+    stale = datetime.datetime.now() - STALE_AFTER
+    candidates = list(ImportJob.objects.filter(status='waiting').order_by('datetime_created', 'id')[:1])
+    candidates += list(ImportJob.objects.filter(
+        status= 'running',
+        datetime_updated__lt= stale,
+    ).order_by('datetime_created', 'id')[:1])
+
+    for job in candidates:
+        # the status check makes this a compare-and-swap
+        claimed = ImportJob.objects.filter(
+            id= job.id,
+            status= job.status,
+            datetime_updated= job.datetime_updated,
+        ).update(
+            status= 'running',
+            datetime_started= datetime.datetime.now(),
+            datetime_updated= datetime.datetime.now(),
+            started_at_row_num= job.next_row_num,
+        )
+        if claimed:
+            return ImportJob.objects.get(id=job.id)
+
+    return None
+
+def _checkpoint(job):
+    def after_save(batch):
+        job.rows_saved += len(batch)
+        job.last_saved_row_num = batch[-1]['row_num']
+        job.save()
+    return after_save
+
+def _strandings_results(job, csv_file, processes):
+    for report in strandings_parse.parse_csv_chunks(
+        csv_file,
+        processes= processes,
+        skip_rows= job.next_row_num,
+    ):
+        if report['errors']:
+            raise CSVParseError(report['errors'])
+        job.rows_parsed = report['last_row_num'] + 1
+        for result in report['results']:
+            yield result
+
+def _observations_results(job, csv_file):
+    results = observations_parse.parse_csv(csv_file, job.original_observation)
+    job.rows_parsed = job.total_rows
+    for result in results:
+        if result['row_num'] >= job.next_row_num:
+            yield result
+
+def run_job(job, processes=None):
+    '''\
+    Imports the rows of a claimed job's file that haven't been saved yet. The
+    job's status is 'done' or 'failed' afterwards, unless the process is killed
+    partway through, in which case it can be resumed.
+    '''
+
+    csv_file = job.csv_file
+    csv_file.open('rb')
+    try:
+        try:
+            if job.total_rows is None:
+                job.total_rows = _count_rows(csv_file)
+            # rows before the checkpoint are skipped, not re-parsed
+            job.rows_parsed = job.next_row_num
+            job.save()
+
+            if job.import_type == 'strandings':
+                results = _strandings_results(job, csv_file, processes)
+                module = strandings_parse
+            elif job.import_type == 'observations':
+                results = _observations_results(job, csv_file)
+                module = observations_parse
+            else:
+                raise ValueError("unknown import type: %s" % job.import_type)
+
+            module.process_results(results, job.filename, job.user, after_save=_checkpoint(job))
+        except Exception:
+            error = traceback.format_exc()
+            # forget the counts from any batch that was rolled back
+            job = ImportJob.objects.get(id=job.id)
+            job.status = 'failed'
+            job.error = error
+        else:
+            job.rows_parsed = job.total_rows
+            job.status = 'done'
+    finally:
+        csv_file.close()
+
+    job.datetime_finished = datetime.datetime.now()
+    job.save()
+
+    return job
@@ -0,0 +1,67 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import (
+    CommandError,
+    NoArgsCommand,
+)
+
+from cetacean_incidents.apps.csv_import.jobs import (
+    claim_next_job,
+    run_job,
+)
+from cetacean_incidents.apps.csv_import.models import ImportJob
+
+class Command(NoArgsCommand):
+    help = 'Runs waiting CSV import jobs, resuming any that were interrupted.'
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--once',
+            action= 'store_true',
+            dest= 'once',
+            default= False,
+            help= 'Exit when there are no more waiting jobs instead of polling for new ones.',
+        ),
+        make_option('--poll',
+            type= 'int',
+            dest= 'poll',
+            default= 5,
+            help= 'How many seconds to wait between checks for new jobs.',
+        ),
+        make_option('--processes',
+            type= 'int',
+            dest= 'processes',
+            default= None,
+            help= 'How many processes to parse with. Defaults to the number of CPUs.',
+        ),
+        make_option('--retry',
+            type= 'int',
+            dest= 'retry',
+            default= None,
+            help= 'Mark the failed job with the given id as waiting, so it resumes where it left off.',
+        ),
+    )
+    
+    def handle_noargs(self, **options):
+        if options['retry'] is not None:
+            updated = ImportJob.objects.filter(
+                id= options['retry'],
+                status= 'failed',
+            ).update(status='waiting', error='')
+            if not updated:
+                raise CommandError("no failed import job with id %d" % options['retry'])
+        
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            
+            print "starting %s at row %d" % (job, job.next_row_num)
+            started = time.time()
+            job = run_job(job, processes=options['processes'])
+            print "%s after %.1f seconds" % (job, time.time() - started)
+            if job.status == 'failed':
+                print job.error
@@ -0,0 +1,181 @@
+import datetime
+import os
+from os import path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+from django.contrib.auth.models import User
+
+from cetacean_incidents.apps.delete_guard import guard_deletes
+
+from cetacean_incidents.apps.incidents.models import Observation
+
+_jobs_dir_name = 'csv_import_jobs'
+_jobs_dir = path.join(settings.MEDIA_ROOT, _jobs_dir_name)
+if not path.isdir(_jobs_dir):
+    os.mkdir(_jobs_dir)
+job_storage = FileSystemStorage(
+    location= _jobs_dir,
+    base_url= settings.MEDIA_URL + _jobs_dir_name + '/',
+)
+
+def _seconds(delta):
+    # timedelta.total_seconds is new in Python 2.7
+    return delta.days * 24 * 60 * 60 + delta.seconds + delta.microseconds / 1000000.0
+
+class ImportJob(models.Model):
+    '''\
+    An uploaded CSV file to be imported by the run_import_jobs management
+    command. Rows are saved in batches, and the job's counts are saved in the
+    same transaction as each batch, so an import that's interrupted can be
+    resumed after the last batch that was saved.
+    '''
+
+    IMPORT_TYPES = (
+        ('strandings', 'strandings'),
+        ('observations', 'observations'),
+    )
+
+    import_type = models.CharField(
+        max_length= 255,
+        choices= IMPORT_TYPES,
+    )
+
+    csv_file = models.FileField(
+        storage= job_storage,
+        upload_to= '%Y/%m%d/',
+    )
+
+    filename = models.CharField(
+        max_length= 255,
+        help_text= "the name of the file when it was uploaded",
+    )
+
+    user = models.ForeignKey(
+        User,
+        help_text= "who the imported entries will be tagged by",
+    )
+
+    original_observation = models.ForeignKey(
+        Observation,
+        blank= True,
+        null= True,
+        help_text= "for observations imports, the observation to copy entanglement data from",
+    )
+
+    STATUSES = (
+        ('waiting', 'waiting'),
+        ('running', 'running'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    )
+
+    status = models.CharField(
+        max_length= 255,
+        choices= STATUSES,
+        default= 'waiting',
+        db_index= True,
+    )
+
+    error = models.TextField(
+        blank= True,
+        help_text= "why the job failed, if it did",
+    )
+
+    total_rows = models.IntegerField(
+        blank= True,
+        null= True,
+        help_text= "the number of rows in the file, not counting the header. filled in when the job is first started.",
+    )
+
+    rows_parsed = models.IntegerField(
+        default= 0,
+    )
+
+    rows_saved = models.IntegerField(
+        default= 0,
+        help_text= "the number of rows that resulted in new entries",
+    )
+
+    last_saved_row_num = models.IntegerField(
+        blank= True,
+        null= True,
+        help_text= "the number of the last row in the last batch that was committed; the job resumes after it",
+    )
+
+    datetime_created = models.DateTimeField(
+        auto_now_add= True,
+    )
+
+    datetime_started = models.DateTimeField(
+        blank= True,
+        null= True,
+        help_text= "when the job was last started or resumed",
+    )
+
+    started_at_row_num = models.IntegerField(
+        default= 0,
+        help_text= "the first row handled since the job was last started or resumed",
+    )
+
+    datetime_updated = models.DateTimeField(
+        auto_now= True,
+    )
+
+    datetime_finished = models.DateTimeField(
+        blank= True,
+        null= True,
+    )
+
+    @property
+    def next_row_num(self):
+        if self.last_saved_row_num is None:
+            return 0
+        return self.last_saved_row_num + 1
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def progress(self):
+        '''\
+        Returns a dictionary describing how far along the job is, suitable for
+        serializing to JSON.
+        '''
+
+        rows_per_second = None
+        eta_seconds = None
+        if self.status == 'running' and self.datetime_started:
+            elapsed = _seconds(datetime.datetime.now() - self.datetime_started)
+            rows_done = self.next_row_num - self.started_at_row_num
+            if elapsed > 0 and rows_done > 0:
+                rows_per_second = rows_done / elapsed
+                if self.total_rows is not None:
+                    eta_seconds = max(0, self.total_rows - self.next_row_num) / rows_per_second
+
+        return {
+            'id': self.id,
+            'status': self.status,
+            'error': self.error,
+            'total_rows': self.total_rows,
+            'rows_parsed': self.rows_parsed,
+            'rows_saved': self.rows_saved,
+            'next_row_num': self.next_row_num,
+            'rows_per_second': rows_per_second,
+            'eta_seconds': eta_seconds,
+        }
+
+    @models.permalink
+    def get_absolute_url(self):
+        return ('import_job', [str(self.id)])
+
+    def __unicode__(self):
+        return u"%s import of %s (%s)" % (self.import_type, self.filename, self.status)
+
+    class Meta:
+        ordering = ('-datetime_created', '-id')
+
+guard_deletes(User, ImportJob, 'user')
+guard_deletes(Observation, ImportJob, 'original_observation')
@@ -6,8 +6,11 @@ import os
 import pytz
 
 from django import forms
+from django.db import transaction
 from django.utils.html import conditional_escape as esc
 
+from reversion import revision
+
 from cetacean_incidents.apps.contacts.models import Contact
 
 from cetacean_incidents.apps.entanglements.models import EntanglementObservation
@@ -315,13 +318,37 @@ def _save_row(r, filename, user):
         eo.clean()
         eo.save()
 
-def process_results(results, filename, user):
+@transaction.commit_on_success
+@revision.create_on_success
+def _save_batch(batch, filename, user, after_save=None):
+    revision.user = user
+    revision.comment = u"imported from %s" % filename
+    
+    for r in batch:
+        _save_row(r, filename, user)
+    
+    # called inside the transaction, so that whatever it records is committed
+    # if and only if the batch is
+    if after_save:
+        after_save(batch)
+
+# the number of rows saved in one transaction and revision
+BATCH_SIZE = 200
+
+def process_results(results, filename, user, batch_size=BATCH_SIZE, after_save=None):
     '''\
-    Create all the new models described in results in a single transaction and
-    a single revision.
+    Create all the new models described in results, batch_size rows at a
+    time. Each batch is saved in a single transaction and a single revision.
+    If given, after_save is called with each batch's list of row results just
+    before that batch's transaction is committed.
     '''
-    # process the results
+    
+    batch = []
     for r in results:
-        print r['row_num']
-        _save_row(r, filename, user)
+        batch.append(r)
+        if len(batch) >= batch_size:
+            _save_batch(batch, filename, user, after_save)
+            batch = []
+    if batch:
+        _save_batch(batch, filename, user, after_save)
 
@@ -1,3 +1,4 @@
+from collections import deque
 from copy import copy
 import csv
 import datetime
@@ -6,12 +7,20 @@ import os
 import pytz
 import re
 
-from django.db.models import Q
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None # for python 2.5 compat.
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.forms import ValidationError
 from django.utils.html import conditional_escape as esc
 
 from django.contrib.localflavor.us.us_states import STATES_NORMALIZED
 
+from reversion import revision
+
 from cetacean_incidents.apps.countries.models import Country
 
 from cetacean_incidents.apps.documents.models import (
@@ -26,7 +35,7 @@ from cetacean_incidents.apps.entanglements.models import (
 
 from cetacean_incidents.apps.locations.forms import NiceLocationForm
 from cetacean_incidents.apps.locations.models import Location
-from cetacean_incidents.apps.locations.utils import dms_to_dec
+from cetacean_incidents.apps.locations.utils import dms_to_dec_many
 
 from cetacean_incidents.apps.incidents.models import (
     Animal,
@@ -39,13 +48,22 @@ from cetacean_incidents.apps.shipstrikes.models import (
     ShipstrikeObservation,
 )
 
-from cetacean_incidents.apps.tags.models import Tag
-
 from cetacean_incidents.apps.taxons.models import Taxon
 
 from cetacean_incidents.apps.uncertain_datetimes import UncertainDateTime
 
-from . import CURRENT_IMPORT_TAG
+from . import CSVParseError
+
+from bulk import (
+    Throughput,
+    bulk_add_m2m,
+    bulk_tag,
+)
+
+from diff import (
+    AnimalIndex,
+    row_nmfs_ids,
+)
 
 FIELDNAMES = set((
 # ignorable
@@ -236,36 +254,99 @@ def get_ashore(row):
         "1": True,
     }[ashore]
 
-def translate_taxon(data, data_key, row):
-    data[data_key] = {
-        'BEWH': Taxon.objects.get(tsn=180506), # beaked whales
-        'BOWH': Taxon.objects.get(tsn=180533), # bowhead whale
-        'BRWH': Taxon.objects.get(tsn=612597), # bryde's whale
-        'FIWH': Taxon.objects.get(tsn=180527), # finback
-        'Fin': Taxon.objects.get(tsn=180527), # finback
-        'HUWH': Taxon.objects.get(tsn=180530), # humpback
-        'HUWH?': Taxon.objects.get(tsn=180530), # humpback
-        'Humpback': Taxon.objects.get(tsn=180530), # humpback
-        'MIWH': Taxon.objects.get(tsn=180524), # minke
-        'Minke': Taxon.objects.get(tsn=180524), # minke
-        'RIWH': Taxon.objects.get(tsn=180537), # right
-        'RIWH?': Taxon.objects.get(tsn=180537), # right
-        'Right': Taxon.objects.get(tsn=180537), # right
-        'SEWH': Taxon.objects.get(tsn=180526), # sei whale
-        'Sei': Taxon.objects.get(tsn=180526), # sei whale
-        'SPWH': Taxon.objects.get(tsn=180488), # sperm whale
-        'Sperm': Taxon.objects.get(tsn=180488), # sperm whale
-        'UNAN': None,                          # unknown animal
-        'Unk': None,
-        'UNBA': Taxon.objects.get(tsn=552298), # unknown baleen whale
-        'UNRW': Taxon.objects.get(tsn=552298), # unknown rorqual
-        'UNFS': Taxon.objects.get(tsn=180523), # finback or sei whale
-        'FI/SEWH': Taxon.objects.get(tsn=180523), # finback or sei whale
-        'FI-SEWH': Taxon.objects.get(tsn=180523), # finback or sei whale
-        'FIN/SEI': Taxon.objects.get(tsn=180523), # finback or sei whale
-        'Fin/sei': Taxon.objects.get(tsn=180523), # finback or sei whale
-        'UNWH': Taxon.objects.get(tsn=180403), # unknown whale
-    }[row['Common Name']]
+# keyed to the 'Common Name' column's values. None means an unknown animal.
+TAXON_TSNS = {
+    'BEWH': 180506, # beaked whales
+    'BOWH': 180533, # bowhead whale
+    'BRWH': 612597, # bryde's whale
+    'FIWH': 180527, # finback
+    'Fin': 180527, # finback
+    'HUWH': 180530, # humpback
+    'HUWH?': 180530, # humpback
+    'Humpback': 180530, # humpback
+    'MIWH': 180524, # minke
+    'Minke': 180524, # minke
+    'RIWH': 180537, # right
+    'RIWH?': 180537, # right
+    'Right': 180537, # right
+    'SEWH': 180526, # sei whale
+    'Sei': 180526, # sei whale
+    'SPWH': 180488, # sperm whale
+    'Sperm': 180488, # sperm whale
+    'UNAN': None,   # unknown animal
+    'Unk': None,
+    'UNBA': 552298, # unknown baleen whale
+    'UNRW': 552298, # unknown rorqual
+    'UNFS': 180523, # finback or sei whale
+    'FI/SEWH': 180523, # finback or sei whale
+    'FI-SEWH': 180523, # finback or sei whale
+    'FIN/SEI': 180523, # finback or sei whale
+    'Fin/sei': 180523, # finback or sei whale
+    'UNWH': 180403, # unknown whale
+}
+
+# keyed to the lowercased 'State/EZ' column's values
+COUNTRY_ISOS = {
+    'ber': 'BM',
+    'can': 'CA',
+    'cn':  'CA',
+    'dr':  'DO',
+}
+
+DOCUMENT_TYPE_NAMES = (
+    'Cetacean Data Record',
+    'Histological Findings',
+    'CCS web page',
+    'Human-Interaction Form',
+    'Large Whale email',
+    'Stranding Report (Level-A)',
+)
+
+def load_lookups():
+    '''\
+    Returns a dictionary with the database entries the parse_* functions
+    refer to. Passing the result to them lets them parse rows without touching
+    the database, e.g. in another process.
+    
+    {
+        'taxa': {<tsn>: <Taxon>, ...},
+        'countries': {<iso>: <Country>, ...},
+        'document_types': {<name>: <DocumentType>, ...},
+    }
+    
+    Missing entries aren't an error here; they raise DoesNotExist when a row
+    actually needs them.
+    '''
+    
+    tsns = filter(lambda tsn: not tsn is None, set(TAXON_TSNS.values()))
+    isos = set(COUNTRY_ISOS.values()) | set(('US',))
+    
+    return {
+        'taxa': dict(
+            (t.tsn, t) for t in Taxon.objects.filter(tsn__in=tsns)
+        ),
+        'countries': dict(
+            (c.iso, c) for c in Country.objects.filter(iso__in=isos)
+        ),
+        'document_types': dict(
+            (dt.name, dt) for dt in DocumentType.objects.filter(name__in=DOCUMENT_TYPE_NAMES)
+        ),
+    }
+
+def _lookup(lookups, table, key, model):
+    if not key in lookups[table]:
+        raise model.DoesNotExist("%s matching %r does not exist." % (
+            model._meta.object_name,
+            key,
+        ))
+    return lookups[table][key]
+
+def translate_taxon(data, data_key, row, lookups):
+    tsn = TAXON_TSNS[row['Common Name']]
+    if tsn is None:
+        data[data_key] = None
+    else:
+        data[data_key] = _lookup(lookups, 'taxa', tsn, Taxon)
 
     if row['Common Name'] in set(('UNWH', 'UNRW', 'FI/SEWH', 'RIWH?', 'UNFS')):
         odd_value(data, 'Common Name')
@@ -301,7 +382,7 @@ def unknown_values(data, column_names):
 def odd_value(data, column_name):
     note_error('odd_value', column_name, data['import_notes'])
 
-def parse_animal(row):
+def parse_animal(row, lookups):
     
     a = {
         'import_notes': {},
@@ -345,7 +426,7 @@ def parse_animal(row):
         '0': False,
         '1': True,
     }[row['Sp Ver?']]:
-        translate_taxon(a, 'determined_taxon', row)
+        translate_taxon(a, 'determined_taxon', row, lookups)
     # the value isn't understood
     if row['Sp Ver?'] not in set(('', '0', '1')):
         unknown_value(a, 'Sp Ver?')
@@ -638,7 +719,13 @@ def parse_case(row):
     
     return c
 
-def parse_location(row, observation_data):
+def parse_location(row, observation_data, lookups, pending_coordinates=None):
+    '''\
+    The coordinates are converted to decimal degrees by convert_coordinates.
+    If a list is given as 'pending_coordinates', that's left to the caller
+    (so that a whole chunk of rows can be converted at once) and this row's
+    coordinates are appended to it; otherwise they're converted here.
+    '''
 
     l = {}
     
@@ -656,20 +743,15 @@ def parse_location(row, observation_data):
         eez = None
         state = None
     elif state_input in (('ez',)):
-        country = Country.objects.get(iso='US')
+        country = _lookup(lookups, 'countries', 'US', Country)
         eez = True
         state = None
     elif state_input in (('ber', 'can', 'cn', 'dr',)):
-        country = Country.objects.get(iso={
-            'ber': 'BM',
-            'can': 'CA',
-            'cn':  'CA',
-            'dr':  'DO',
-        }[state_input])
+        country = _lookup(lookups, 'countries', COUNTRY_ISOS[state_input], Country)
         eez = None
         state = None
-    elif state_input in STATES_NORMALIZED.keys():
-        country = Country.objects.get(iso='US')
+    elif state_input in STATES_NORMALIZED:
+        country = _lookup(lookups, 'countries', 'US', Country)
         eez = False
         state = STATES_NORMALIZED[state_input]
     # one-off errors
@@ -736,30 +818,56 @@ def parse_location(row, observation_data):
     if 'LATITUDE' in row and row['LATITUDE']:
         try:
             lat = NiceLocationForm._clean_coordinate(row['LATITUDE'], is_lat=True)
-            lat = dms_to_dec(lat)
         except ValidationError:
             unknown_value(observation_data, 'LATITUDE')
     if 'LONGITUDE' in row and row['LONGITUDE']:
         try:
             lon = NiceLocationForm._clean_coordinate(row['LONGITUDE'], is_lat=False)
-            lon = dms_to_dec(lon)
-            # assume west
-            if lon > 0:
-                odd_value(observation_data, 'LONGITUDE')
-            lon = - abs(lon)
         except ValidationError:
             unknown_value(observation_data, 'LONGITUDE')
     if (lat is None) != (lon is None):
         unknown_values(observation_data, ('LATITUDE', 'LONGITUDE'))
-    if (not lat is None) and (not lon is None):
-        l['coordinates'] = "%s,%s" % (lat, lon)
+    
+    coordinates = (l, observation_data, lat, lon)
+    if pending_coordinates is None:
+        convert_coordinates([coordinates])
+    else:
+        pending_coordinates.append(coordinates)
     
     if 'Region' in row and row['Region']:
         unimportable_column(observation_data, 'Region')
     
     return l
 
-def parse_observation(row, case_data):
+def convert_coordinates(pending_coordinates):
+    '''\
+    Given a list of (<location data>, <observation data>, <latitude>,
+    <longitude>) tuples from parse_location, where the latitude and longitude
+    are (neg,deg,min,sec) tuples or None, converts all of them to decimal
+    degrees with one call to dms_to_dec_many and sets the locations'
+    coordinates.
+    '''
+
+    dmss = []
+    for l, observation_data, lat, lon in pending_coordinates:
+        for dms in (lat, lon):
+            if not dms is None:
+                dmss.append(dms)
+    decs = iter(dms_to_dec_many(dmss))
+
+    for l, observation_data, lat, lon in pending_coordinates:
+        if not lat is None:
+            lat = decs.next()
+        if not lon is None:
+            lon = decs.next()
+            # assume west
+            if lon > 0:
+                odd_value(observation_data, 'LONGITUDE')
+            lon = - abs(lon)
+        if (not lat is None) and (not lon is None):
+            l['coordinates'] = "%s,%s" % (lat, lon)
+
+def parse_observation(row, case_data, lookups):
     
     o = {
         'import_notes': {},
@@ -806,7 +914,7 @@ def parse_observation(row, case_data):
     o['datetime_reported'] = UncertainDateTime(uncertain_datetime.year)
     
     # taxon
-    translate_taxon(o, 'taxon', row)
+    translate_taxon(o, 'taxon', row, lookups)
 
     if row['Sp Ver?']:
         unimportable_column(o, 'Sp Ver?')
@@ -1272,7 +1380,7 @@ def parse_observation(row, case_data):
     
     return o
 
-def parse_documents(row, animal_data, case_data):
+def parse_documents(row, animal_data, case_data, lookups):
     
     docs = []
     
@@ -1292,7 +1400,7 @@ def parse_documents(row, animal_data, case_data):
                     # create a new document
                     d = {
                         'attach_to': attach_to,
-                        'document_type': DocumentType.objects.get(name=doctype_name),
+                        'document_type': _lookup(lookups, 'document_types', doctype_name, DocumentType),
                     }
                     docs.append(d)
                 elif row[doc_key] not in no_values:
@@ -1300,7 +1408,193 @@ def parse_documents(row, animal_data, case_data):
 
     return docs
 
-def parse_csv(csv_file):
+def _normalize_row(row):
+    '''\
+    Strips the row's cell values in-place and checks for unhandled fieldnames.
+    Returns True if the row is empty.
+    '''
+    
+    empty_row = True
+    for k in row.keys():
+        if row[k] is None:
+            row[k] = ''
+        row[k] = row[k].strip()
+        if row[k] != '':
+            empty_row = False
+            if k not in FIELDNAMES:
+                #raise UnrecognizedFieldError("%s:%s" % (k, row[k]))
+                print u"""Warning: unrecognized field "%s": "%s\"""" % (k, row[k])
+    return empty_row
+
+def parse_row(row_num, row, lookups=None, pending_coordinates=None):
+    '''\
+    Parses a single row from the CSV file. Returns None for rows that are to be
+    skipped. Doesn't touch the database if lookups (see load_lookups) is given;
+    when parsing more than one row, load them once and pass them in. See
+    parse_location for 'pending_coordinates'.
+    '''
+    
+    if _normalize_row(row):
+        return None
+    
+    if lookups is None:
+        lookups = load_lookups()
+    
+    # ignore beaked whales
+    if row['Common Name'] == 'BEWH':
+        return None
+    
+    new = {}
+    
+    a = parse_animal(row, lookups)
+    new['animal'] = a
+    
+    c = parse_case(row)
+    new['case'] = c
+    
+    o = parse_observation(row, c, lookups)
+    new['observation'] = o
+    l = parse_location(row, o, lookups, pending_coordinates)
+    new['location'] = l
+    
+    docs = parse_documents(row, a, c, lookups)
+    if docs:
+        new['documents'] = docs
+    
+    return {'row_num': row_num, 'row': row, 'data': new}
+
+# the number of rows handed to a parsing process at a time
+CHUNK_SIZE = 500
+
+def _chunk_rows(csv_file, chunk_size, skip_rows=0):
+    data = csv.DictReader(csv_file, dialect='excel')
+    
+    chunk = []
+    for i, row in enumerate(data):
+        if i < skip_rows:
+            continue
+        chunk.append((i, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _parse_chunk(chunk_num, rows, lookups):
+    report = {
+        'chunk_num': chunk_num,
+        'first_row_num': rows[0][0],
+        'last_row_num': rows[-1][0],
+        'results': [],
+        'skipped': 0,
+        # a list of (<row number>, <error message>) pairs
+        'errors': [],
+    }
+    
+    # the coordinates of the whole chunk are converted together
+    pending_coordinates = []
+    for row_num, row in rows:
+        # a row that fails partway through may have added its coordinates
+        row_coordinates = []
+        try:
+            result = parse_row(row_num, row, lookups, row_coordinates)
+        except (KeyError, ValueError, ObjectDoesNotExist), e:
+            report['errors'].append((row_num, u"%s: %s" % (e.__class__.__name__, e)))
+            continue
+        if result is None:
+            report['skipped'] += 1
+        else:
+            pending_coordinates.extend(row_coordinates)
+            report['results'].append(result)
+    convert_coordinates(pending_coordinates)
+    
+    return report
+
+# set in each parsing process by _init_worker, so that the lookups are only
+# pickled once per process instead of once per chunk
+_worker_lookups = None
+
+def _init_worker(lookups):
+    global _worker_lookups
+    _worker_lookups = lookups
+
+def _parse_chunk_in_worker(args):
+    chunk_num, rows = args
+    return _parse_chunk(chunk_num, rows, _worker_lookups)
+
+def parse_csv_chunks(csv_file, chunk_size=CHUNK_SIZE, processes=1, lookups=None, skip_rows=0):
+    '''\
+    Given a file-like object with CSV data, yield a report for each chunk of
+    chunk_size rows, in the same order as the rows in the file:
+    {
+        'chunk_num': <int>,
+        'first_row_num': <int>,
+        'last_row_num': <int>,
+        'results': [<row result>, ...],
+        'skipped': <number of empty or ignored rows>,
+        'errors': [(<row number>, <error message>), ...],
+    }
+    Where <row result> is an item like those returned by parse_csv. Rows that
+    can't be understood are listed in 'errors' instead of aborting the parse.
+    
+    By default the chunks are parsed in this process. With 'processes' more
+    than 1 (or None, for the number of CPUs) they're parsed by a pool of
+    processes instead; only a few chunks are handed out ahead of the one
+    that's next to be yielded, so the whole file isn't held in memory. Since
+    that forks the current process, only do it outside of web requests (e.g.
+    in the run_import_jobs command).
+    
+    The first skip_rows rows of the file are read but not parsed, for picking
+    up an import where it left off.
+    '''
+    
+    # the database is only hit here; the parsing processes just use the
+    # lookup tables
+    if lookups is None:
+        lookups = load_lookups()
+    
+    chunks = enumerate(_chunk_rows(csv_file, chunk_size, skip_rows))
+    
+    if processes is None:
+        if multiprocessing is None:
+            processes = 1
+        else:
+            processes = multiprocessing.cpu_count()
+    
+    if processes < 2:
+        for chunk_num, rows in chunks:
+            yield _parse_chunk(chunk_num, rows, lookups)
+        return
+    
+    pool = multiprocessing.Pool(processes, _init_worker, (lookups,))
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.apply_async(_parse_chunk_in_worker, (chunk,)))
+            # results are yielded in the order they were handed out
+            if len(pending) >= processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def iter_parse_csv(csv_file, **kwargs):
+    '''\
+    Like parse_csv, but yields each row's result as the chunk it's in is
+    parsed. Raises a CSVParseError when it gets to a chunk with rows that
+    couldn't be understood. Keyword arguments are passed on to
+    parse_csv_chunks.
+    '''
+    
+    for report in parse_csv_chunks(csv_file, **kwargs):
+        if report['errors']:
+            raise CSVParseError(report['errors'])
+        for result in report['results']:
+            yield result
+
+def parse_csv(csv_file, **kwargs):
     '''\
     Given a file-like object with CSV data, return a tuple with one item for
     each row. The items are a dictionary like so:
@@ -1311,52 +1605,10 @@ def parse_csv(csv_file):
     }
     Where <animal>, <case> etc. are dictionaries with model fieldnames as keys.
     
-    May also throw an exception if the CSV data isn't understood.
+    May also throw a CSVParseError if the CSV data isn't understood.
     '''
     
-    data = csv.DictReader(csv_file, dialect='excel')
-    
-    row_results = []
-    
-    for i, row in enumerate(data):
-        # normalize cell values and check for unhandled fieldnames
-        empty_row = True
-        for k in row.keys():
-            if row[k] is None:
-                row[k] = ''
-            row[k] = row[k].strip()
-            if row[k] != '':
-                empty_row = False
-                if k not in FIELDNAMES:
-                    #raise UnrecognizedFieldError("%s:%s" % (k, row[k]))
-                    print u"""Warning: unrecognized field "%s": "%s\"""" % (k, row[k])
-        if empty_row:
-            continue
-        
-        # ignore beaked whales
-        if row['Common Name'] == 'BEWH':
-            continue
-        
-        new = {}
-        
-        a = parse_animal(row)
-        new['animal'] = a
-        
-        c = parse_case(row)
-        new['case'] = c
-        
-        o = parse_observation(row, c)
-        new['observation'] = o
-        l = parse_location(row, o)
-        new['location'] = l
-        
-        docs = parse_documents(row, a, c)
-        if docs:
-            new['documents'] = docs
-        
-        row_results.append({'row_num': i, 'row': row, 'data': new})
-        
-    return tuple(row_results)
+    return tuple(iter_parse_csv(csv_file, **kwargs))
 
 def _process_import_notes(notes, row, filename):
     if 'TZ' in os.environ:
@@ -1449,32 +1701,44 @@ def _process_import_notes(notes, row, filename):
     
     return result
 
-def _make_tag(thing, user):
-    tag = Tag(entry=thing, user=user, tag_text=CURRENT_IMPORT_TAG)
-    tag.clean()
-    tag.save()
-
-def _save_row(r, filename, user):
+def _save_row(r, filename, user, index):
+    '''\
+    Saves the entries for one row result. 'index' is an AnimalIndex (see
+    diff.py) of the animals that might be duplicates; the new animal is added
+    to it. Returns a
+    dictionary of the new animal, cases and observations, and (observation,
+    case) pairs that still need to be linked.
+    '''
+    
     ### animal
     a = r['data']['animal']
 
     # check for existing animals
-    animal_query = Q()
-    if 'field_number' in a:
-        animal_query |= Q(field_number__iexact=a['field_number'])
-    if 'name' in a:
-        animal_query |= Q(name__icontains=a['name'])
-    if animal_query: # bool(Q()) is False
-        animal_matches = Animal.objects.filter(animal_query)
-        if animal_matches:
-            a['import_notes']['mergeable'] = animal_matches
+    nmfs_ids = row_nmfs_ids(r['row'])
+    animal_matches = index.matches(
+        a.get('field_number', ''),
+        a.get('name', ''),
+        nmfs_ids,
+    )
+    if animal_matches:
+        a['import_notes']['mergeable'] = Animal.objects.filter(
+            id__in= [m['id'] for m in animal_matches],
+        ).order_by('id')
 
     animal_kwargs = copy(a)
     animal_kwargs['import_notes'] = _process_import_notes(a['import_notes'], r['row'], filename)
     animal = Animal(**animal_kwargs)
     animal.clean()
     animal.save()
-    _make_tag(animal, user)
+    index.add(
+        {
+            'id': animal.id,
+            'row_num': r['row_num'],
+            'field_number': animal.field_number,
+            'name': animal.name,
+        },
+        nmfs_ids,
+    )
 
     ### case(s)
     c = r['data']['case']
@@ -1506,7 +1770,6 @@ def _save_row(r, filename, user):
     for case in cases:
         case.clean()
         case.save()
-        _make_tag(case, user)
 
     ### observations(s)
     l = r['data']['location']
@@ -1548,11 +1811,12 @@ def _save_row(r, filename, user):
     else:
         _make_observation(copy(o))
     
+    links = []
     for obs in observations:
         obs.clean()
         obs.save()
-        obs.cases = cases
-        _make_tag(obs, user)
+        for case in cases:
+            links.append((obs, case))
         if 'entanglement_observation' in o['observation_extensions']:
             eo_kwargs = copy(o['observation_extensions']['entanglement_observation'])
             eo_kwargs['observation_ptr'] = obs
@@ -1581,14 +1845,73 @@ def _save_row(r, filename, user):
                 d = Document(**kwargs)
                 d.clean()
                 d.save()
+    
+    return {
+        'animal': animal,
+        'cases': cases,
+        'observations': observations,
+        'links': links,
+    }
 
-def process_results(results, filename, user):
+@transaction.commit_on_success
+@revision.create_on_success
+def _save_batch(batch, filename, user, index, after_save=None):
+    revision.user = user
+    revision.comment = u"imported from %s" % filename
+    
+    # the name of every case would otherwise be recomputed several times for
+    # each observation and case saved
+    Case.defer_name_updates()
+    try:
+        saved = map(lambda r: _save_row(r, filename, user, index), batch)
+    finally:
+        Case.resume_name_updates()
+    
+    animals = [s['animal'] for s in saved]
+    cases = reduce(lambda so_far, s: so_far + s['cases'], saved, [])
+    observations = reduce(lambda so_far, s: so_far + s['observations'], saved, [])
+    
+    bulk_add_m2m(
+        Observation,
+        'cases',
+        reduce(lambda so_far, s: so_far + s['links'], saved, []),
+    )
+    Case.update_names_in_bulk(cases)
+    bulk_tag(animals + cases + observations, user)
+    
+    # called inside the transaction, so that whatever it records is committed
+    # if and only if the batch is
+    if after_save:
+        after_save(batch)
+
+# the number of rows saved in one transaction and revision
+BATCH_SIZE = 200
+
+def process_results(results, filename, user, batch_size=BATCH_SIZE, after_save=None):
     '''\
-    Create all the new models described in results in a single transaction and
-    a single revision.
+    Create all the new models described in results, batch_size rows at a
+    time. Each batch is saved in a single transaction and a single revision.
+    'results' can be any iterable of row results, e.g. one from
+    iter_parse_csv. If given, after_save is called with each batch's list of
+    row results just before that batch's transaction is committed. Returns a
+    Throughput instance.
+    
+    Possible duplicates are found with the same AnimalIndex a dry run (see
+    diff.diff_results) uses, loaded once for the whole import.
     '''
-    # process the results
+    
+    throughput = Throughput()
+    index = AnimalIndex.load()
+    
+    batch = []
     for r in results:
-        print r['row_num']
-        _save_row(r, filename, user)
-
+        batch.append(r)
+        if len(batch) >= batch_size:
+            _save_batch(batch, filename, user, index, after_save)
+            throughput.add(len(batch))
+            batch = []
+    if batch:
+        _save_batch(batch, filename, user, index, after_save)
+        throughput.add(len(batch))
+    
+    return throughput
@@ -6,5 +6,7 @@ urlpatterns = patterns('',
     (r'^observations$', views.import_observations_csv),
     (r'^strandings$', views.import_stranding_csv, {}, 'import_strandings'),
     (r'^review/$', views.review_imports, {}, 'review_imports'),
+    (r'^jobs/(?P<job_id>\d+)/$', views.import_job_detail, {}, 'import_job'),
+    (r'^jobs/(?P<job_id>\d+)/progress$', views.import_job_progress, {}, 'import_job_progress'),
 )
 
@@ -1,3 +1,8 @@
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
+
 from django.core.paginator import (
     EmptyPage,
     InvalidPage,
@@ -5,7 +10,9 @@ from django.core.paginator import (
 )
 from django.db import transaction
 from django.db.models import Q
+from django.http import HttpResponse
 from django.shortcuts import (
+    get_object_or_404,
     redirect,
     render_to_response,
 )
@@ -21,15 +28,32 @@ from cetacean_incidents.apps.documents.models import Documentable
 
 from cetacean_incidents.apps.incidents.models import Animal
 
-from . import IMPORT_TAGS
+from . import (
+    CSVParseError,
+    IMPORT_TAGS,
+)
+
+import diff
 
 from forms import ImportCSVForm
 
+from models import ImportJob
+
 import observations_parse
 from observations_parse import ImportObservationsCSVForm
 
 import strandings_parse
 
+def _queue_job(csv_file, user, **kwargs):
+    job = ImportJob(
+        filename= csv_file.name,
+        user= user,
+        **kwargs
+    )
+    job.csv_file.save(csv_file.name, csv_file, save=False)
+    job.save()
+    return job
+
 # TODO perms
 @login_required
 @transaction.commit_on_success
@@ -37,15 +61,28 @@ import strandings_parse
 def import_stranding_csv(request):
     
     results = None
+    summary = None
+    parse_errors = None
     if request.method == 'POST':
         form = ImportCSVForm(request.POST, request.FILES)
         if form.is_valid():
             
-            results = strandings_parse.parse_csv(form.cleaned_data['csv_file'])
-    
-            if not form.cleaned_data['test_run']:
-                strandings_parse.process_results(results, form.cleaned_data['csv_file'].name, request.user)
-                return redirect('home')
+            if form.cleaned_data['test_run']:
+                try:
+                    results = tuple(diff.diff_results(
+                        strandings_parse.iter_parse_csv(form.cleaned_data['csv_file'])
+                    ))
+                except CSVParseError, e:
+                    parse_errors = e.errors
+                else:
+                    summary = diff.diff_summary(results)
+            else:
+                # parsing and saving are left to the run_import_jobs command
+                return redirect(_queue_job(
+                    form.cleaned_data['csv_file'],
+                    request.user,
+                    import_type= 'strandings',
+                ))
             
     else:
         form = ImportCSVForm()
@@ -57,6 +94,8 @@ def import_stranding_csv(request):
             'form': form,
             'media': form.media,
             'results': results,
+            'summary': summary,
+            'parse_errors': parse_errors,
         },
         context_instance= RequestContext(request),
     )
@@ -68,11 +107,16 @@ def import_observations_csv(request):
         form = ImportObservationsCSVForm(request.POST, request.FILES)
         if form.is_valid():
             
-            results = observations_parse.parse_csv(form.cleaned_data['csv_file'], form.cleaned_data['original_observation'])
-    
-            if not form.cleaned_data['test_run']:
-                observations_parse.process_results(results, form.cleaned_data['csv_file'].name, request.user)
-                return redirect('home')
+            if form.cleaned_data['test_run']:
+                results = observations_parse.parse_csv(form.cleaned_data['csv_file'], form.cleaned_data['original_observation'])
+            else:
+                # parsing and saving are left to the run_import_jobs command
+                return redirect(_queue_job(
+                    form.cleaned_data['csv_file'],
+                    request.user,
+                    import_type= 'observations',
+                    original_observation= form.cleaned_data['original_observation'],
+                ))
             
     else:
         form = ImportObservationsCSVForm()
@@ -88,6 +132,30 @@ def import_observations_csv(request):
         context_instance= RequestContext(request),
     )
     
+@login_required
+def import_job_detail(request, job_id):
+    
+    job = get_object_or_404(ImportJob, id=job_id)
+    
+    return render_to_response(
+        'csv_import/job.html',
+        {
+            'job': job,
+            'progress': job.progress(),
+        },
+        context_instance= RequestContext(request),
+    )
+
+@login_required
+def import_job_progress(request, job_id):
+    
+    job = get_object_or_404(ImportJob, id=job_id)
+    
+    return HttpResponse(
+        json.dumps(job.progress()),
+        mimetype= 'application/json',
+    )
+
 def review_imports(request):
     
     tagged = Documentable.objects.filter(tag__tag_text__in=IMPORT_TAGS).values_list('id', flat=True)
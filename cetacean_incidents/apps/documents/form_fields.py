@@ -7,7 +7,7 @@ from django.forms.fields import ChoiceField
 class DirectoryPathField(ChoiceField):
     def __init__(self, path, match=None, recursive=False, required=True,
                  widget=None, label=None, initial=None, help_text=None,
-                 *args, **kwargs):
+                 indexed_dirs=None, *args, **kwargs):
         self.path, self.match, self.recursive = path, match, recursive
         super(DirectoryPathField, self).__init__(choices=(), required=required,
             widget=widget, label=label, initial=initial, help_text=help_text,
@@ -21,7 +21,17 @@ class DirectoryPathField(ChoiceField):
         if self.match is not None:
             self.match_re = re.compile(self.match)
 
-        if recursive:
+        # indexed_dirs returns the choices from an index of the directory, or
+        # None if it can't, in which case the directory is listed instead
+        indexed = None
+        if indexed_dirs is not None:
+            indexed = indexed_dirs(path, recursive)
+        
+        if indexed is not None:
+            for d, name in indexed:
+                if self.match is None or self.match_re.search(name.split('/')[-1]):
+                    self.choices.append((d, name))
+        elif recursive:
             for root, dirs, files in os.walk(self.path):
                 for d in dirs:
                     if self.match is None or self.match_re.search(d):
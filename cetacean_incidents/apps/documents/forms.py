@@ -1,7 +1,10 @@
+from django.core.urlresolvers import reverse
 from django import forms
 
 from django.contrib.auth.models import User
 
+from cetacean_incidents.apps.jquery_ui.widgets import Autocomplete
+
 from cetacean_incidents.apps.merge_form.forms import MergeForm
 
 from models import (
@@ -59,6 +62,23 @@ class UploadedFileForm(DocumentForm):
 
 class RepositoryFileForm(DocumentForm):
     
+    def __init__(self, *args, **kwargs):
+        super(RepositoryFileForm, self).__init__(*args, **kwargs)
+        
+        # suggest paths from the repository index as they're typed
+        self.fields['repo_path'].widget = Autocomplete(
+            attrs= {'size': 80},
+            source= '''function(request, response) {
+                $.getJSON("%s", {
+                    'repo': $("#%s").val(),
+                    'term': request.term
+                }, response);
+            }''' % (reverse('repository_path_search'), self['repo'].auto_id),
+            options= {
+                'minLength': 0,
+            },
+        )
+    
     class Meta(DocumentForm.Meta):
         model = RepositoryFile
 
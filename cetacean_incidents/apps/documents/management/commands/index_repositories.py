@@ -0,0 +1,62 @@
+from optparse import make_option
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from cetacean_incidents.apps.documents.repo_index import (
+    repositories,
+    update_all,
+    update_repository,
+    watch,
+)
+
+class Command(BaseCommand):
+    args = '[<repository name> ...]'
+    help = 'Updates the index of the files in the document repositories. Updates all of them if none are given.'
+    
+    option_list = BaseCommand.option_list + (
+        make_option('--watch',
+            action= 'store_true',
+            dest= 'watch',
+            default= False,
+            help= 'Keep the index up-to-date as files change, until interrupted.',
+        ),
+        make_option('--poll',
+            type= 'int',
+            dest= 'poll',
+            default= 60,
+            help= 'With --watch, how many seconds to wait between rescans if inotify isn\'t available.',
+        ),
+        make_option('--no-hash',
+            action= 'store_false',
+            dest= 'hash_contents',
+            default= True,
+            help= 'Don\'t compute hashes of the files\' contents.',
+        ),
+    )
+    
+    def handle(self, *repo_names, **options):
+        if options['watch']:
+            if repo_names:
+                raise CommandError("--watch always watches all the repositories")
+            watch(options['poll'], options['hash_contents'])
+            return
+        
+        if repo_names:
+            results = {}
+            for repo in repo_names:
+                if not repo in repositories():
+                    raise CommandError("no such repository: %s" % repo)
+                results[repo] = update_repository(repo, options['hash_contents'])
+        else:
+            results = update_all(options['hash_contents'])
+        
+        for repo in sorted(results.keys()):
+            print "%s: %d added, %d changed, %d removed" % (
+                repo,
+                results[repo]['added'],
+                results[repo]['changed'],
+                results[repo]['removed'],
+            )
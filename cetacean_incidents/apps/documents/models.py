@@ -16,13 +16,20 @@ from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import (
+    register_dependents,
+    register_global,
+)
 
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
 from cetacean_incidents.apps.generic_templates.templatetags import html_filter
 
 from form_fields import DirectoryPathField as DirectoryPathFormField
-from utils import rand_string
+from utils import (
+    is_image,
+    rand_string,
+)
 
 def _checkdir(p):
     if not path.isdir(p):
@@ -141,6 +148,33 @@ models.signals.post_save.connect(
     dispatch_uid= 'cache_clear__documentable_html__documentable__post_save',
 )
 
+class DocumentQuerySet(models.query.QuerySet):
+    
+    def visible_to(self, user):
+        '''\
+        Returns the documents in this queryset that the given user can see:
+        all of them for superusers, otherwise the ones that aren't restricted
+        to particular users or are restricted to users including this one.
+        Filters in the database, with one join.
+        '''
+        
+        if user.is_superuser:
+            return self
+        
+        # a document matches at most once: either via its row for the user,
+        # or via the empty row of the outer join when it isn't restricted
+        q = models.Q(visible_to__pk=user.pk)
+        q |= models.Q(visible_to__pk__isnull=True)
+        return self.filter(q)
+
+class DocumentManager(models.Manager):
+    
+    def get_query_set(self):
+        return DocumentQuerySet(self.model, using=self._db)
+    
+    def visible_to(self, user):
+        return self.get_query_set().visible_to(user)
+
 class Document(Specificable):
     
     document_type = models.ForeignKey(
@@ -166,13 +200,35 @@ class Document(Specificable):
         help_text= 'Note that selecting no users implies that this document is visible to all users.',
     )
     
+    objects = DocumentManager()
+    
+    @property
+    def restricted_to(self):
+        '''\
+        A list of the users this document is restricted to; empty if anyone can
+        see it. load_documents fetches these for many documents at once.
+        '''
+        
+        if not hasattr(self, '_restricted_to'):
+            self._restricted_to = list(self.visible_to.all())
+        return self._restricted_to
+    
     def can_be_seen_by(self, user):
-        if not self.visible_to.exists():
-            return True
         if user.is_superuser:
             return True
-        else:
-            return user in self.visible_to.all()
+        
+        # request.user is the same instance for the whole request, so caching
+        # the answers on it caches them per-request
+        if not hasattr(user, '_document_visibility'):
+            user._document_visibility = {}
+        if self.pk in user._document_visibility:
+            return user._document_visibility[self.pk]
+        
+        restricted_to = self.restricted_to
+        visible = not restricted_to or user.pk in [u.pk for u in restricted_to]
+        if self.pk is not None:
+            user._document_visibility[self.pk] = visible
+        return visible
     
     @property
     def url(self):
@@ -182,6 +238,12 @@ class Document(Specificable):
     def path(self):
         return None
     
+    @property
+    def is_image(self):
+        if self.path is None:
+            return False
+        return is_image(self.path)
+    
     @models.permalink
     def get_absolute_url(self):
         return ('view_document', (self.id,))
@@ -194,9 +256,50 @@ class Document(Specificable):
     class Meta:
         ordering = ('document_type', 'id')
 
+def load_documents(docs):
+    '''\
+    Returns a list of the given documents as instances of their most-specific
+    classes, with restricted_to already fetched, using one query per subclass
+    of Document plus one for the users they're restricted to.
+    '''
+    
+    docs = list(docs)
+    ids = [d.pk for d in docs]
+    if not ids:
+        return docs
+    
+    specific = {}
+    for subclass in Document.__subclasses__():
+        for d in subclass.objects.filter(pk__in=ids):
+            specific[d.pk] = d
+    
+    field = Document._meta.get_field('visible_to')
+    doc_name = field.m2m_field_name()
+    user_name = field.m2m_reverse_field_name()
+    restricted_to = {}
+    for row in field.rel.through._default_manager.filter(**{
+        doc_name + '__in': ids,
+    }).select_related(user_name):
+        restricted_to.setdefault(getattr(row, doc_name + '_id'), []).append(getattr(row, user_name))
+    
+    result = []
+    for d in docs:
+        d = specific.get(d.pk, d)
+        d._restricted_to = restricted_to.get(d.pk, [])
+        result.append(d)
+    return result
+
 guard_deletes(DocumentType, Document, 'document_type')
 guard_deletes(Documentable, Document, 'attached_to')
 
+register_global(DocumentType)
+def _document_dependents(d):
+    # documents needn't be attached to anything
+    if d.attached_to_id is None:
+        return []
+    return [d.attached_to.specific_instance()]
+register_dependents(Document, _document_dependents)
+
 _uploads_dir_name = 'uploads'
 _uploads_dir = path.join(_storage_dir, _uploads_dir_name)
 _checkdir(_uploads_dir)
@@ -290,6 +393,27 @@ def _repo_storage_factory(repo):
         base_url= _repos_url + repo + '/',
     )
 
+def _indexed_dirs(dir_path, recursive):
+    # the choices for a DirectoryPathFormField, from the IndexedFile table. 
+    # Returns None if the directory isn't indexed.
+    if path.realpath(dir_path) != path.realpath(_repos_dir):
+        return None
+    
+    repos = IndexedFile.objects.values_list('repo', flat=True).distinct()
+    if not repos:
+        return None
+    choices = [(path.join(dir_path, r), r) for r in sorted(repos)]
+    
+    if recursive:
+        for repo, parent, name in IndexedFile.objects.filter(
+            is_dir= True,
+        ).values_list('repo', 'parent', 'name'):
+            d = u'/'.join(filter(None, (repo, parent, name)))
+            choices.append((path.join(dir_path, *d.split(u'/')), d))
+        choices.sort(key=lambda c: c[1])
+    
+    return choices
+
 # based on FilePathField
 class DirectoryPathField(models.FilePathField):
     description = "Directory path"
@@ -300,6 +424,7 @@ class DirectoryPathField(models.FilePathField):
             'match': self.match,
             'recursive': self.recursive,
             'form_class': DirectoryPathFormField,
+            'indexed_dirs': _indexed_dirs,
         }
         defaults.update(kwargs)
         return super(DirectoryPathField, self).formfield(**defaults)
@@ -356,3 +481,53 @@ class RepositoryFile(Document):
     class Meta:
         ordering = ('document_type', 'repo', 'repo_path')
 
+class IndexedFile(models.Model):
+    '''\
+    A file or directory in one of the repositories, as of the last time it was
+    indexed. Kept up-to-date by the index_repositories management command; see
+    repo_index.
+    '''
+    
+    repo = models.CharField(
+        max_length= 255,
+        db_index= True,
+        help_text= "the name of the repository",
+    )
+    
+    parent = models.CharField(
+        max_length= 1000,
+        db_index= True,
+        blank= True,
+        help_text= "the path of the directory it's in, relative to the repository and separated by slashes",
+    )
+    
+    name = models.CharField(
+        max_length= 255,
+    )
+    
+    is_dir = models.BooleanField(
+        default= False,
+    )
+    
+    size = models.BigIntegerField()
+    
+    mtime = models.FloatField()
+    
+    content_hash = models.CharField(
+        max_length= 40,
+        blank= True,
+        help_text= "the SHA-1 of the file's contents. blank for directories.",
+    )
+    
+    @property
+    def repo_path(self):
+        if self.parent:
+            return self.parent + u'/' + self.name
+        return self.name
+    
+    def __unicode__(self):
+        return u'%s: %s' % (self.repo, self.repo_path)
+    
+    class Meta:
+        ordering = ('repo', 'parent', 'name')
+
@@ -0,0 +1,266 @@
+'''\
+Keeping the IndexedFile table in step with the files in the repositories, so
+that document forms can look up repository paths without listing directories.
+
+update_repository rescans a repository, comparing each file's size and mtime
+to the index and only hashing the ones that changed. watch keeps the index
+up-to-date as files change, using inotify if pyinotify is installed and
+periodic rescans otherwise.
+'''
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+import os
+from os import path
+import stat as stat_module
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+from django.db import transaction
+
+from models import (
+    IndexedFile,
+    _repos_dir,
+)
+
+# how many paths a prefix search returns at most
+SEARCH_LIMIT = 50
+
+# how many ids to delete with each query, since some databases limit the
+# number of items in an IN clause
+DELETE_CHUNK_SIZE = 500
+
+def _hash_file(filepath):
+    h = sha1()
+    f = open(filepath, 'rb')
+    try:
+        while True:
+            data = f.read(64 * 1024)
+            if not data:
+                break
+            h.update(data)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+def _split_repo_path(repo_path):
+    # returns (<parent>, <name>)
+    repo_path = repo_path.strip('/')
+    if '/' in repo_path:
+        parent, name = repo_path.rsplit('/', 1)
+        return parent, name
+    return u'', repo_path
+
+def repositories():
+    '''\
+    Returns the names of the repository directories.
+    '''
+
+    return sorted([
+        d for d in os.listdir(_repos_dir)
+        if path.isdir(path.join(_repos_dir, d))
+    ])
+
+def _set_stat(entry, filepath, st, hash_contents):
+    # updates the given IndexedFile from the stat result; returns True if
+    # anything changed
+    is_dir = stat_module.S_ISDIR(st.st_mode)
+    if (
+        entry.id is not None
+        and entry.is_dir == is_dir
+        and entry.size == st.st_size
+        and entry.mtime == st.st_mtime
+    ):
+        return False
+
+    entry.is_dir = is_dir
+    entry.size = st.st_size
+    entry.mtime = st.st_mtime
+    entry.content_hash = u''
+    if hash_contents and not is_dir:
+        try:
+            entry.content_hash = _hash_file(filepath)
+        except IOError:
+            pass
+    return True
+
+def _delete_ids(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        IndexedFile.objects.filter(id__in=ids[i:i + DELETE_CHUNK_SIZE]).delete()
+
+def update_repository(repo, hash_contents=True):
+    '''\
+    Brings the index of the given repository up-to-date with one walk of its
+    directory tree. Only new and changed files are hashed. Returns a
+    dictionary with the number of entries 'added', 'changed', and 'removed'.
+    '''
+
+    root = path.join(_repos_dir, repo)
+    counts = {
+        'added': 0,
+        'changed': 0,
+        'removed': 0,
+    }
+
+    # everything already indexed for this repository, in one query
+    existing = {}
+    for entry in IndexedFile.objects.filter(repo=repo):
+        existing[(entry.parent, entry.name)] = entry
+
+    seen = set()
+    if path.isdir(root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            parent = path.relpath(dirpath, root)
+            if parent == os.curdir:
+                parent = u''
+            parent = parent.replace(os.sep, u'/')
+
+            for name in dirnames + filenames:
+                filepath = path.join(dirpath, name)
+                try:
+                    st = os.stat(filepath)
+                except OSError:
+                    # removed since it was listed
+                    continue
+
+                key = (parent, name)
+                seen.add(key)
+                entry = existing.get(key)
+                if entry is None:
+                    entry = IndexedFile(repo=repo, parent=parent, name=name)
+                    _set_stat(entry, filepath, st, hash_contents)
+                    entry.save()
+                    counts['added'] += 1
+                elif _set_stat(entry, filepath, st, hash_contents):
+                    entry.save()
+                    counts['changed'] += 1
+
+    removed = [entry.id for key, entry in existing.items() if not key in seen]
+    _delete_ids(removed)
+    counts['removed'] = len(removed)
+
+    return counts
+update_repository = transaction.commit_on_success(update_repository)
+
+def update_all(hash_contents=True):
+    '''\
+    Runs update_repository on every repository, and removes the entries of
+    repositories that no longer exist. Returns a dictionary of repository
+    names to their counts.
+    '''
+
+    repos = repositories()
+    results = {}
+    for repo in repos:
+        results[repo] = update_repository(repo, hash_contents)
+    IndexedFile.objects.exclude(repo__in=repos).delete()
+    return results
+
+def update_path(repo, repo_path, hash_contents=True):
+    '''\
+    Brings the index entry for one path in a repository up-to-date, for when
+    it's known to have changed. If it's a directory that was removed, its
+    contents' entries are removed as well.
+    '''
+
+    parent, name = _split_repo_path(repo_path)
+    if not name:
+        return update_repository(repo, hash_contents)
+
+    filepath = path.join(_repos_dir, repo, *repo_path.strip('/').split('/'))
+    entries = list(IndexedFile.objects.filter(repo=repo, parent=parent, name=name))
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        st = None
+
+    if st is None:
+        _delete_ids([e.id for e in entries])
+        prefix = repo_path.strip('/')
+        IndexedFile.objects.filter(repo=repo, parent=prefix).delete()
+        IndexedFile.objects.filter(repo=repo, parent__startswith=prefix + u'/').delete()
+        return
+
+    if entries:
+        entry = entries[0]
+        # there shouldn't be duplicates, but clean them up if there are
+        _delete_ids([e.id for e in entries[1:]])
+    else:
+        entry = IndexedFile(repo=repo, parent=parent, name=name)
+    if _set_stat(entry, filepath, st, hash_contents):
+        entry.save()
+
+    # a directory that was moved in brings its contents with it
+    if entry.is_dir and not entries:
+        for dirpath, dirnames, filenames in os.walk(filepath):
+            sub_parent = path.relpath(dirpath, path.join(_repos_dir, repo)).replace(os.sep, u'/')
+            for sub_name in dirnames + filenames:
+                update_path(repo, sub_parent + u'/' + sub_name, hash_contents)
+update_path = transaction.commit_on_success(update_path)
+
+def search(repo, prefix, limit=SEARCH_LIMIT):
+    '''\
+    Returns the IndexedFiles in the given repository whose paths start with
+    the given prefix, without descending into subdirectories. Directories are
+    listed first.
+    '''
+
+    parent, name = _split_repo_path(prefix)
+    if prefix.endswith('/'):
+        parent, name = prefix.strip('/'), u''
+    return IndexedFile.objects.filter(
+        repo= repo,
+        parent= parent,
+        name__startswith= name,
+    ).order_by('-is_dir', 'name')[:limit]
+
+def _path_changed(filepath, hash_contents):
+    relpath = path.relpath(filepath, _repos_dir)
+    parts = relpath.split(os.sep)
+    if parts[0] in (os.curdir, os.pardir):
+        return
+    repo = parts[0]
+    if len(parts) == 1:
+        if path.isdir(filepath):
+            update_repository(repo, hash_contents)
+        else:
+            IndexedFile.objects.filter(repo=repo).delete()
+        return
+    update_path(repo, u'/'.join(parts[1:]), hash_contents)
+
+def watch(poll_interval=60, hash_contents=True):
+    '''\
+    Keeps the index up-to-date until interrupted. Uses inotify if pyinotify
+    is installed, otherwise rescans every poll_interval seconds.
+    '''
+
+    update_all(hash_contents)
+
+    if pyinotify is None:
+        while True:
+            time.sleep(poll_interval)
+            update_all(hash_contents)
+
+    class _Handler(pyinotify.ProcessEvent):
+        def process_default(self, event):
+            _path_changed(event.pathname, hash_contents)
+
+    wm = pyinotify.WatchManager()
+    mask = (
+        pyinotify.IN_CREATE
+        | pyinotify.IN_DELETE
+        | pyinotify.IN_CLOSE_WRITE
+        | pyinotify.IN_MOVED_FROM
+        | pyinotify.IN_MOVED_TO
+        | pyinotify.IN_ATTRIB
+    )
+    notifier = pyinotify.Notifier(wm, _Handler())
+    wm.add_watch(_repos_dir, mask, rec=True, auto_add=True)
+    notifier.loop()
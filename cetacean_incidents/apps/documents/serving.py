@@ -0,0 +1,219 @@
+'''\
+Serving the files of UploadedFiles and RepositoryFiles. Responses support
+conditional and Range requests, and can be handed off to the web server with
+X-Sendfile or X-Accel-Redirect (see DOCUMENT_SENDFILE in
+local_settings.py-example). Image files can also be served as thumbnails,
+which are made the first time they're asked for and kept on disk.
+'''
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+import mimetypes
+import os
+from os import path
+import re
+
+try:
+    from PIL import Image
+except ImportError:
+    try:
+        import Image
+    except ImportError:
+        Image = None
+
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+)
+from django.utils.http import http_date
+
+from models import (
+    _checkdir,
+    _storage_dir,
+)
+from utils import is_image
+
+# how much of a file to read at a time when streaming it
+BLOCK_SIZE = 64 * 1024
+
+# the largest width and height of thumbnails
+THUMBNAIL_SIZE = (200, 200)
+
+_thumbnails_dir = path.join(_storage_dir, 'thumbnails')
+_checkdir(_thumbnails_dir)
+
+def file_etag(stat):
+    '''\
+    Returns an ETag for a file, given the result of os.stat on it.
+    '''
+
+    return '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def parse_range(header, size):
+    '''\
+    Given the value of a Range header and the size of the file, returns a
+    (<first byte>, <last byte>) tuple for a satisfiable single range, None if
+    the header should be ignored (it's malformed or has several ranges), or
+    False if the range can't be satisfied.
+    '''
+
+    m = _range_re.match(header.strip())
+    if not m:
+        return None
+    first, last = m.groups()
+    if first == '' and last == '':
+        return None
+
+    if first == '':
+        # a suffix range: the last 'last' bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return (max(0, size - length), size - 1)
+
+    first = int(first)
+    if last == '':
+        last = size - 1
+    else:
+        last = min(int(last), size - 1)
+    if first > last:
+        if first >= size:
+            return False
+        return None
+    return (first, last)
+
+def _file_iter(filepath, start, length):
+    f = open(filepath, 'rb')
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+def _not_modified(request, etag, mtime):
+    if 'HTTP_IF_NONE_MATCH' in request.META:
+        etags = [e.strip() for e in request.META['HTTP_IF_NONE_MATCH'].split(',')]
+        return etag in etags or '*' in etags
+    if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+        return request.META['HTTP_IF_MODIFIED_SINCE'] == http_date(mtime)
+    return False
+
+def _offload_response(filepath):
+    # returns a response that tells the web server to send the file, or None
+    # if that isn't configured
+    method = getattr(settings, 'DOCUMENT_SENDFILE', None)
+    if method == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = filepath.encode('utf-8')
+        return response
+    if method == 'x-accel-redirect':
+        # nginx maps the DOCUMENT_ACCEL_PREFIX location to the documents
+        # directory
+        relpath = path.relpath(filepath, _storage_dir)
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = (settings.DOCUMENT_ACCEL_PREFIX + relpath).encode('utf-8')
+        return response
+    return None
+
+def serve_file(request, filepath, content_type=None, filename=None):
+    '''\
+    Returns a response with the contents of the file at the given path.
+    '''
+
+    stat = os.stat(filepath)
+    etag = file_etag(stat)
+    mtime = int(stat.st_mtime)
+
+    if _not_modified(request, etag, mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if content_type is None:
+        content_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
+
+    response = _offload_response(filepath)
+    if response is not None:
+        # the web server handles Range requests itself
+        response['Content-Type'] = content_type
+    else:
+        size = stat.st_size
+        byte_range = None
+        if 'HTTP_RANGE' in request.META:
+            # only honor the range if the client's copy is still current
+            if request.META.get('HTTP_IF_RANGE', etag) in (etag, http_date(mtime)):
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+        if byte_range:
+            first, last = byte_range
+            length = last - first + 1
+            response = HttpResponse(
+                _file_iter(filepath, first, length),
+                status= 206,
+                content_type= content_type,
+            )
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+        else:
+            length = size
+            response = HttpResponse(
+                _file_iter(filepath, 0, length),
+                content_type= content_type,
+            )
+        response['Content-Length'] = str(length)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    if filename:
+        response['Content-Disposition'] = 'inline; filename="%s"' % filename.replace('"', '').encode('utf-8')
+    return response
+
+def thumbnail(filepath):
+    '''\
+    Returns the path to a thumbnail of the image at the given path, making it
+    if it hasn't been made since the image last changed. Returns None if
+    thumbnails can't be made (PIL isn't installed, or the file isn't an image
+    PIL understands).
+    '''
+
+    if Image is None or not is_image(filepath):
+        return None
+
+    stat = os.stat(filepath)
+    key = u'%s|%d|%d|%dx%d' % ((filepath, int(stat.st_mtime), stat.st_size) + THUMBNAIL_SIZE)
+    name = sha1(key.encode('utf-8')).hexdigest()
+    thumb_dir = path.join(_thumbnails_dir, name[:2])
+    thumb_path = path.join(thumb_dir, name + '.jpg')
+
+    if not path.exists(thumb_path):
+        _checkdir(thumb_dir)
+        try:
+            img = Image.open(filepath)
+            img.thumbnail(THUMBNAIL_SIZE, Image.ANTIALIAS)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            # write to a temporary name first, so other requests never see a
+            # partial thumbnail
+            tmp_path = thumb_path + '.%d.tmp' % os.getpid()
+            img.save(tmp_path, 'JPEG')
+            os.rename(tmp_path, thumb_path)
+        except IOError:
+            return None
+
+    return thumb_path
@@ -1,16 +1,20 @@
-from django.db.models import Q
 from django import template
 
+from cetacean_incidents.apps.documents.models import (
+    DocumentQuerySet,
+    load_documents,
+)
+
 register = template.Library()
 
 @register.filter
 def visible_to(docs, user):
-    if user.is_superuser:
-        return docs
-    
-    # value should be a queryset of Documents
-    q = Q(visible_to__pk=user.pk)
-    q |= Q(visible_to__pk__isnull=True)
-    
-    return docs.filter(q)
-    
+    '''\
+    Given a queryset of Documents, returns a list of the ones the user can see,
+    as instances of their most-specific classes. See load_documents.
+    '''
+
+    # also handles querysets of Document's subclasses
+    docs = docs._clone(klass=DocumentQuerySet)
+    return load_documents(docs.visible_to(user))
+
@@ -13,9 +13,13 @@ from models import upload_storage as fs
 from models import _repos_dir
 from models import _repos_url
 from models import Document
+from models import IndexedFile
+from models import load_documents
 from models import DocumentType
 from models import RepositoryFile
 from models import UploadedFile
+import repo_index
+from serving import parse_range
 from utils import rand_string
 
 class UploadTestCase(TestCase):
@@ -41,6 +45,48 @@ class DocumentTestCase(TestCase):
         
         self.assertEqual(a.specific_instance(), a)
 
+class DocumentVisibilityTestCase(TestCase):
+    
+    def setUp(self):
+        self.viewer = User.objects.create(username='viewer')
+        self.other = User.objects.create(username='other')
+        self.superuser = User.objects.create(username='super', is_superuser=True)
+        
+        self.public = Document.objects.create()
+        self.restricted = Document.objects.create()
+        self.restricted.visible_to.add(self.viewer, self.other)
+        self.hidden = Document.objects.create()
+        self.hidden.visible_to.add(self.other)
+    
+    def test_queryset(self):
+        self.assertEqual(
+            set(Document.objects.visible_to(self.viewer)),
+            set([self.public, self.restricted]),
+        )
+        self.assertEqual(
+            set(Document.objects.visible_to(self.other)),
+            set([self.public, self.restricted, self.hidden]),
+        )
+        self.assertEqual(
+            Document.objects.visible_to(self.superuser).count(),
+            3,
+        )
+    
+    def test_can_be_seen_by(self):
+        for d in (self.public, self.restricted, self.hidden):
+            self.assertEqual(
+                d.can_be_seen_by(self.viewer),
+                Document.objects.visible_to(self.viewer).filter(pk=d.pk).exists(),
+            )
+            self.assertEqual(d.can_be_seen_by(self.superuser), True)
+    
+    def test_load_documents(self):
+        docs = load_documents(Document.objects.all())
+        restricted_to = dict([(d.pk, set(d.restricted_to)) for d in docs])
+        self.assertEqual(restricted_to[self.public.pk], set())
+        self.assertEqual(restricted_to[self.restricted.pk], set([self.viewer, self.other]))
+        self.assertEqual(restricted_to[self.hidden.pk], set([self.other]))
+
 class UploadedFileTestCase(TestCase):
 
     def setUp(self):
@@ -120,3 +166,67 @@ class RepositoryFileTestCase(TestCase):
         self.assertEqual(a.document_ptr.specific_instance(), a)
         self.assertEqual(a.document_ptr.specific_instance().__class__, RepositoryFile)
 
+
+class ParseRangeTestCase(TestCase):
+    
+    def test(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=900-2000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-2000', 1000), (0, 999))
+        
+        # unsatisfiable
+        self.assertEqual(parse_range('bytes=1000-', 1000), False)
+        self.assertEqual(parse_range('bytes=-0', 1000), False)
+        
+        # ignored
+        self.assertEqual(parse_range('bytes=0-9,20-29', 1000), None)
+        self.assertEqual(parse_range('bytes=10-5', 1000), None)
+        self.assertEqual(parse_range('lines=0-9', 1000), None)
+        self.assertEqual(parse_range('bytes=-', 1000), None)
+
+class RepositoryIndexTestCase(TestCase):
+    
+    def test(self):
+        r = 'test-repo-' + rand_string()
+        r_path = path.join(_repos_dir, r)
+        d_path = path.join(r_path, 'photos')
+        f_path = path.join(d_path, 'IMG_0001.jpg')
+        
+        os.mkdir(r_path)
+        os.mkdir(d_path)
+        try:
+            fh = open(f_path, 'wb')
+            fh.write('contents')
+            fh.close()
+            
+            counts = repo_index.update_repository(r)
+            self.assertEqual(counts, {'added': 2, 'changed': 0, 'removed': 0})
+            f = IndexedFile.objects.get(repo=r, parent='photos', name='IMG_0001.jpg')
+            self.assertEqual(f.repo_path, 'photos/IMG_0001.jpg')
+            self.assertEqual(f.size, len('contents'))
+            self.assertEqual(len(f.content_hash), 40)
+            
+            # nothing changed
+            counts = repo_index.update_repository(r)
+            self.assertEqual(counts, {'added': 0, 'changed': 0, 'removed': 0})
+            
+            self.assertEqual(
+                [f.repo_path for f in repo_index.search(r, 'pho')],
+                ['photos'],
+            )
+            self.assertEqual(
+                [f.repo_path for f in repo_index.search(r, 'photos/IMG')],
+                ['photos/IMG_0001.jpg'],
+            )
+            
+            os.remove(f_path)
+            counts = repo_index.update_repository(r)
+            self.assertEqual(counts['removed'], 1)
+            self.assertEqual(IndexedFile.objects.filter(repo=r).count(), 1)
+        finally:
+            if path.exists(f_path):
+                os.remove(f_path)
+            os.rmdir(d_path)
+            os.rmdir(r_path)
@@ -1,4 +1,5 @@
 import base64
+import mimetypes
 import random
 
 def int_to_bytes(i):
@@ -18,3 +19,11 @@ def rand_string(bits=128):
     rand_bytes = int_to_bytes(random.getrandbits(bits))
     return base64.urlsafe_b64encode(rand_bytes)
 
+
+def is_image(filepath):
+    '''\
+    Guesses whether the file at the given path is an image, from its name.
+    '''
+    
+    content_type = mimetypes.guess_type(filepath)[0]
+    return bool(content_type) and content_type.startswith('image/')
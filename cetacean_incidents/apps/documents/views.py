@@ -1,10 +1,19 @@
 import os
 from os import path
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
 
 from django.conf import settings
 from django.core.files import File
 from django.forms import Media
+from django.http import (
+    Http404,
+    HttpResponse,
+)
 from django.shortcuts import (
+    get_object_or_404,
     redirect,
     render_to_response,
 )
@@ -28,6 +37,12 @@ from models import (
     RepositoryFile,
     UploadedFile,
 )
+from models import _repos_dir
+import repo_index
+from serving import (
+    serve_file,
+    thumbnail,
+)
 
 @login_required
 def view_document(request, d):
@@ -86,6 +101,62 @@ def view_repositoryfile(request, d):
         context_instance= RequestContext(request),
     )
 
+def _document_file(request, d):
+    # returns the specific instance of the document and the path to its file,
+    # or raises Http404 if it doesn't have a file
+    if not isinstance(d, Document):
+        d = get_object_or_404(Document, id=d)
+    d = d.specific_instance()
+    
+    filepath = d.path
+    if filepath is None or not path.isfile(filepath):
+        raise Http404
+    
+    return d, filepath
+
+@login_required
+def serve_document(request, d):
+    d, filepath = _document_file(request, d)
+    
+    if not d.can_be_seen_by(request.user):
+        return redirect(settings.BAD_PERMISSION_URL)
+    
+    return serve_file(request, filepath, filename=path.basename(filepath))
+
+@login_required
+def document_thumbnail(request, d):
+    d, filepath = _document_file(request, d)
+    
+    if not d.can_be_seen_by(request.user):
+        return redirect(settings.BAD_PERMISSION_URL)
+    
+    thumb_path = thumbnail(filepath)
+    if thumb_path is None:
+        raise Http404
+    
+    return serve_file(request, thumb_path, content_type='image/jpeg')
+
+@login_required
+def repository_path_search(request):
+    '''\
+    Given a request with a repository in the 'repo' key of the GET string and
+    the start of a path in the 'term' key, returns a JSON list of the indexed
+    paths that start with it, with directories ending in a slash.
+    '''
+    
+    repo = request.GET.get('repo', u'')
+    # the repository may be given as a path, the way RepositoryFile.repo
+    # stores it
+    if path.isabs(repo):
+        repo = path.relpath(repo, _repos_dir)
+    term = request.GET.get('term', u'')
+    
+    results = []
+    for f in repo_index.search(repo, term):
+        results.append(f.repo_path + (f.is_dir and u'/' or u''))
+    
+    return HttpResponse(json.dumps(results), mimetype='application/json')
+
 @login_required
 @permission_required('documents.add_document')
 def add_document(request, documentable_id):
@@ -0,0 +1,13 @@
+import re
+
+_unimportant = re.compile(r'\W', re.UNICODE)
+def search_key(string):
+    # maps a string to a search key to find similiar ones
+    return _unimportant.sub('', string).lower()
+
+# the length of the substrings that search keys are indexed by, for finding
+# keys that contain other keys
+NGRAM_LENGTH = 3
+
+def ngrams(key):
+    return set([key[i:i + NGRAM_LENGTH] for i in range(len(key) - NGRAM_LENGTH + 1)])
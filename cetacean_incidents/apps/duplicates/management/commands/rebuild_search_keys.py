@@ -0,0 +1,23 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from cetacean_incidents.apps.duplicates.models import (
+    index_names as all_index_names,
+    rebuild_index,
+)
+
+class Command(BaseCommand):
+    args = '[<index name> ...]'
+    help = 'Recreates the search keys used to find duplicate entries. Rebuilds all the indexes if none are given.'
+    
+    def handle(self, *index_names, **options):
+        if not index_names:
+            index_names = all_index_names()
+        
+        for index_name in index_names:
+            if not index_name in all_index_names():
+                raise CommandError("no such index: %s" % index_name)
+            count = rebuild_index(index_name)
+            print "%s: %d keys" % (index_name, count)
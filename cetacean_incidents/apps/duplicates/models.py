@@ -0,0 +1,363 @@
+from django.core.cache import cache
+from django.db import (
+    connection,
+    models,
+)
+from django.db.models import Count
+from django.utils.datastructures import SortedDict
+
+from django.contrib.contenttypes.models import ContentType
+
+from cetacean_incidents.apps.contacts.models import (
+    Contact,
+    Organization,
+)
+
+from cetacean_incidents.apps.entanglements.models import Entanglement
+
+from cetacean_incidents.apps.incidents.models import Animal
+
+from . import (
+    NGRAM_LENGTH,
+    ngrams,
+    search_key,
+)
+
+class SearchKey(models.Model):
+    '''\
+    The search key of one field of one entry, for finding entries that might be
+    duplicates of each other. Kept up-to-date by the handlers connected in
+    register_index.
+    '''
+
+    index_name = models.CharField(
+        max_length= 255,
+        db_index= True,
+    )
+
+    content_type = models.ForeignKey(
+        ContentType,
+    )
+
+    object_id = models.IntegerField()
+
+    key = models.CharField(
+        max_length= 1023,
+        db_index= True,
+    )
+
+    gram_count = models.IntegerField(
+        default= 0,
+        help_text= "the number of distinct n-grams of the key, for indexes that keep them",
+    )
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.index_name, self.key)
+
+    class Meta:
+        unique_together = ('index_name', 'content_type', 'object_id')
+
+class SearchKeyGram(models.Model):
+    '''\
+    One of the n-grams of a SearchKey, for finding keys that contain other keys.
+    '''
+
+    search_key = models.ForeignKey(
+        SearchKey,
+        related_name= 'grams',
+    )
+
+    gram = models.CharField(
+        max_length= NGRAM_LENGTH,
+        db_index= True,
+    )
+
+# index name -> [(<model>, <fieldname>), ...]
+_indexes = {}
+# the names of the indexes that keep n-grams
+_ngram_indexes = set()
+
+def index_names():
+    return sorted(_indexes.keys())
+
+def _cache_key(index_name, kind):
+    return u'duplicates_%s_%s' % (kind, index_name)
+
+def _clear_cached(index_name):
+    cache.delete(_cache_key(index_name, 'same'))
+    cache.delete(_cache_key(index_name, 'contained'))
+
+def _set_grams(sk):
+    sk.grams.all().delete()
+    grams = ngrams(sk.key)
+    for g in grams:
+        SearchKeyGram.objects.create(search_key=sk, gram=g)
+    if sk.gram_count != len(grams):
+        sk.gram_count = len(grams)
+        sk.save()
+
+def update_search_key(index_name, instance, fieldname):
+    '''\
+    Brings the SearchKey for the given instance's field up-to-date.
+    '''
+
+    ct = ContentType.objects.get_for_model(instance)
+    value = getattr(instance, fieldname)
+    key = value and search_key(value) or u''
+
+    existing = SearchKey.objects.filter(
+        index_name= index_name,
+        content_type= ct,
+        object_id= instance.pk,
+    )
+
+    if not key:
+        if existing.exists():
+            existing.delete()
+            _clear_cached(index_name)
+        return
+
+    sk = None
+    for sk in existing:
+        if sk.key == key:
+            return
+        sk.key = key
+        sk.save()
+    if sk is None:
+        sk = SearchKey.objects.create(
+            index_name= index_name,
+            content_type= ct,
+            object_id= instance.pk,
+            key= key,
+        )
+
+    if index_name in _ngram_indexes:
+        _set_grams(sk)
+    _clear_cached(index_name)
+
+def remove_search_keys(instance):
+    '''\
+    Removes all the SearchKeys for the given instance.
+    '''
+
+    ct = ContentType.objects.get_for_model(instance)
+    keys = SearchKey.objects.filter(content_type=ct, object_id=instance.pk)
+    for index_name in set(keys.values_list('index_name', flat=True)):
+        _clear_cached(index_name)
+    keys.delete()
+
+def register_index(index_name, model, fieldname, ngrams=False):
+    '''\
+    Adds the given model's field to the index with the given name. Several
+    models' fields can share an index, so that entries of different types can
+    be duplicates of each other. If 'ngrams' is True, the index can also find
+    keys that contain other keys.
+    '''
+
+    _indexes.setdefault(index_name, []).append((model, fieldname))
+    if ngrams:
+        _ngram_indexes.add(index_name)
+
+    def _post_save_handler(sender, instance, **kwargs):
+        update_search_key(index_name, instance, fieldname)
+    models.signals.post_save.connect(
+        sender= model,
+        receiver= _post_save_handler,
+        weak= False,
+        dispatch_uid= u'duplicates__%s__%s__%s__post_save' % (
+            index_name,
+            model._meta.app_label,
+            model._meta.object_name.lower(),
+        ),
+    )
+
+    def _post_delete_handler(sender, instance, **kwargs):
+        remove_search_keys(instance)
+    models.signals.post_delete.connect(
+        sender= model,
+        receiver= _post_delete_handler,
+        weak= False,
+        dispatch_uid= u'duplicates__%s__%s__post_delete' % (
+            model._meta.app_label,
+            model._meta.object_name.lower(),
+        ),
+    )
+
+def rebuild_index(index_name):
+    '''\
+    Recreates all the SearchKeys for the given index. Returns the number of
+    keys created.
+    '''
+
+    SearchKey.objects.filter(index_name=index_name).delete()
+    _clear_cached(index_name)
+
+    count = 0
+    for model, fieldname in _indexes[index_name]:
+        ct = ContentType.objects.get_for_model(model)
+        for pk, value in model.objects.values_list('pk', fieldname).iterator():
+            key = value and search_key(value) or u''
+            if not key:
+                continue
+            sk = SearchKey.objects.create(
+                index_name= index_name,
+                content_type= ct,
+                object_id= pk,
+                key= key,
+            )
+            if index_name in _ngram_indexes:
+                _set_grams(sk)
+            count += 1
+
+    return count
+
+def index_is_empty(index_name, model):
+    '''\
+    Returns True if none of the given model's entries are in the given index,
+    e.g. because 'manage.py rebuild_search_keys' hasn't been run since it was
+    added.
+    '''
+
+    return not SearchKey.objects.filter(
+        index_name= index_name,
+        content_type= ContentType.objects.get_for_model(model),
+    ).exists()
+
+def prefix_search(index_name, model, prefix, limit=None):
+    '''\
+    Returns a queryset of the entries of the given model in the given index
+    whose search keys start with the search key of 'prefix'. The keys are
+    found with the index on SearchKey.key, so the model's table isn't scanned.
+    '''
+
+    key = search_key(prefix)
+    if not key:
+        return model.objects.none()
+
+    ids = SearchKey.objects.filter(
+        index_name= index_name,
+        content_type= ContentType.objects.get_for_model(model),
+        key__startswith= key,
+    ).order_by('key').values_list('object_id', flat=True)
+    if not limit is None:
+        ids = ids[:limit]
+    return model.objects.filter(pk__in=list(ids))
+
+def _group_refs(keys, search_keys):
+    # 'keys' is a dictionary of group names to SearchKey ids; returns a
+    # SortedDict of group names to lists of (<content type id>, <object id>)
+    # pairs. These are what's cached, so that the entries themselves are
+    # always fresh.
+    search_keys = dict([(sk.id, sk) for sk in search_keys])
+
+    groups = SortedDict()
+    for name in sorted(keys.keys()):
+        groups[name] = [
+            (search_keys[sk_id].content_type_id, search_keys[sk_id].object_id)
+            for sk_id in sorted(keys[name])
+        ]
+    return groups
+
+def _groups(group_refs):
+    # fetch the entries with one query per model
+    ids = {}
+    for refs in group_refs.values():
+        for ct_id, object_id in refs:
+            ids.setdefault(ct_id, set()).add(object_id)
+
+    instances = {}
+    for ct_id, object_ids in ids.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        for pk, inst in model.objects.in_bulk(list(object_ids)).items():
+            instances[(ct_id, pk)] = inst
+
+    groups = SortedDict()
+    for name, refs in group_refs.items():
+        groups[name] = [instances[ref] for ref in refs if ref in instances]
+    return groups
+
+def same_key(index_name):
+    '''\
+    Returns a SortedDict of search keys to lists of the entries in the given
+    index with that key, for every key that more than one entry has.
+    '''
+
+    cache_key = _cache_key(index_name, 'same')
+    group_refs = cache.get(cache_key)
+    if group_refs is None:
+        in_index = SearchKey.objects.filter(index_name=index_name)
+        duplicated = [r['key'] for r in in_index.values('key').annotate(
+            entry_count= Count('id'),
+        ).filter(entry_count__gt=1)]
+
+        search_keys = list(in_index.filter(key__in=duplicated))
+        keys = {}
+        for sk in search_keys:
+            keys.setdefault(sk.key, []).append(sk.id)
+
+        group_refs = _group_refs(keys, search_keys)
+        cache.set(cache_key, group_refs)
+
+    return _groups(group_refs)
+
+def _contained_pairs(index_name):
+    # returns (<SearchKey id>, <SearchKey id>) pairs where all the n-grams of
+    # the first key are in the second, using one query
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute(
+        ' '.join((
+            "SELECT ga.%(sk_id)s, gb.%(sk_id)s",
+            "FROM %(gram_table)s ga",
+            "INNER JOIN %(key_table)s ka ON ka.%(pk)s = ga.%(sk_id)s",
+            "INNER JOIN %(gram_table)s gb ON gb.%(gram)s = ga.%(gram)s AND gb.%(sk_id)s <> ga.%(sk_id)s",
+            "INNER JOIN %(key_table)s kb ON kb.%(pk)s = gb.%(sk_id)s",
+            "WHERE ka.%(index_name)s = %%s AND kb.%(index_name)s = %%s",
+            "GROUP BY ga.%(sk_id)s, gb.%(sk_id)s, ka.%(gram_count)s",
+            "HAVING COUNT(*) = ka.%(gram_count)s",
+        )) % {
+            'gram_table': qn(SearchKeyGram._meta.db_table),
+            'key_table': qn(SearchKey._meta.db_table),
+            'sk_id': qn(SearchKeyGram._meta.get_field('search_key').column),
+            'gram': qn(SearchKeyGram._meta.get_field('gram').column),
+            'pk': qn(SearchKey._meta.pk.column),
+            'index_name': qn(SearchKey._meta.get_field('index_name').column),
+            'gram_count': qn(SearchKey._meta.get_field('gram_count').column),
+        },
+        [index_name, index_name],
+    )
+    return cursor.fetchall()
+
+def contained_key(index_name):
+    '''\
+    Returns a SortedDict of search keys to lists of the entries in the given
+    n-gram index whose keys contain that key, for every key that's contained
+    in another entry's key. Keys shorter than NGRAM_LENGTH are skipped.
+    '''
+
+    if not index_name in _ngram_indexes:
+        raise ValueError("index %s doesn't keep n-grams" % index_name)
+
+    cache_key = _cache_key(index_name, 'contained')
+    group_refs = cache.get(cache_key)
+    if group_refs is None:
+        pairs = _contained_pairs(index_name)
+        search_keys = SearchKey.objects.in_bulk(list(set(
+            [a for a, b in pairs] + [b for a, b in pairs]
+        )))
+        keys = {}
+        for a, b in pairs:
+            # having all the n-grams is necessary but not sufficient
+            if search_keys[a].key in search_keys[b].key:
+                keys.setdefault(search_keys[a].key, set([a])).add(b)
+
+        group_refs = _group_refs(keys, search_keys.values())
+        cache.set(cache_key, group_refs)
+
+    return _groups(group_refs)
+
+register_index('contact_name', Contact, 'name')
+register_index('contact_name', Organization, 'name')
+register_index('animal_field_number', Animal, 'field_number')
+register_index('animal_name', Animal, 'name', ngrams=True)
+register_index('entanglement_nmfs_id', Entanglement, 'nmfs_id')
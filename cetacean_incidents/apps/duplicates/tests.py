@@ -0,0 +1,101 @@
+from django.test import TestCase
+
+from cetacean_incidents.apps.contacts.models import (
+    Contact,
+    Organization,
+)
+
+from cetacean_incidents.apps.incidents.models import Animal
+
+from . import (
+    ngrams,
+    search_key,
+)
+from models import (
+    SearchKey,
+    contained_key,
+    prefix_search,
+    rebuild_index,
+    same_key,
+)
+
+class SearchKeyTestCase(TestCase):
+    
+    def test_search_key(self):
+        self.assertEqual(search_key(u'RW #2427'), u'rw2427')
+        self.assertEqual(search_key(u' Kingfisher '), u'kingfisher')
+    
+    def test_ngrams(self):
+        self.assertEqual(ngrams(u'abcd'), set([u'abc', u'bcd']))
+        self.assertEqual(ngrams(u'ab'), set())
+    
+    def test_kept_up_to_date(self):
+        a = Animal.objects.create(field_number='MH-10-123')
+        self.assertEqual(
+            SearchKey.objects.get(index_name='animal_field_number', object_id=a.id).key,
+            u'mh10123',
+        )
+        
+        a.field_number = 'MH-10-124'
+        a.save()
+        self.assertEqual(
+            SearchKey.objects.get(index_name='animal_field_number', object_id=a.id).key,
+            u'mh10124',
+        )
+        
+        a.field_number = ''
+        a.save()
+        self.assertEqual(
+            SearchKey.objects.filter(index_name='animal_field_number', object_id=a.id).count(),
+            0,
+        )
+        
+        a.name = 'Kingfisher'
+        a.save()
+        a_id = a.id
+        a.delete()
+        self.assertEqual(SearchKey.objects.filter(object_id=a_id).count(), 0)
+
+class DuplicatesTestCase(TestCase):
+    
+    def test_same_key(self):
+        c = Contact.objects.create(name='NOAA Fisheries')
+        o = Organization.objects.create(name='noaa fisheries')
+        Contact.objects.create(name='someone else')
+        
+        groups = same_key('contact_name')
+        self.assertEqual(groups.keys(), [u'noaafisheries'])
+        self.assertEqual(set(groups[u'noaafisheries']), set([c, o]))
+        
+        # the cached results are cleared when a key changes
+        o.name = 'NMFS'
+        o.save()
+        self.assertEqual(same_key('contact_name').keys(), [])
+    
+    def test_contained_key(self):
+        a = Animal.objects.create(name='Kingfisher')
+        b = Animal.objects.create(name='Kingfisher, RW #2427')
+        c = Animal.objects.create(name='Fisher')
+        Animal.objects.create(name='Pipsqueak')
+        
+        groups = contained_key('animal_name')
+        self.assertEqual(groups.keys(), [u'fisher', u'kingfisher'])
+        self.assertEqual(set(groups[u'fisher']), set([a, b, c]))
+        self.assertEqual(set(groups[u'kingfisher']), set([a, b]))
+    
+    def test_rebuild_index(self):
+        Animal.objects.create(name='Kingfisher')
+        Animal.objects.create(name='Kingfisher')
+        SearchKey.objects.filter(index_name='animal_name').delete()
+        
+        self.assertEqual(rebuild_index('animal_name'), 2)
+        self.assertEqual(len(same_key('animal_name')[u'kingfisher']), 2)
+    
+    def test_prefix_search(self):
+        c = Contact.objects.create(name='NOAA Fisheries')
+        Contact.objects.create(name='Coast Guard')
+        o = Organization.objects.create(name='NOAA')
+        
+        self.assertEqual(list(prefix_search('contact_name', Contact, 'noaa f')), [c])
+        self.assertEqual(list(prefix_search('contact_name', Organization, 'Noaa')), [o])
+        self.assertEqual(list(prefix_search('contact_name', Contact, '  ')), [])
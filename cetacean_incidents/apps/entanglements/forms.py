@@ -7,6 +7,8 @@ from django.forms.models import modelformset_factory
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
 
+from cetacean_incidents.apps.contacts.forms import ContactAutocomplete
+
 from cetacean_incidents.apps.dag.forms import DAGField
 
 from cetacean_incidents.apps.incidents.forms import (
@@ -31,7 +33,7 @@ from cetacean_incidents.apps.search_forms.fields import (
     MatchOption,
 )
 from cetacean_incidents.apps.search_forms.forms import (
-    SubmitDetectingForm,
+    LookupForm,
     SearchForm,
 )
 from cetacean_incidents.apps.search_forms.related import HideableForeignKeyQuery
@@ -44,7 +46,8 @@ from cetacean_incidents.apps.uncertain_datetimes.forms import UncertainDateTimeF
 from cetacean_incidents.apps.utils.forms import InlineRadioFieldRenderer
 
 from models import (
-    BodyLocation,
+    body_location,
+    body_locations,
     Entanglement,
     EntanglementObservation,
     GearBodyLocation,
@@ -84,7 +87,7 @@ class GearBodyLocationForm(forms.ModelForm):
             raise KeyError("location wasn't passed to a GearBodyLocationForm")
         # transmute the one visible field
         f = self.fields['gear_seen']
-        loc = BodyLocation.objects.get(pk=self.initial['location'])
+        loc = body_location(self.initial['location'])
         f.label = loc.name
         f.help_text = loc.definition
         
@@ -234,10 +237,12 @@ class GearAnalysisObservationForm(forms.ModelForm):
             'gear_given_date',
             'gear_giver',
         )
-        # doesn't seem to be working...
-        #widgets = {
-        #    'gear_given_date': Datepicker,
-        #}
+        widgets = {
+            'gear_retriever': ContactAutocomplete,
+            'gear_giver': ContactAutocomplete,
+            # doesn't seem to be working...
+            #'gear_given_date': Datepicker,
+        }
 
 GearAnalysisObservationFormset = modelformset_factory(
     EntanglementObservation,
@@ -305,20 +310,25 @@ class EntanglementObservationForm(forms.ModelForm):
 
     def _init_gear_body_location_forms(self):
         self.gear_body_location_forms = []
-        for loc in BodyLocation.objects.all():
+        
+        obs_id = self.initial.get('observation_ptr', None)
+        if obs_id is None and self.instance:
+            obs_id = self.instance.pk
+        # the existing GearBodyLocations, fetched in one query
+        gear_locs = {}
+        if not obs_id is None:
+            for gbl in GearBodyLocation.objects.filter(observation__pk=obs_id):
+                gear_locs[gbl.location_id] = gbl
+        
+        for loc in body_locations():
             subform_kwargs = {}
 
             initial_data = {}
             initial_data['location'] = loc.id
-            obs_id = self.initial.get('observation_ptr', None)
-            if obs_id is None and self.instance:
-                obs_id = self.instance.pk
             if not obs_id is None:
                 initial_data['observation'] = obs_id
-                instance = GearBodyLocation.objects.filter(observation__pk=obs_id, location__id=loc.id)
-                if instance.exists():
-                    instance = instance[0]
-                    subform_kwargs['instance'] = instance
+                if loc.id in gear_locs:
+                    subform_kwargs['instance'] = gear_locs[loc.id]
             subform_kwargs['initial'] = initial_data
 
             if self.prefix:
@@ -379,6 +389,8 @@ class EntanglementObservationForm(forms.ModelForm):
         exclude = ('gear_body_location',)
         widgets = {
             'gear_given_date': Datepicker,
+            'gear_retriever': ContactAutocomplete,
+            'gear_giver': ContactAutocomplete,
         }
 
 class EntanglementObservationMergeForm(MergeForm, EntanglementObservationForm):
@@ -493,7 +505,7 @@ class GearOwnerMergeForm(MergeForm):
     class Meta:
         model = GearOwner
 
-class EntanglementNMFSIDLookupForm(SubmitDetectingForm):
+class EntanglementNMFSIDLookupForm(LookupForm):
     nmfs_id = forms.CharField(
         help_text= u"find entanglement cases whose entanglement NMFS IDs contain this",
         label= "entanglement NMFS ID",
@@ -503,9 +515,7 @@ class EntanglementNMFSIDLookupForm(SubmitDetectingForm):
         data = self.cleaned_data['nmfs_id']
         cases = Entanglement.objects.filter(nmfs_id__icontains=data)
         # nmfs_id isn't garanteed to be unique
-        if cases.count() < 1:
-            raise forms.ValidationError("no case has been marked with an NMFS ID like that")
-        return cases
+        return self._check_found(cases, "no case has been marked with an NMFS ID like that")
     
     def results(self):
         return self.cleaned_data['nmfs_id']
@@ -1,12 +1,19 @@
 import operator
+import random
 
 from django.core.validators import (
     MinValueValidator,
     MaxValueValidator,
 )
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import models
 
+from cetacean_incidents.apps.clean_cache.stamps import (
+    register_dependents,
+    register_global,
+)
+
 from cetacean_incidents.apps.contacts.models import (
     AbstractContact,
     Contact,
@@ -25,6 +32,7 @@ from cetacean_incidents.apps.incidents.models import (
     Case,
     Observation,
     ObservationExtension,
+    register_observation_extension,
 )
 
 from cetacean_incidents.apps.taxons.models import Taxon
@@ -142,6 +150,13 @@ class GearOwner(AbstractContact):
 
 guard_deletes(Location, GearOwner, 'location_gear_set')
 
+register_dependents(LocationGearSet, lambda l: Entanglement.objects.filter(
+    gear_owner_info__location_gear_set= l,
+))
+register_dependents(GearOwner, lambda go: Entanglement.objects.filter(
+    gear_owner_info= go,
+))
+
 class GearTarget(models.Model):
     name = models.CharField(
         max_length= 1024,
@@ -357,6 +372,13 @@ guard_deletes(Contact, Entanglement, 'analyzed_by')
 guard_deletes(GearOwner, Entanglement, 'gear_owner_info')
 guard_deletes(GearTarget, Entanglement, 'targets')
 
+register_dependents(Contact, lambda c: Entanglement.objects.filter(
+    analyzed_by= c,
+))
+
+register_global(GearAttribute)
+register_global(GearTarget)
+
 class BodyLocation(models.Model):
     '''\
     Model for customizable/extensible classification of location on/in an
@@ -388,6 +410,73 @@ class BodyLocation(models.Model):
     class Meta:
         ordering = ('ordering', 'name')
 
+# BodyLocations are reference data that rarely change, so they're kept for the
+# life of the process. When one changes, this process's copy is dropped and the
+# generation in the shared cache is changed, so the other processes drop
+# theirs the next time they're used. A missing generation (e.g. one that was
+# evicted) never matches, since the locations may have changed meanwhile.
+_body_locations = None
+_body_locations_generation = None
+_BODY_LOCATIONS_GENERATION_KEY = u'entanglements_body_locations_generation'
+# the generation is only replaced on changes, so keep it for as long as the
+# cache allows (memcached's maximum is 30 days)
+_BODY_LOCATIONS_GENERATION_TIMEOUT = 30 * 24 * 60 * 60
+
+def body_locations():
+    '''\
+    Returns a tuple of all the BodyLocations, in order.
+    '''
+    
+    global _body_locations, _body_locations_generation
+    generation = cache.get(_BODY_LOCATIONS_GENERATION_KEY)
+    if generation is None:
+        generation = random.random()
+        if not cache.add(
+            _BODY_LOCATIONS_GENERATION_KEY,
+            generation,
+            _BODY_LOCATIONS_GENERATION_TIMEOUT,
+        ):
+            # another process made one in the meantime
+            generation = cache.get(_BODY_LOCATIONS_GENERATION_KEY, generation)
+        # refetch, whatever generation this process's copy is from
+        _body_locations = None
+    if _body_locations is None or generation != _body_locations_generation:
+        _body_locations = tuple(BodyLocation.objects.all())
+        _body_locations_generation = generation
+    return _body_locations
+
+def body_location(pk):
+    '''\
+    Returns the BodyLocation with the given primary key, from those returned by
+    body_locations.
+    '''
+    
+    pk = int(pk)
+    for loc in body_locations():
+        if loc.pk == pk:
+            return loc
+    raise BodyLocation.DoesNotExist
+
+def _body_locations_changed(sender, **kwargs):
+    global _body_locations
+    _body_locations = None
+    cache.set(
+        _BODY_LOCATIONS_GENERATION_KEY,
+        random.random(),
+        _BODY_LOCATIONS_GENERATION_TIMEOUT,
+    )
+
+models.signals.post_save.connect(
+    sender= BodyLocation,
+    receiver= _body_locations_changed,
+    dispatch_uid= 'body_locations__bodylocation__post_save',
+)
+models.signals.post_delete.connect(
+    sender= BodyLocation,
+    receiver= _body_locations_changed,
+    dispatch_uid= 'body_locations__bodylocation__post_delete',
+)
+
 class EntanglementObservation(ObservationExtension):
     
     anchored = models.NullBooleanField(
@@ -477,15 +566,19 @@ class EntanglementObservation(ObservationExtension):
     )
     
     def get_gear_body_locations(self):
-        body_locations = []
-        for loc in BodyLocation.objects.all():
-            gear_loc = GearBodyLocation.objects.filter(observation=self, location=loc)
-            if gear_loc.exists():
-                body_locations.append((loc, gear_loc[0]))
-            else:
-                body_locations.append((loc, None))
-
-        return body_locations
+        '''\
+        Returns a list of (<BodyLocation>, <GearBodyLocation or None>) pairs,
+        for every BodyLocation. Uses the ones fetched by
+        load_gear_body_locations if it was called for this instance.
+        '''
+        
+        if hasattr(self, '_gear_body_locations'):
+            return self._gear_body_locations
+        
+        gear_locs = {}
+        for gbl in self.gearbodylocation_set.all():
+            gear_locs[gbl.location_id] = gbl
+        return [(loc, gear_locs.get(loc.pk)) for loc in body_locations()]
 
     def get_gear_body_locations_dict(self):
         result = {}
@@ -514,55 +607,12 @@ class EntanglementObservation(ObservationExtension):
 guard_deletes(Contact, EntanglementObservation, 'gear_retriever')
 guard_deletes(Contact, EntanglementObservation, 'gear_giver')
 
-# TODO generalize this for all ObservationExtensions
-def add_entanglement_extension_handler(sender, **kwargs):
-    # sender shoulde be Observation.cases.through
-    action = kwargs['action']
-    if action == 'post_add':
-        reverse = kwargs['reverse']
-        if not reverse:
-            # observation.cases.add(<some cases>)
-            # kwargs['instance'] is observation
-            # kwargs['model'] is Case
-            # kwargs['pk_set'] is a iterable of Case PK's
-            obs = kwargs['instance']
-            # do we already have an E.OE.
-            try:
-                obs.entanglements_entanglementobservation
-                return
-            except EntanglementObservation.DoesNotExist:
-                # are any of the cases Entanglements
-                if Entanglement.objects.filter(pk__in=kwargs['pk_set']):
-                    # be sure not to overwrite an existing extension
-                    try:
-                        obs.entanglements_entanglementobservation
-                    except EntanglementObservation.DoesNotExist:
-                        EntanglementObservation.objects.create(
-                            observation_ptr=obs,
-                        )
-        else:
-            # entanglement.observation_set.add(<some observations>)
-            # kwargs['instance'] is entanglement
-            # kwargs['model'] is Observation
-            # kwargs['pk_set'] is a iterable of Observation PK's
-            case = kwargs['instance']
-            if not isinstance(case, Entanglement):
-                return
-            # add E.OE. to any obs that don't already have them
-            for o in Observation.objects.filter(pk__in=kwargs['pk_set']):
-                # be sure not to overwrite an existing extension
-                try:
-                    o.entanglements_entanglementobservation
-                except EntanglementObservation.DoesNotExist:
-                    EntanglementObservation.objects.create(
-                        observation_ptr=o,
-                    )
-    
-models.signals.m2m_changed.connect(
-    sender= Observation.cases.through,
-    receiver= add_entanglement_extension_handler,
-    dispatch_uid= 'observation_cases__add_entanglement_extension__m2m_changed',
-)
+register_observation_extension(EntanglementObservation, Entanglement)
+
+register_dependents(EntanglementObservation, lambda eo: [eo.observation_ptr])
+register_dependents(Contact, lambda c: EntanglementObservation.objects.filter(
+    models.Q(gear_retriever=c) | models.Q(gear_giver=c)
+))
 
 class GearBodyLocation(models.Model):
     observation = models.ForeignKey(EntanglementObservation)
@@ -577,3 +627,41 @@ class GearBodyLocation(models.Model):
 
 guard_deletes(BodyLocation, GearBodyLocation, 'location')
 
+register_global(BodyLocation)
+register_dependents(GearBodyLocation, lambda gbl: [gbl.observation])
+
+# how many observations' GearBodyLocations to fetch with each query, since some
+# databases limit the number of items in an IN clause
+GEAR_BODY_LOCATION_CHUNK_SIZE = 500
+
+def load_gear_body_locations(observations):
+    '''\
+    Fetches the GearBodyLocations of all the given EntanglementObservations at
+    once, so that their get_gear_body_locations doesn't query. Returns the
+    observations as a list.
+    '''
+    
+    observations = list(observations)
+    ids = [o.pk for o in observations]
+    
+    gear_locs = {}
+    for i in range(0, len(ids), GEAR_BODY_LOCATION_CHUNK_SIZE):
+        for gbl in GearBodyLocation.objects.filter(
+            observation__in= ids[i:i + GEAR_BODY_LOCATION_CHUNK_SIZE],
+        ):
+            gear_locs.setdefault(gbl.observation_id, {})[gbl.location_id] = gbl
+    
+    locs = body_locations()
+    for o in observations:
+        obs_gear_locs = gear_locs.get(o.pk, {})
+        o._gear_body_locations = []
+        for loc in locs:
+            gbl = obs_gear_locs.get(loc.pk)
+            if not gbl is None:
+                # skip the queries for the GearBodyLocation's foreign keys
+                gbl._location_cache = loc
+                gbl._observation_cache = o
+            o._gear_body_locations.append((loc, gbl))
+    
+    return observations
+
@@ -1,18 +1,32 @@
+from django.core.cache import cache
 from django.test import TestCase
 
+from cetacean_incidents.apps.contacts.models import Contact
+
 from cetacean_incidents.apps.incidents.models import (
     Animal,
     Observation,
+    provision_observation_extensions,
 )
 from cetacean_incidents.apps.uncertain_datetimes.models import UncertainDateTime
 
+import models
 from models import (
+    BodyLocation,
+    body_location,
+    body_locations,
     Entanglement,
     EntanglementObservation,
     GearAttribute,
     GearAttributeImplication,
+    GearBodyLocation,
+    load_gear_body_locations,
+)
+from forms import (
+    EntanglementObservationForm,
+    GearAnalysisObservationFormset,
+    GearOwnerForm,
 )
-from forms import GearOwnerForm
 
 class GearAttributeTestCase(TestCase):
     def setUp(self):
@@ -200,4 +214,102 @@ class EntanglementObservationTestCase(TestCase):
         # reload o2
         o2 = Observation.objects.get(pk=o2.pk)
         o2.entanglements_entanglementobservation
-
+    
+    def test_provision_in_bulk(self):
+        a = Animal.objects.create()
+        e = Entanglement.objects.create(
+            animal= a
+        )
+        observations = [
+            Observation.objects.create(
+                animal= a,
+                datetime_observed= UncertainDateTime(2008),
+                datetime_reported= UncertainDateTime(2008),
+            )
+            for i in range(3)
+        ]
+        existing = EntanglementObservation.objects.create(
+            observation_ptr= observations[0],
+            gear_description= 'already here',
+        )
+        
+        e.observation_set.add(*observations)
+        self.assertEqual(
+            EntanglementObservation.objects.filter(observation_ptr__in=observations).count(),
+            3,
+        )
+        # existing extensions are left alone
+        self.assertEqual(
+            EntanglementObservation.objects.get(pk=existing.pk).gear_description,
+            'already here',
+        )
+        self.assertEqual(
+            provision_observation_extensions(EntanglementObservation, [o.pk for o in observations]),
+            0,
+        )
+    
+    def test_gear_body_locations(self):
+        # the fixture's
+        head = BodyLocation.objects.get(name='head')
+        list(body_locations())
+        tail = BodyLocation.objects.create(name='tail end', ordering='0.99')
+        # the process-wide copy is dropped when they change
+        self.assertEqual(list(body_locations()), list(BodyLocation.objects.all()))
+        
+        eo = EntanglementObservation.objects.create(
+            observation_ptr= self.o,
+        )
+        gbl = GearBodyLocation.objects.create(
+            observation= eo,
+            location= tail,
+            gear_seen_here= True,
+        )
+        
+        expected = [(loc, None) for loc in body_locations()]
+        expected[list(body_locations()).index(tail)] = (tail, gbl)
+        self.assertEqual(eo.get_gear_body_locations(), expected)
+        
+        eo = EntanglementObservation.objects.get(pk=eo.pk)
+        load_gear_body_locations([eo])
+        self.assertEqual(eo.get_gear_body_locations(), expected)
+        self.assertEqual(eo.get_gear_body_locations_dict()[tail], True)
+        self.assertEqual(eo.get_gear_body_locations_dict()[head], None)
+    
+    def test_contact_widgets(self):
+        chosen = Contact.objects.create(name='Chosen Person')
+        Contact.objects.create(name='Other Person')
+        eo = EntanglementObservation.objects.create(
+            observation_ptr= self.o,
+            gear_retriever= chosen,
+        )
+        
+        # only the chosen contacts are rendered
+        f = EntanglementObservationForm(instance=eo)
+        for fieldname in ('gear_retriever', 'gear_giver'):
+            rendered = unicode(f[fieldname])
+            self.assertFalse(u'Other Person' in rendered)
+        self.assertTrue(u'Chosen Person' in unicode(f['gear_retriever']))
+        
+        formset = GearAnalysisObservationFormset(
+            queryset= EntanglementObservation.objects.filter(pk=eo.pk),
+        )
+        for fieldname in ('gear_retriever', 'gear_giver'):
+            rendered = unicode(formset.forms[0][fieldname])
+            self.assertFalse(u'Other Person' in rendered)
+    
+    def test_body_locations_generation(self):
+        head = BodyLocation.objects.get(name='head')
+        cache.delete(models._BODY_LOCATIONS_GENERATION_KEY)
+        list(body_locations())
+        
+        # a change this process didn't see (e.g. made by another process),
+        # whose generation has since been evicted from the cache
+        BodyLocation.objects.filter(pk=head.pk).update(definition=u'changed')
+        cache.delete(models._BODY_LOCATIONS_GENERATION_KEY)
+        
+        # a missing generation doesn't match the one the copy is from
+        self.assertEqual(body_location(head.pk).definition, u'changed')
+        self.assertNotEqual(
+            cache.get(models._BODY_LOCATIONS_GENERATION_KEY),
+            None,
+        )
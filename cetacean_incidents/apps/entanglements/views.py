@@ -26,6 +26,7 @@ from reversion import revision
 from cetacean_incidents.decorators import (
     permission_required,
     global_etag,
+    stamped_condition,
 )
 from cetacean_incidents import generic_views
 
@@ -95,6 +96,7 @@ class EntanglementTab(CaseTab):
 Entanglement.extra_tab_class = EntanglementTab
 
 @login_required
+@stamped_condition(lambda request, case_id, *args, **kwargs: [Entanglement(pk=case_id)])
 def entanglement_detail(request, case_id, extra_context):
     
     case = Entanglement.objects.get(id=case_id)
@@ -11,7 +11,7 @@ from cetacean_incidents.apps.jquery_ui.widgets import (
 
 from cetacean_incidents.apps.search_forms.forms import (
     SearchForm,
-    SubmitDetectingForm,
+    LookupForm,
 )
 from cetacean_incidents.apps.search_forms.related import (
     HideableReverseForeignKeyQuery,
@@ -60,7 +60,7 @@ class AnimalAutocomplete(ModelAutocomplete):
         css = {'all': (settings.JQUERYUI_CSS_FILE, 'animal_autocomplete.css')}
         js = (settings.JQUERY_FILE, settings.JQUERYUI_JS_FILE, 'animal_autocomplete.js')
 
-class AnimalLookupForm(SubmitDetectingForm):
+class AnimalLookupForm(LookupForm):
 
     animal = forms.ModelChoiceField(
         queryset= Animal.objects.all(),
@@ -76,7 +76,7 @@ class AnimalLookupForm(SubmitDetectingForm):
     def results(self):
         return [self.cleaned_data['animal']]
 
-class AnimalFieldNumberLookupForm(SubmitDetectingForm):
+class AnimalFieldNumberLookupForm(LookupForm):
     field_number = forms.CharField(
         help_text= u"look up an animal with this field number",
         label= "field number",
@@ -86,14 +86,12 @@ class AnimalFieldNumberLookupForm(SubmitDetectingForm):
         data = self.cleaned_data['field_number']
         animals = Animal.objects.filter(field_number__iexact=data)
         # field_number isn't garanteed to be unique
-        if animals.count() < 1:
-            raise forms.ValidationError("no animal in the database has that field number")
-        return animals
+        return self._check_found(animals, "no animal in the database has that field number")
     
     def results(self):
         return self.cleaned_data['field_number']
 
-class AnimalNameLookupForm(SubmitDetectingForm):
+class AnimalNameLookupForm(LookupForm):
     name_contains = forms.CharField(
         help_text= u"look up an with a name that contains this",
     )
@@ -101,9 +99,7 @@ class AnimalNameLookupForm(SubmitDetectingForm):
     def clean_name_contains(self):
         data = self.cleaned_data['name_contains']
         animals = Animal.objects.filter(name__icontains=data)
-        if animals.count() < 1:
-            raise forms.ValidationError("no animal in the database has a name that contains that")
-        return animals
+        return self._check_found(animals, "no animal in the database has a name that contains that")
 
     def results(self):
         return self.cleaned_data['name_contains']
@@ -159,6 +155,10 @@ class AnimalMergeForm(DocumentableMergeForm):
     def save(self, commit=True):
         # concatenate import_notes
         self.destination.import_notes += self.source.import_notes
+        # the source's cases are moved without being saved; saving the
+        # destination re-saves all its cases (see
+        # Case._animal_post_save_update_name_handler), which updates their
+        # names once.
         return super(AnimalMergeForm, self).save(commit)
         
     class Meta:
@@ -25,10 +25,12 @@ from cetacean_incidents.apps.utils.forms import RestModelForm
 from ..models import (
     Animal,
     Case,
+    CaseYear,
     Observation,
     SeriousInjuryAndMortality,
     YearCaseNumber,
 )
+from ..models.years import update_year_summaries
 
 from animal import AnimalSearchForm
 from observation import ObservationSearchForm
@@ -125,9 +127,20 @@ class CaseMergeForm(DocumentableMergeForm):
         
         # In cases where souce and destination has YearCaseNumbers in the same
         # year, Case.save() will handle setting destination.current_yearnumber
-        # to the lower of the two numbers.
+        # to the lower of the two numbers. The source's observations and
+        # YearCaseNumbers are moved without being saved, so that save is also
+        # where the destination's name is updated, once.
         
-        return super(CaseMergeForm, self).save(commit)
+        # The source's CaseYears would collide with the destination's if they
+        # were moved too. Case.save() adds the destination's new ones; the
+        # years the source was in just need recounting.
+        source_years = CaseYear.objects.filter(case=self.source)
+        years = set(source_years.values_list('year', flat=True))
+        source_years.delete()
+        
+        result = super(CaseMergeForm, self).save(commit)
+        update_year_summaries(years)
+        return result
 
     class Meta:
         model = Case
@@ -205,6 +218,12 @@ class UseCaseReportForm(forms.Form):
 
     report = forms.ModelChoiceField(queryset= Report.objects.all())
 
+    pdf = forms.BooleanField(
+        required= False,
+        initial= False,
+        label= u'as a PDF',
+    )
+
     def __init__(self, cases_qs, cases_initial, *args, **kwargs):
         super(UseCaseReportForm, self).__init__(*args, **kwargs)
         self.fields['cases'] = forms.ModelMultipleChoiceField(
@@ -215,10 +234,9 @@ class UseCaseReportForm(forms.Form):
         )
 
     def clean_cases(self):
-        result = []
-        for c in self.cleaned_data['cases']:
-            result.append(c.specific_instance())
-        return result
+        # Report.render_cases loads the specific instances for all the cases
+        # at once
+        return list(self.cleaned_data['cases'])
 
 class CaseCSVForm(forms.Form):
     
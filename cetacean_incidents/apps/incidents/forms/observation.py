@@ -4,7 +4,10 @@ from django.core.exceptions import ValidationError
 from django import forms
 from django.forms.util import ErrorList
 
-from cetacean_incidents.apps.contacts.forms import ContactSearchForm
+from cetacean_incidents.apps.contacts.forms import (
+    ContactAutocomplete,
+    ContactSearchForm,
+)
 
 from cetacean_incidents.apps.documents.forms import DocumentableMergeForm
 
@@ -292,6 +295,11 @@ class ObservationForm(BaseObservationForm):
         exclude = ('animal', 'cases', 'location', 'observer_vessel',
             'animal_length', 'animal_length_sigdigs' # these are handled by a LengthField
         )
+        # rather than listing every contact
+        widgets = {
+            'observer': ContactAutocomplete,
+            'reporter': ContactAutocomplete,
+        }
 
 class ObservationCasesForm(forms.Form):
     '''\
@@ -1,10 +1,25 @@
 import django.forms
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase
 
+from cetacean_incidents.apps.merge_form.relations import relation_map
+
+from cetacean_incidents.apps.uncertain_datetimes import UncertainDateTime
+
 from ..models.animal import Animal
+from ..models.case import (
+    Case,
+    YearCaseNumber,
+)
+from ..models.observation import Observation
+from ..models.years import (
+    CaseYear,
+    YearSummary,
+)
 
 from animal import AnimalSearchForm
-from case import CaseAnimalForm, CaseSearchForm
+from case import CaseAnimalForm, CaseMergeForm, CaseSearchForm
 from observation import ObservationDateField
 
 class CaseAnimalFormTestCase(TestCase):
@@ -108,3 +123,87 @@ class CaseSearchFormTestCase(TestCase):
             # just check that this doesn't throw any exceptions
             form.results()
 
+
+class CaseMergeFormTestCase(TestCase):
+    
+    def _observe(self, *cases):
+        o = Observation.objects.create(
+            animal= self.animal,
+            datetime_observed= UncertainDateTime(2011),
+            datetime_reported= UncertainDateTime(2011),
+        )
+        o.cases.add(*cases)
+        return o
+    
+    def test_refs_queries(self):
+        self.animal = Animal.objects.create()
+        source = Case.objects.create(animal=self.animal)
+        destination = Case.objects.create(animal=self.animal)
+        self._observe(source, destination)
+        form = CaseMergeForm(source, destination)
+        
+        relations = relation_map(Case)
+        relation_count = sum([len(getattr(relations, kind)) for kind in (
+            'fk',
+            'o2o',
+            'parent_links',
+            'm2m',
+        )])
+        
+        # the references to both are fetched with one query per relation
+        form._refs = None
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            before = len(connection.queries)
+            form._refs_to(source)
+            form._refs_to(destination)
+            queries = len(connection.queries) - before
+        finally:
+            settings.DEBUG = old_debug
+        self.assertEqual(queries, relation_count)
+        self.assertEqual(
+            form._refs_to(destination)['m2m'],
+            relations.refs_to([destination.pk])[destination.pk]['m2m'],
+        )
+    
+    def test_merge(self):
+        self.animal = Animal.objects.create()
+        source = Case.objects.create(animal=self.animal)
+        destination = Case.objects.create(animal=self.animal)
+        # a many-to-many reference to just the source, and one to both
+        source_only = self._observe(source)
+        both = self._observe(source, destination)
+        # a ForeignKey reference
+        source = Case.objects.get(id=source.id)
+        yearnumber = source.current_yearnumber
+        self.assertEqual(yearnumber.case_id, source.id)
+        
+        # submit the destination's values unchanged
+        form = CaseMergeForm(source, destination)
+        data = dict(filter(lambda (k, v): not v is None, form.initial.items()))
+        form = CaseMergeForm(source, destination, data)
+        self.assertEqual(form.is_valid(), True)
+        form.save()
+        form.delete()
+        
+        self.assertEqual(Case.objects.filter(id=source.id).exists(), False)
+        self.assertEqual(
+            list(destination.observation_set.order_by('id')),
+            [source_only, both],
+        )
+        self.assertEqual(
+            list(both.cases.values_list('id', flat=True)),
+            [destination.id],
+        )
+        self.assertEqual(
+            YearCaseNumber.objects.get(id=yearnumber.id).case_id,
+            destination.id,
+        )
+        # the year index isn't moved, but rebuilt
+        self.assertEqual(
+            list(CaseYear.objects.filter(case=destination).values_list('year', flat=True)),
+            [2011],
+        )
+        self.assertEqual(YearSummary.objects.get(year=2011).case_count, 1)
+        self.assertTrue(u'moving references' in form.timing_summary())
@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from cetacean_incidents.apps.incidents.models.years import update_year_index
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the index of which cases and observations are in which years, used by the by-year pages. Run this after adding the index tables to an existing database.'
+    
+    def handle_noargs(self, **options):
+        count = transaction.commit_on_success(update_year_index)()
+        print "%d years indexed" % count
@@ -14,6 +14,13 @@ from case import (
 from observation import (
     Observation,
     ObservationExtension,
+    provision_observation_extensions,
+    register_observation_extension,
+)
+
+from years import (
+    CaseYear,
+    YearSummary,
 )
 
 import tests
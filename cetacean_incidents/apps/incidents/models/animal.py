@@ -10,6 +10,7 @@ from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import register_dependents
 
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
@@ -250,3 +251,7 @@ class Animal(Documentable, Importable):
 
 guard_deletes(Taxon, Animal, 'determined_taxon')
 
+register_dependents(Animal, lambda a: (
+    list(a.case_set.all())
+    + list(a.observation_set.all())
+))
@@ -1,15 +1,19 @@
 # -*- encoding: utf-8 -*-
 
+import threading
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Max
 from django.utils.html import escape as html_escape
 
 from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import register_dependents
 
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
@@ -72,6 +76,9 @@ class CaseMeta(models.Model.__metaclass__):
 
         return the_class
 
+# see Case.defer_name_updates
+_name_updates = threading.local()
+
 def num_choices(low, high):
     return tuple([(i, unicode(i)) for i in range(low, high + 1)])
 
@@ -553,6 +560,95 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
         return frozenset(self._get_names_list())
     names_set = property(_get_names_set)
     
+    # Bulk loaders can defer keeping case names up to date while they save
+    # lots of entries, instead of recomputing the names of every affected case
+    # each time an animal, observation or case is saved. They're then
+    # responsible for calling update_names_in_bulk with the cases they saved.
+    # Only affects the current thread.
+    @staticmethod
+    def defer_name_updates():
+        _name_updates.deferred = True
+    
+    @staticmethod
+    def resume_name_updates():
+        _name_updates.deferred = False
+    
+    @staticmethod
+    def name_updates_deferred():
+        return getattr(_name_updates, 'deferred', False)
+    
+    @classmethod
+    def update_names_in_bulk(cls, cases):
+        '''\
+        Does what save() does to keep date, current_yearnumber, names and the
+        year index up to date, but for many newly-added cases at once. The
+        instances passed in are updated as well as the database. Cases that
+        already have a current_yearnumber should just be saved instead.
+        '''
+        
+        cases = filter(lambda c: c.id, cases)
+        if not cases:
+            return
+        
+        # the earliest observation date of each case, in one query. note that
+        # values_list gives us the sortkeys, not UncertainDateTimes.
+        sortkeys = {}
+        # (values_list can't follow Observation.cases, so go through the
+        # link table)
+        obs_dates = Observation.cases.through.objects.filter(
+            case__in= [c.id for c in cases],
+        ).values_list('case', 'observation__datetime_observed')
+        for case_id, sortkey in obs_dates:
+            if not case_id in sortkeys or sortkey < sortkeys[case_id]:
+                sortkeys[case_id] = sortkey
+        date_field = Observation._meta.get_field('datetime_observed')
+        dates = {}
+        for case_id, sortkey in sortkeys.items():
+            dates[case_id] = date_field.to_python(sortkey)
+        
+        # the last assigned number of each year, in one query
+        years = set([d.year for d in dates.values()])
+        next_numbers = {}
+        if years:
+            last_numbers = YearCaseNumber.objects.filter(
+                year__in= years,
+            ).values('year').annotate(last_number=Max('number'))
+            for row in last_numbers:
+                next_numbers[row['year']] = row['last_number'] + 1
+        
+        for c in cases:
+            c.date = dates.get(c.id, None)
+            c.current_yearnumber = None
+            if not c.date is None:
+                year = c.date.year
+                c.current_yearnumber = YearCaseNumber.objects.create(
+                    case= c,
+                    year= year,
+                    number= next_numbers.get(year, 1),
+                )
+                next_numbers[year] = c.current_yearnumber.number + 1
+            
+            new_name = c._current_name()
+            if not new_name is None and new_name != c.name:
+                if c.names is None or c.names == '':
+                    c.names = new_name
+                else:
+                    c.names += ',' + new_name
+            
+            # don't send any signals, or call save()
+            Case.objects.filter(id=c.id).update(
+                date= c.date,
+                current_yearnumber= c.current_yearnumber,
+                names= c.names,
+            )
+        
+        # avoid circular imports
+        from years import (
+            update_case_years,
+            update_year_summaries,
+        )
+        update_year_summaries(update_case_years([c.id for c in cases]))
+    
     ### NOTE! none of these handler account for changes to case.animal,
     # obsevation.cases or observation.animal
     
@@ -596,7 +692,7 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
     def _animal_post_save_update_name_handler(sender, **kwargs):
         # sender should be Animal
         
-        if kwargs['created']:
+        if kwargs['created'] or Case.name_updates_deferred():
             # a newly-created animal can't have any references to it, so we
             # don't need to update anything
             return
@@ -653,6 +749,9 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
         # sender should be Observation
         
         #if kwargs['created']:
+            if Case.name_updates_deferred():
+                return
+            
             cases = set()
             o = kwargs['instance']
             
@@ -679,6 +778,9 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
     def _observation_post_delete_update_name_handler(sender, **kwargs):
         # sender should be Observation
         
+        if Case.name_updates_deferred():
+            return
+        
         # the probable_taxon of the observation's animal may have changed,
         # which could change the name of any case for the animal
         
@@ -697,6 +799,9 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
     @staticmethod
     def _observation_cases_m2m_changed_update_name_handler(sender, **kwargs):
         # sender should be Observation.cases.through
+        if Case.name_updates_deferred():
+            return
+        
         action, reverse = kwargs['action'], kwargs['reverse']
         if action in ('post_add', 'post_remove') and not reverse:
             # cases were added to or removed from an observation
@@ -752,6 +857,9 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
     def save(self, force_insert=False, force_update=False, using=None):
         super(Case, self).save(force_insert, force_update, using)
         
+        if Case.name_updates_deferred():
+            return
+        
         date = None
         if self.id:
             obs = self.observation_set
@@ -814,6 +922,13 @@ class Case(Documentable, SeriousInjuryAndMortality, Importable):
                 else:
                     self.names += ',' + new_name
                 super(Case, self).save(using=using)
+            
+            # avoid circular imports
+            from years import (
+                update_case_years,
+                update_year_summaries,
+            )
+            update_year_summaries(update_case_years([self.id]))
 
     save.alters_data = True
     
@@ -1007,3 +1122,5 @@ models.signals.m2m_changed.connect(
     dispatch_uid= 'case__update_name__observation__m2m_changed',
 )
 
+register_dependents(Case, lambda c: [c.animal] + list(c.observation_set.all()))
+register_dependents(YearCaseNumber, lambda ycn: [ycn.case])
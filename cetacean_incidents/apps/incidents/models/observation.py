@@ -9,12 +9,17 @@ from django.core.validators import (
     MinValueValidator,
     MaxValueValidator,
 )
-from django.db import models
+from django.db import (
+    connection,
+    models,
+    transaction,
+)
 
 from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import register_dependents
 
 from cetacean_incidents.apps.contacts.models import Contact
 
@@ -469,11 +474,14 @@ class Observation(Documentable, Importable):
     
     def get_observation_extensions(self):
         
-        # TODO don't hard-code these names
-        oe_fields = ('entanglements_entanglementobservation', 'shipstrikes_shipstrikeobservation')
+        # set when observations are loaded in bulk, e.g. by
+        # reports.context.load_cases
+        if hasattr(self, '_observation_extensions'):
+            return self._observation_extensions
         
         observation_extensions = []
-        for oe_field in oe_fields:
+        for oe_class, case_class in _observation_extensions:
+            oe_field = oe_class._meta.get_field('observation_ptr').related.get_accessor_name()
             try:
                 oe = getattr(self, oe_field)
                 observation_extensions.append(oe)
@@ -527,3 +535,108 @@ class ObservationExtension(models.Model):
     class Meta:
         abstract = True
 
+# (<ObservationExtension subclass>, <Case subclass>) pairs. See
+# register_observation_extension.
+_observation_extensions = []
+
+def register_observation_extension(oe_class, case_class):
+    '''\
+    Makes sure every Observation that's relevant to a case of the given Case
+    subclass has an instance of the given ObservationExtension subclass, by
+    creating the missing ones whenever observations and cases are linked.
+    '''
+    
+    _observation_extensions.append((oe_class, case_class))
+
+def _insert_instances(model, instances):
+    # inserts the given unsaved instances with one query. Only for models
+    # whose primary key isn't an AutoField and that don't inherit from
+    # another concrete model, like ObservationExtension subclasses.
+    fields = model._meta.local_fields
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(model._meta.db_table),
+        ', '.join([qn(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields)),
+    )
+    rows = [
+        [f.get_db_prep_save(f.pre_save(inst, True), connection=connection) for f in fields]
+        for inst in instances
+    ]
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.set_dirty()
+
+def provision_observation_extensions(oe_class, observation_ids):
+    '''\
+    Creates instances of the given ObservationExtension subclass for those of
+    the given observations that don't already have one. The observations that
+    need one are found with one query, and the new extensions are inserted
+    with another. post_save is still sent for each new extension, so that
+    revisions and caches are kept up-to-date. Returns the number created.
+    '''
+    
+    observation_ids = list(observation_ids)
+    if not observation_ids:
+        return 0
+    
+    # an anti-join: the observations with no row in oe_class's table
+    related_name = oe_class._meta.get_field('observation_ptr').related_query_name()
+    missing = list(Observation.objects.filter(**{
+        'pk__in': observation_ids,
+        related_name + '__isnull': True,
+    }).values_list('pk', flat=True))
+    if not missing:
+        return 0
+    
+    _insert_instances(oe_class, [oe_class(observation_ptr_id=pk) for pk in missing])
+    
+    for oe in oe_class.objects.filter(observation_ptr__in=missing):
+        models.signals.post_save.send(
+            sender= oe_class,
+            instance= oe,
+            created= True,
+            raw= False,
+        )
+    
+    return len(missing)
+
+def _observation_cases_m2m_changed_extension_handler(sender, **kwargs):
+    # sender should be Observation.cases.through
+    if kwargs['action'] != 'post_add':
+        return
+    pk_set = kwargs['pk_set']
+    if not pk_set:
+        return
+    
+    for oe_class, case_class in _observation_extensions:
+        if not kwargs['reverse']:
+            # observation.cases.add(<some cases>)
+            # kwargs['instance'] is the observation
+            # kwargs['pk_set'] is an iterable of Case PK's
+            if case_class.objects.filter(pk__in=pk_set).exists():
+                provision_observation_extensions(oe_class, [kwargs['instance'].pk])
+        else:
+            # case.observation_set.add(<some observations>)
+            # kwargs['instance'] is the case
+            # kwargs['pk_set'] is an iterable of Observation PK's
+            if isinstance(kwargs['instance'], case_class):
+                provision_observation_extensions(oe_class, pk_set)
+
+models.signals.m2m_changed.connect(
+    sender= Observation.cases.through,
+    receiver= _observation_cases_m2m_changed_extension_handler,
+    dispatch_uid= 'observation_cases__provision_observation_extensions__m2m_changed',
+)
+
+# observation pages show their cases and animal, and the pages of the cases
+# and animal show their observations, along with the observations' locations,
+# vessels, and contacts
+register_dependents(Observation, lambda o: list(o.cases.all()) + [o.animal])
+register_dependents(Location, lambda l: Observation.objects.filter(location=l))
+register_dependents(VesselInfo, lambda v: Observation.objects.filter(observer_vessel=v))
+register_dependents(Contact, lambda c: (
+    list(c.observed.all())
+    + list(c.reported.all())
+    + list(c.for_vessels.all())
+))
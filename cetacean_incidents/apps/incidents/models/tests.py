@@ -3,15 +3,31 @@ from datetime import (
     timedelta,
 )
 
+from django.core.cache import cache
 from django.test import TestCase
 
+from cetacean_incidents.apps.clean_cache.stamps import (
+    _keys_to_bump,
+    global_stamp_key,
+    instance_stamps,
+    stamp_key,
+)
+
 from cetacean_incidents.apps.taxons.models import Taxon
 
 from cetacean_incidents.apps.uncertain_datetimes import UncertainDateTime
 
 from animal import Animal
-from case import Case
+from case import (
+    Case,
+    YearCaseNumber,
+)
 from observation import Observation
+from years import (
+    CaseYear,
+    YearSummary,
+    update_year_index,
+)
 
 class CaseTestCase(TestCase):
     def setUp(self):
@@ -134,6 +150,44 @@ class CaseTestCase(TestCase):
         c = Case.objects.get(id=c.id)
         self.assertEquals(c.name, c._current_name())
 
+    def test_update_names_in_bulk(self):
+        # what a bulk loader does
+        Case.defer_name_updates()
+        try:
+            cases = []
+            for year in (2011, 2011, 2012):
+                c = Case.objects.create(animal=self.animal)
+                obs = Observation.objects.create(
+                    animal = self.animal,
+                    datetime_observed= UncertainDateTime(year),
+                    datetime_reported= UncertainDateTime(year),
+                )
+                obs.cases.add(c)
+                cases.append(c)
+            no_obs = Case.objects.create(animal=self.animal)
+        finally:
+            Case.resume_name_updates()
+        
+        # nothing's been updated yet
+        self.assertEquals(Case.objects.get(id=cases[0].id).current_yearnumber, None)
+        
+        Case.update_names_in_bulk(cases + [no_obs])
+        
+        numbers = []
+        for c in cases:
+            from_db = Case.objects.get(id=c.id)
+            self.assertEquals(from_db.current_yearnumber, c.current_yearnumber)
+            self.assertEquals(from_db.name, from_db._current_name())
+            self.assertEquals(from_db.date, c.date)
+            numbers.append((c.date.year, c.current_yearnumber.number))
+        self.assertEquals(numbers, [(2011, 1), (2011, 2), (2012, 1)])
+        self.assertEquals(Case.objects.get(id=no_obs.id).current_yearnumber, None)
+        self.assertEquals(
+            set(CaseYear.objects.filter(case__in=cases).values_list('case', 'year')),
+            set([(cases[0].id, 2011), (cases[1].id, 2011), (cases[2].id, 2012)]),
+        )
+        self.assertEquals(YearSummary.objects.get(year=2011).case_count, 2)
+
 class ObservationTestCase(TestCase):
     
     def setUp(self):
@@ -296,3 +350,102 @@ class ObservationTestCase(TestCase):
         both_ss_oe = ShipstrikeObservation.objects.create(observation_ptr=both_ext)
         self.assertEqual(set(both_ext.get_observation_extensions()), set((both_ent_oe, both_ss_oe)))
 
+class StampsTestCase(TestCase):
+    
+    def setUp(self):
+        # don't depend on what earlier tests left in the cache
+        cache.clear()
+        self.animal = Animal.objects.create()
+        self.case = Case.objects.create(animal=self.animal)
+        self.observation = Observation.objects.create(
+            animal = self.animal,
+            datetime_observed= UncertainDateTime(2011),
+            datetime_reported= UncertainDateTime(2011),
+        )
+        self.observation.cases.add(self.case)
+    
+    def test_subclass_key(self):
+        from cetacean_incidents.apps.entanglements.models import Entanglement
+        self.assertEqual(
+            stamp_key(Entanglement, self.case.pk),
+            stamp_key(Case, self.case.pk),
+        )
+    
+    def test_dependents(self):
+        before = instance_stamps([self.case, self.animal, self.observation])
+        self.assertEqual(
+            before,
+            instance_stamps([self.case, self.animal, self.observation]),
+        )
+        
+        self.observation.save()
+        after = instance_stamps([self.case, self.animal, self.observation])
+        for b, a in zip(before, after)[:3]:
+            self.assertNotEqual(b[0], a[0])
+        # The global stamp isn't thrown away. (Checking which keys are thrown
+        # away, rather than comparing stamps, since any stamp can be evicted
+        # from the cache and made again.)
+        self.assertFalse(global_stamp_key() in _keys_to_bump([self.observation]))
+    
+    def test_global(self):
+        before = instance_stamps([self.case])
+        t = Taxon.objects.create(name='Thing', rank=0)
+        # only the global stamp is thrown away
+        self.assertEqual(_keys_to_bump([t]), set([global_stamp_key()]))
+        after = instance_stamps([self.case])
+        self.assertNotEqual(before[1][0], after[1][0])
+
+class YearIndexTestCase(TestCase):
+    
+    def setUp(self):
+        self.animal = Animal.objects.create()
+        self.case = Case.objects.create(animal=self.animal)
+    
+    def _observe(self, year):
+        o = Observation.objects.create(
+            animal = self.animal,
+            datetime_observed= UncertainDateTime(year),
+            datetime_reported= UncertainDateTime(year),
+        )
+        o.cases.add(self.case)
+        return o
+    
+    def _summary(self, year):
+        try:
+            s = YearSummary.objects.get(year=year)
+        except YearSummary.DoesNotExist:
+            return None
+        return (s.case_count, s.observation_count)
+    
+    def test_observations(self):
+        o = self._observe(2010)
+        self._observe(2010)
+        self.assertEqual(
+            list(CaseYear.objects.filter(case=self.case).values_list('year', flat=True)),
+            [2010],
+        )
+        self.assertEqual(self._summary(2010), (1, 2))
+        
+        o.datetime_observed = UncertainDateTime(2011)
+        o.save()
+        self.assertEqual(self._summary(2010), (1, 1))
+        self.assertEqual(self._summary(2011), (1, 1))
+        
+        o.delete()
+        self.assertEqual(self._summary(2011), None)
+    
+    def test_case_delete(self):
+        self._observe(2010)
+        # remove the references that guard the case from deletion
+        Case.objects.filter(id=self.case.id).update(current_yearnumber=None)
+        YearCaseNumber.objects.filter(case=self.case).delete()
+        Case.objects.get(id=self.case.id).delete()
+        self.assertEqual(self._summary(2010), (0, 1))
+    
+    def test_rebuild(self):
+        self._observe(2010)
+        CaseYear.objects.all().delete()
+        YearSummary.objects.all().delete()
+        
+        self.assertEqual(update_year_index(), 1)
+        self.assertEqual(self._summary(2010), (1, 1))
@@ -0,0 +1,207 @@
+'''\
+An index of which cases and observations are in which years, so that the
+by-year pages and the year drop-down don't have to search observation dates.
+A case is in every year that one of its observations is in.
+
+CaseYear and YearSummary are kept up to date by Case.save() (which is already
+called whenever a case's observations change) and by the signal handlers at
+the bottom of this module. Bulk loaders that defer name updates (see
+Case.defer_name_updates) get them updated by Case.update_names_in_bulk. Changes
+made some other way can be caught up with 'manage.py update_year_index'.
+'''
+
+from django.db import models
+
+from case import Case
+from observation import Observation
+
+class CaseYear(models.Model):
+    '''\
+    A year a case has observations in.
+    '''
+
+    case = models.ForeignKey(Case)
+    year = models.IntegerField(db_index= True)
+
+    def __unicode__(self):
+        return u"%s in %d" % (self.case, self.year)
+
+    class Meta:
+        app_label = 'incidents'
+        unique_together = ('case', 'year')
+
+class YearSummary(models.Model):
+    '''\
+    The number of cases and observations in a year. There are only entries for
+    years with observations.
+    '''
+
+    year = models.IntegerField(unique= True)
+    case_count = models.IntegerField(default= 0)
+    observation_count = models.IntegerField(default= 0)
+
+    def __unicode__(self):
+        return u"%d: %d cases, %d observations" % (
+            self.year,
+            self.case_count,
+            self.observation_count,
+        )
+
+    class Meta:
+        app_label = 'incidents'
+        ordering = ('year',)
+
+def _year(sortkey):
+    # note that values_list gives us the sortkeys of UncertainDateTimeFields,
+    # not UncertainDateTimes
+    if sortkey is None:
+        return None
+    date_field = Observation._meta.get_field('datetime_observed')
+    return date_field.to_python(sortkey).year
+
+def observation_year_q(year):
+    '''\
+    Returns a Q object for the observations observed in the given year.
+    '''
+
+    # relies on UncertainDateTime's database representation starting with the
+    # year
+    return models.Q(datetime_observed__startswith= u"%04d" % year)
+
+def update_case_years(case_ids):
+    '''\
+    Brings the CaseYears of the cases with the given ids up to date with their
+    observations. Returns the set of years that cases were added to or
+    removed from.
+    '''
+
+    case_ids = list(case_ids)
+    if not case_ids:
+        return set()
+
+    years = set()
+    # values_list can't follow Observation.cases, so go through the link table
+    for case_id, sortkey in Observation.cases.through.objects.filter(
+        case__in= case_ids,
+    ).values_list('case', 'observation__datetime_observed'):
+        year = _year(sortkey)
+        if not year is None:
+            years.add((case_id, year))
+
+    old_years = set(CaseYear.objects.filter(
+        case__in= case_ids,
+    ).values_list('case', 'year'))
+
+    for case_id, year in old_years - years:
+        CaseYear.objects.filter(case=case_id, year=year).delete()
+    for case_id, year in years - old_years:
+        CaseYear.objects.create(case_id=case_id, year=year)
+
+    return set([year for case_id, year in old_years ^ years])
+
+def update_year_summaries(years):
+    '''\
+    Recounts the cases and observations in the given years.
+    '''
+
+    for year in years:
+        if year is None:
+            continue
+        case_count = CaseYear.objects.filter(year=year).count()
+        observation_count = Observation.objects.filter(
+            observation_year_q(year),
+        ).count()
+
+        if not (case_count or observation_count):
+            YearSummary.objects.filter(year=year).delete()
+            continue
+
+        summary, created = YearSummary.objects.get_or_create(year=year)
+        if (summary.case_count, summary.observation_count) != (case_count, observation_count):
+            summary.case_count = case_count
+            summary.observation_count = observation_count
+            summary.save()
+
+def update_year_index():
+    '''\
+    Rebuilds all the CaseYears and YearSummaries. Returns the number of
+    years.
+    '''
+
+    years = set(YearSummary.objects.values_list('year', flat=True))
+    case_ids = list(Case.objects.values_list('id', flat=True))
+    for i in range(0, len(case_ids), 500):
+        years |= update_case_years(case_ids[i:i + 500])
+
+    for sortkey in Observation.objects.values_list(
+        'datetime_observed',
+        flat= True,
+    ).iterator():
+        years.add(_year(sortkey))
+    years |= set(CaseYear.objects.values_list('year', flat=True))
+
+    update_year_summaries(years)
+    return YearSummary.objects.count()
+
+def _observation_pre_save(sender, instance, **kwargs):
+    # remember the year the observation was in, in case it's changed
+    instance._index_old_year = None
+    if instance.pk:
+        sortkeys = Observation.objects.filter(
+            pk= instance.pk,
+        ).values_list('datetime_observed', flat=True)
+        for sortkey in sortkeys:
+            instance._index_old_year = _year(sortkey)
+
+def _observation_post_save(sender, instance, **kwargs):
+    if Case.name_updates_deferred():
+        return
+    years = set([getattr(instance, '_index_old_year', None)])
+    if instance.datetime_observed:
+        years.add(instance.datetime_observed.year)
+    update_year_summaries(years)
+
+def _observation_post_delete(sender, instance, **kwargs):
+    if Case.name_updates_deferred():
+        return
+    if instance.datetime_observed:
+        update_year_summaries([instance.datetime_observed.year])
+
+def _case_pre_delete(sender, instance, **kwargs):
+    if not isinstance(instance, Case):
+        return
+    # the CaseYears are about to be deleted along with the case
+    instance._index_years = set(CaseYear.objects.filter(
+        case= instance,
+    ).values_list('year', flat=True))
+
+def _case_post_delete(sender, instance, **kwargs):
+    if not isinstance(instance, Case):
+        return
+    update_year_summaries(getattr(instance, '_index_years', ()))
+
+models.signals.pre_save.connect(
+    sender= Observation,
+    receiver= _observation_pre_save,
+    dispatch_uid= 'years__observation__pre_save',
+)
+models.signals.post_save.connect(
+    sender= Observation,
+    receiver= _observation_post_save,
+    dispatch_uid= 'years__observation__post_save',
+)
+models.signals.post_delete.connect(
+    sender= Observation,
+    receiver= _observation_post_delete,
+    dispatch_uid= 'years__observation__post_delete',
+)
+# the delete signals for a Case subclass may not be sent with Case as the
+# sender
+models.signals.pre_delete.connect(
+    receiver= _case_pre_delete,
+    dispatch_uid= 'years__case__pre_delete',
+)
+models.signals.post_delete.connect(
+    receiver= _case_post_delete,
+    dispatch_uid= 'years__case__post_delete',
+)
@@ -1,10 +1,9 @@
 import datetime
 
-from django.core.cache import cache
 from django import forms
 from django import template
 
-from ..models import Observation
+from ..models import YearSummary
 
 register = template.Library()
 
@@ -21,22 +20,15 @@ class YearsForm(forms.Form):
     @staticmethod
     def _get_year_choices():
         # datetime_observed, not datetime_reported
-        cache_key = 'incidents__case_extras__year_range'
-        year_range = cache.get(cache_key)
-        if year_range is None:
-            # TODO relys on UncertainDateTime's database representation starting with the year
-            considered_obs = Observation.objects.filter(datetime_observed__gte=unicode(_MIN_YEAR)).only('datetime_observed')
-            try:
-                lowest_year = considered_obs.order_by('datetime_observed')[0].datetime_observed.year
-                highest_year = considered_obs.order_by('-datetime_observed')[0].datetime_observed.year
-                year_range = (lowest_year, highest_year)
-                cache.set(cache_key, year_range, 24 * 60 * 60)
-            except IndexError:
-                # apparently there are no observations after _MIN_YEAR
-                # just use this year and don't put anything in the cache
-                this_year = datetime.date.today().year
-                year_range = (this_year, this_year)
-        return map(lambda y: (y, unicode(y)), reversed(range(year_range[0], year_range[1] + 1)))
+        years = list(YearSummary.objects.filter(
+            year__gte= _MIN_YEAR,
+            observation_count__gt= 0,
+        ).order_by('-year').values_list('year', flat=True))
+        if not years:
+            # apparently there are no observations after _MIN_YEAR
+            # just use this year
+            years = [datetime.date.today().year]
+        return [(y, unicode(y)) for y in years]
 
     def __init__(self, *args, **kwargs):
         super(YearsForm, self).__init__(*args, **kwargs)
@@ -1,7 +1,16 @@
 from decimal import Decimal as D
 
+from django.template import (
+    Context,
+    Template,
+)
 from django.test import TestCase
 
+from ..models import (
+    Animal,
+    Case,
+)
+
 from observation_extras import (
     round_decimal,
     display_decimal,
@@ -25,3 +34,20 @@ class ObservationExtrasTestCase(TestCase):
         self.assertEqual(display_decimal(D('-88')), u'\u221288')
         self.assertEqual(display_decimal(D('40e1')), u'4<u>0</u>0')
 
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        self.case = Case.objects.create(animal=Animal.objects.create())
+    
+    def _render(self, nmfs_id):
+        return Template(
+            "{% load fragment_cache %}"
+            "{% cachefragment test case %}{{ nmfs_id }}{% endcachefragment %}"
+        ).render(Context({'case': self.case, 'nmfs_id': nmfs_id}))
+    
+    def test_cached(self):
+        self.assertEqual(self._render(u'first'), u'first')
+        # still the cached fragment
+        self.assertEqual(self._render(u'second'), u'first')
+        
+        self.case.save()
+        self.assertEqual(self._render(u'third'), u'third')
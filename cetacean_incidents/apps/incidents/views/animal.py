@@ -28,6 +28,7 @@ from django.contrib.auth.decorators import login_required
 from cetacean_incidents.decorators import (
     permission_required,
     global_etag,
+    stamped_condition,
 )
 from cetacean_incidents.forms import PagingForm
 
@@ -44,6 +45,7 @@ from ..forms import (
 from ..models import Animal
 
 @login_required
+@stamped_condition(lambda request, animal_id, *args, **kwargs: [Animal(pk=animal_id)])
 def animal_detail(request, animal_id):
     animal = Animal.objects.get(id=animal_id)
         
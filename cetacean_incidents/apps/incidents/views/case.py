@@ -33,6 +33,7 @@ from django.contrib.auth.decorators import login_required
 from cetacean_incidents.decorators import (
     permission_required,
     global_etag,
+    stamped_condition,
 )
 from cetacean_incidents import generic_views
 
@@ -43,6 +44,7 @@ from cetacean_incidents.apps.csv_export import UnicodeDictWriter
 from cetacean_incidents.apps.entanglements.models import (
     Entanglement,
     EntanglementObservation,
+    load_gear_body_locations,
 )
 
 from cetacean_incidents.apps.jquery_ui.tabs import Tabs
@@ -99,6 +101,7 @@ from tabs import (
 )
 
 @login_required
+@stamped_condition(lambda request, case_id, *args, **kwargs: [Case(pk=case_id)])
 def case_detail(request, case_id, extra_context={}):
     # TODO this is quite inefficient
     case = Case.objects.get(id=case_id)
@@ -126,6 +129,8 @@ def case_detail(request, case_id, extra_context={}):
         extra_context= extra_context,
     )
 
+CASES_BY_YEAR_PER_PAGE = 100
+
 @login_required
 def cases_by_year(request, year=None):
     # handle the year in a GET arg:
@@ -137,20 +142,30 @@ def cases_by_year(request, year=None):
     if year is None:
         year = datetime.now().year
     year = int(year)
-    cases = Case.objects.filter(observation__datetime_observed__startswith=u"%04d" % year).order_by('date', 'current_yearnumber__year', 'current_yearnumber__number', 'pk')
-    # Oracle doesn't support distinct, so this is a work-around
-    case_list = []
-    case_set = set()
-    for c in cases:
-        if not c in case_set:
-            case_list.append(c)
-        case_set.add(c)
-    cases = case_list
+    
+    # the year index has one entry per case and year, so unlike a join on
+    # observations, this doesn't need duplicates removed
+    cases = Case.objects.filter(
+        caseyear__year= year,
+    ).order_by('date', 'current_yearnumber__year', 'current_yearnumber__number', 'pk')
+    
+    paginator = Paginator(cases, CASES_BY_YEAR_PER_PAGE)
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    try:
+        page = paginator.page(page)
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(paginator.num_pages)
+    
     return render_to_response(
         "incidents/cases_by_year.html",
         {
             'year': year,
-            'cases': cases,
+            'page': page,
+            'cases': page.object_list,
+            'case_count': paginator.count,
         },
         context_instance= RequestContext(request),
     )
@@ -211,9 +226,13 @@ def case_search(
         use_report_form = UseCaseReportForm(case_qs, case_list, prefix='use_report', data=request.GET)
         if use_report_form.is_valid():
             report = use_report_form.cleaned_data['report'].specific_instance()
-            rendered = report.render({
-                'cases': use_report_form.cleaned_data['cases'],
-            })
+            cases = use_report_form.cleaned_data['cases']
+            if use_report_form.cleaned_data['pdf']:
+                return HttpResponse(
+                    report.render_cases(cases, pdf=True),
+                    mimetype= 'application/pdf',
+                )
+            rendered = report.render_cases(cases)
             return HttpResponse(rendered, mimetype=report.format)
     else:
         use_report_form = UseCaseReportForm(case_qs, case_list, prefix='use_report')
@@ -607,6 +626,15 @@ def _case_dump_response(cases):
         header_row[header] = header
     writer.writerow(header_row)
     
+    # fetch the entanglement-data for all the cases' observations, and their
+    # gear body locations, up front instead of once per observation
+    cases = list(cases)
+    entanglement_observations = {}
+    for oe in load_gear_body_locations(EntanglementObservation.objects.filter(
+        observation_ptr__cases__in= [case.id for case in cases],
+    ).distinct()):
+        entanglement_observations[oe.pk] = oe
+    
     for case in cases:
         case = case.specific_instance()
         animal = case.animal
@@ -645,11 +673,8 @@ def _case_dump_response(cases):
             if not obs.observer_vessel is None:
                 _process_fields('vessel', obs.observer_vessel)
             
-            try:
-                oe = obs.entanglements_entanglementobservation
-                _process_fields('entanglementobservation', oe)
-            except EntanglementObservation.DoesNotExist:
-                pass
+            if obs.pk in entanglement_observations:
+                _process_fields('entanglementobservation', entanglement_observations[obs.pk])
 
             try:
                 oe = obs.shipstrikes_shipstrikeobservation
@@ -705,9 +730,7 @@ def _case_report_change(request, report=None, report_type=None):
                     report = form.save(commit=False)
                 if cases_form.is_valid():
                     report = report.specific_instance()
-                    rendered = report.render({
-                        'cases': cases_form.cleaned_data['cases'],
-                    })
+                    rendered = report.render_for_cases(cases_form.cleaned_data['cases'])
                     return HttpResponse(rendered, mimetype=report.format)
     else:
         form = form_class(instance=report)
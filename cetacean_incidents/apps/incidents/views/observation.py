@@ -1,3 +1,4 @@
+from datetime import datetime
 import operator
 
 from django.conf import settings
@@ -31,6 +32,7 @@ from cetacean_incidents import generic_views
 from cetacean_incidents.decorators import (
     permission_required,
     global_etag,
+    stamped_condition,
 )
 from cetacean_incidents.forms import PagingForm
 
@@ -56,6 +58,7 @@ from ..models import (
     Observation,
     ObservationExtension,
 )
+from ..models.years import observation_year_q
 from ..forms import (
     AnimalForm,
     CaseForm,
@@ -78,6 +81,7 @@ from tabs import (
 )
 
 @login_required
+@stamped_condition(lambda request, observation_id, *args, **kwargs: [Observation(pk=observation_id)])
 def observation_detail(request, observation_id):
     observation = Observation.objects.get(id=observation_id)
     
@@ -624,6 +628,8 @@ def observation_search(request):
         context_instance= RequestContext(request),
     )
 
+OBSERVATIONS_BY_YEAR_PER_PAGE = 100
+
 @login_required
 def observations_by_year(request, year=None):
     # handle the year in a GET arg:
@@ -635,19 +641,27 @@ def observations_by_year(request, year=None):
     if year is None:
         year = datetime.now().year
     year = int(year)
-    observations = Observation.objects.filter(datetime_observed__startswith=u"%04d" % year).order_by('datetime_observed', 'datetime_reported', 'pk')
-    # Oracle doesn't support distinct, so this is a work-around
-    obs_list = []
-    obs_set = set()
-    for o in observations:
-        if not o in obs_set:
-            obs_list.append(o)
-        obs_set.add(o)
+    observations = Observation.objects.filter(
+        observation_year_q(year),
+    ).order_by('datetime_observed', 'datetime_reported', 'pk')
+    
+    paginator = Paginator(observations, OBSERVATIONS_BY_YEAR_PER_PAGE)
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    try:
+        page = paginator.page(page)
+    except (EmptyPage, InvalidPage):
+        page = paginator.page(paginator.num_pages)
+    
     return render_to_response(
         "incidents/observations_by_year.html",
         {
             'year': year,
-            'observations': obs_list,
+            'page': page,
+            'observations': page.object_list,
+            'observation_count': paginator.count,
         },
         context_instance= RequestContext(request),
     )
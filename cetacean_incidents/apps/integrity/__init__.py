@@ -0,0 +1,121 @@
+'''\
+A registry of checks for entries that are probably mistakes, like animals
+with no cases. Each check is a query for the offending entries; the ids it
+finds are cached until one of the models it depends on changes.
+'''
+
+import time
+
+from django.core.cache import cache
+from django.db import models
+
+from cetacean_incidents.apps.clean_cache import CACHE_TIMEOUT
+
+class Check(object):
+    
+    def __init__(self, name, title, model, query, depends_on):
+        '''\
+        'query' is a callable that returns a QuerySet of the entries of 'model'
+        that fail the check. It should be a single query, preferably an
+        anti-join (e.g. a filter on a reverse relation being null) rather than
+        a list of ids from one query passed into another. 'depends_on' is an
+        iterable of models and many-to-many 'through' models; the cached
+        results are cleared when any of them are saved, deleted, or (for
+        'through' models) changed.
+        '''
+        self.name = name
+        self.title = title
+        self.model = model
+        self.query = query
+        self.depends_on = tuple(depends_on)
+    
+    @property
+    def cache_key(self):
+        return u'integrity_check_%s' % self.name
+    
+    def run(self):
+        '''\
+        Runs the check's query and caches the result. Returns the ids of the
+        entries that failed, and how many seconds the query took.
+        '''
+        started = time.time()
+        ids = []
+        seen = set()
+        # entries can show up more than once if the query joins across a
+        # many-to-many relation, and DISTINCT doesn't work on Oracle tables
+        # with LOBs
+        for pk in self.query().values_list('pk', flat=True).iterator():
+            if not pk in seen:
+                seen.add(pk)
+                ids.append(pk)
+        seconds = time.time() - started
+        cache.set(self.cache_key, ids, CACHE_TIMEOUT)
+        return ids, seconds
+    
+    def ids(self):
+        ids = cache.get(self.cache_key)
+        if ids is None:
+            ids, seconds = self.run()
+        return ids
+    
+    def entries(self):
+        ids = self.ids()
+        if not ids:
+            return []
+        entries = self.model.objects.in_bulk(ids)
+        return [entries[pk] for pk in ids if pk in entries]
+    
+    def clear(self, **kwargs):
+        cache.delete(self.cache_key)
+    
+    def __repr__(self):
+        return '<Check: %s>' % self.name
+
+# name -> Check, in the order they were registered
+_checks = {}
+_check_order = []
+
+def register_check(name, title, model, query, depends_on):
+    '''\
+    Adds a check to the registry. See Check for the arguments.
+    '''
+    
+    check = Check(name, title, model, query, depends_on)
+    if not name in _checks:
+        _check_order.append(name)
+    _checks[name] = check
+    
+    for dep in check.depends_on:
+        for signal_name in ('post_save', 'post_delete', 'm2m_changed'):
+            signal = getattr(models.signals, signal_name)
+            signal.connect(
+                sender= dep,
+                receiver= check.clear,
+                weak= False,
+                dispatch_uid= u'integrity__%s__%s__%s__%s' % (
+                    name,
+                    dep._meta.app_label,
+                    dep._meta.object_name.lower(),
+                    signal_name,
+                ),
+            )
+    
+    return check
+
+def get_check(name):
+    return _checks[name]
+
+def all_checks():
+    return [_checks[name] for name in _check_order]
+
+def models_changed(changed_models):
+    '''\
+    Clears the cached results of the checks that depend on any of the given
+    models, for changes that were made without sending the usual signals (e.g.
+    with QuerySet.update() or raw SQL).
+    '''
+    
+    changed_models = set(changed_models)
+    for check in all_checks():
+        if changed_models.intersection(check.depends_on):
+            check.clear()
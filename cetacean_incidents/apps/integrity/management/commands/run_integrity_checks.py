@@ -0,0 +1,29 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from cetacean_incidents.apps.integrity import (
+    all_checks,
+    get_check,
+)
+
+class Command(BaseCommand):
+    args = '[<check name> ...]'
+    help = 'Runs the integrity checks shown on the odd entries page and refreshes their cached results. Runs all of them if none are given.'
+    
+    def handle(self, *names, **options):
+        if names:
+            try:
+                checks = map(get_check, names)
+            except KeyError, e:
+                raise CommandError("no such check: %s" % e.args[0])
+        else:
+            checks = all_checks()
+        
+        total = 0.0
+        for check in checks:
+            ids, seconds = check.run()
+            total += seconds
+            print "%s: %d entries in %.2f seconds" % (check.name, len(ids), seconds)
+        print "%d checks in %.2f seconds" % (len(checks), total)
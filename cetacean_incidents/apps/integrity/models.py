@@ -0,0 +1,61 @@
+from cetacean_incidents.apps.entanglements.models import (
+    Entanglement,
+    EntanglementObservation,
+)
+
+from cetacean_incidents.apps.incidents.models import (
+    Animal,
+    Case,
+    Observation,
+)
+
+from cetacean_incidents.apps.shipstrikes.models import (
+    Shipstrike,
+    ShipstrikeObservation,
+)
+
+from . import register_check
+
+# the post_save and post_delete signals for a Case subclass are only sent with
+# the subclass as the sender
+_case_models = (Case, Entanglement, Shipstrike)
+
+register_check(
+    name= 'animals_no_cases',
+    title= u"Animals with no cases",
+    model= Animal,
+    query= lambda: Animal.objects.filter(case__id__isnull=True),
+    depends_on= (Animal,) + _case_models,
+)
+
+register_check(
+    name= 'cases_no_observations',
+    title= u"Cases with no observations",
+    model= Case,
+    query= lambda: Case.objects.filter(observation__id__isnull=True),
+    depends_on= _case_models + (Observation, Observation.cases.through),
+)
+
+register_check(
+    name= 'observations_no_ent',
+    title= u"Observations for Entanglement cases without entanglement data",
+    model= Observation,
+    # note that Django trims 'cases__entanglement__isnull=False' down to just
+    # 'the observation has a case', so this uses a subquery instead
+    query= lambda: Observation.objects.filter(
+        cases__in= Entanglement.objects.all(),
+        entanglements_entanglementobservation__isnull= True,
+    ),
+    depends_on= _case_models + (Observation, Observation.cases.through, EntanglementObservation),
+)
+
+register_check(
+    name= 'observations_no_ss',
+    title= u"Observations for Shipstrike cases without shipstrike data",
+    model= Observation,
+    query= lambda: Observation.objects.filter(
+        cases__in= Shipstrike.objects.all(),
+        shipstrikes_shipstrikeobservation__isnull= True,
+    ),
+    depends_on= _case_models + (Observation, Observation.cases.through, ShipstrikeObservation),
+)
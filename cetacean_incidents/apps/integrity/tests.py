@@ -0,0 +1,70 @@
+from django.test import TestCase
+
+from cetacean_incidents.apps.entanglements.models import (
+    Entanglement,
+    EntanglementObservation,
+)
+
+from cetacean_incidents.apps.incidents.models import (
+    Animal,
+    Case,
+    Observation,
+)
+
+from cetacean_incidents.apps.uncertain_datetimes.models import UncertainDateTime
+
+from . import (
+    get_check,
+    models_changed,
+)
+
+class ChecksTestCase(TestCase):
+    
+    def test_animals_no_cases(self):
+        check = get_check('animals_no_cases')
+        a = Animal.objects.create()
+        self.assertTrue(a.id in check.ids())
+        
+        # the cached result is cleared when a case is added
+        Case.objects.create(animal=a)
+        self.assertFalse(a.id in check.ids())
+    
+    def test_observations_no_ent(self):
+        check = get_check('observations_no_ent')
+        a = Animal.objects.create()
+        e = Entanglement.objects.create(animal=a)
+        o = Observation.objects.create(
+            animal= a,
+            datetime_observed= UncertainDateTime(2010),
+            datetime_reported= UncertainDateTime(2010),
+        )
+        self.assertFalse(o.id in check.ids())
+        
+        # observations of other kinds of cases aren't reported
+        o.cases.add(Case.objects.create(animal=a))
+        self.assertFalse(o.id in check.ids())
+        self.assertFalse(o.id in get_check('observations_no_ss').ids())
+        
+        # adding the link directly (like a bulk loader) skips the m2m_changed
+        # handler that would add an EntanglementObservation, and the one that
+        # would clear the cached result
+        Observation.cases.through.objects.create(observation=o, case=e)
+        models_changed([Observation.cases.through])
+        self.assertEqual(check.ids(), [o.id])
+        self.assertEqual(check.entries(), [Observation.objects.get(id=o.id)])
+        
+        # m2m_changed clears it too
+        o.cases.remove(e)
+        self.assertFalse(o.id in check.ids())
+        
+        Observation.cases.through.objects.create(observation=o, case=e)
+        models_changed([Observation.cases.through])
+        EntanglementObservation.objects.create(observation_ptr=o)
+        self.assertFalse(o.id in check.ids())
+    
+    def test_run(self):
+        check = get_check('cases_no_observations')
+        c = Case.objects.create(animal=Animal.objects.create())
+        ids, seconds = check.run()
+        self.assertEqual(ids, [c.id])
+        self.assertTrue(seconds >= 0)
@@ -2,6 +2,7 @@ from decimal import Decimal
 import re
 
 from django import forms
+from django.core import validators
 from django.db.models import Q
 from django.template.loader import render_to_string
 
@@ -14,8 +15,12 @@ from cetacean_incidents.apps.search_forms.fields import (
     QueryField,
 )
 
-from models import Location
-from utils import dms_to_dec
+from models import (
+    in_box_q,
+    Location,
+    within_distance_q,
+)
+from utils import dms_to_dec_many
 from widgets import CountryWidget
 
 class LocationForm(forms.ModelForm):
@@ -186,10 +191,10 @@ class NiceLocationForm(LocationForm):
         if bool(cleaned_data['coordinates_lat_input']) and bool(cleaned_data['coordinates_lng_input']):
             # act like the coordinates field wasn't hidden, then call super's 
             # clean
-            self.cleaned_data['coordinates'] = "%s,%s" % (
-                dms_to_dec(self.cleaned_data['coordinates_lat_input']),
-                dms_to_dec(self.cleaned_data['coordinates_lng_input']),
-            )
+            self.cleaned_data['coordinates'] = "%s,%s" % tuple(dms_to_dec_many((
+                self.cleaned_data['coordinates_lat_input'],
+                self.cleaned_data['coordinates_lng_input'],
+            )))
         else:
             self.cleaned_data['coordinates'] = ''
 
@@ -237,6 +242,100 @@ class CountryQueryField(QueryField):
 
         return super(CountryQueryField, self).query(value, prefix)
 
+class _NumbersField(forms.CharField):
+    '''\
+    A field for a given number of comma-separated numbers, whose values are
+    tuples of floats.
+    '''
+    
+    count = None
+    
+    def clean(self, value):
+        value = super(_NumbersField, self).clean(value)
+        if value in validators.EMPTY_VALUES:
+            return None
+        try:
+            numbers = tuple(map(float, value.split(',')))
+        except ValueError:
+            numbers = ()
+        if len(numbers) != self.count:
+            raise forms.ValidationError(u"give %d numbers, separated by commas" % self.count)
+        return self.check(numbers)
+    
+    def check(self, numbers):
+        return numbers
+    
+    @staticmethod
+    def _check_lat_lng(lat, lng):
+        if not -90 <= lat <= 90:
+            raise forms.ValidationError(u"latitudes must be between -90 and 90")
+        if not -180 <= lng <= 180:
+            raise forms.ValidationError(u"longitudes must be between -180 and 180")
+
+class BoxField(_NumbersField):
+    
+    count = 4
+    
+    def check(self, numbers):
+        (south, west, north, east) = numbers
+        self._check_lat_lng(south, west)
+        self._check_lat_lng(north, east)
+        if south > north:
+            raise forms.ValidationError(u"the south edge must be below the north edge")
+        return numbers
+
+class CircleField(_NumbersField):
+    
+    count = 3
+    
+    def check(self, numbers):
+        (lat, lng, km) = numbers
+        self._check_lat_lng(lat, lng)
+        if km < 0:
+            raise forms.ValidationError(u"the distance can't be negative")
+        return numbers
+
+class CoordinatesQueryField(QueryField):
+    '''\
+    A QueryField for searching Locations by area. Queries use the indexed
+    latitude and longitude fields, rather than the coordinates field itself.
+    '''
+    
+    default_match_options = MatchOptions([
+        MatchOption('box', 'in the box',
+            BoxField(
+                help_text= u"south, west, north, east in decimal degrees, with south and west negative",
+            ),
+        ),
+        MatchOption('circle', 'within',
+            CircleField(
+                help_text= u"km of latitude, longitude, as \u201clatitude, longitude, km\u201d",
+            ),
+        ),
+    ])
+    
+    blank_option = True
+    
+    def query(self, value, prefix=None):
+        if not value is None:
+            lookup_type, lookup_value = value
+            
+            if lookup_type == 'box':
+                (south, west, north, east) = lookup_value
+                return in_box_q(south, west, north, east, prefix)
+            
+            if lookup_type == 'circle':
+                (lat, lng, km) = lookup_value
+                return within_distance_q(lat, lng, km * 1000, prefix)
+            
+            if lookup_type == 'isnull':
+                lookup_fieldname = 'latitude'
+                if not prefix is None:
+                    lookup_fieldname = prefix + '__' + lookup_fieldname
+                return Q(**{lookup_fieldname + '__isnull': lookup_value})
+        
+        return super(CoordinatesQueryField, self).query(value, prefix)
+
 class LocationSearchForm(SearchForm):
     
     _f = Location._meta.get_field('country')
@@ -247,7 +346,22 @@ class LocationSearchForm(SearchForm):
         help_text= _f.help_text,
     )
     
+    _f = Location._meta.get_field('coordinates')
+    coordinates = CoordinatesQueryField(
+        model_field= _f,
+        label= _f.verbose_name.capitalize(),
+        required= False,
+        help_text= u"search for locations in an area",
+    )
+    
     class Meta:
         model = Location
-        exclude = ('id', 'import_notes', 'roughness', 'coordinates')
+        exclude = (
+            'id',
+            'import_notes',
+            'roughness',
+            'coordinates',
+            'latitude',
+            'longitude',
+        )
 
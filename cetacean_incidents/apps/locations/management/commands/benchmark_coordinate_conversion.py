@@ -0,0 +1,60 @@
+from optparse import make_option
+import random
+import time
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from cetacean_incidents.apps.locations import utils
+
+def _timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return (time.time() - start, result)
+
+class Command(BaseCommand):
+    help = 'Times converting coordinates one at a time against the batch conversion functions in locations.utils, and checks that they give the same results.'
+    
+    option_list = BaseCommand.option_list + (
+        make_option('--count',
+            type= 'int',
+            dest= 'count',
+            default= 100000,
+            help= 'How many coordinate pairs to convert.',
+        ),
+    )
+    
+    def handle(self, **options):
+        rand = random.Random(46)
+        coordinates = [
+            u'%r,%r' % (rand.uniform(-90, 90), rand.uniform(-180, 180))
+            for i in range(options['count'])
+        ]
+        
+        if utils.numpy is None:
+            print "NumPy isn't installed; parse_coordinates_many won't use it."
+        
+        # each value is converted in turn, so that each conversion's input is
+        # the last one's output
+        values = [c.split(',')[0] for c in coordinates]
+        for name, single, many in (
+            ('parse_coordinates', utils.parse_coordinates, utils.parse_coordinates_many),
+            ('normalize_coordinates', utils.normalize_coordinates, utils.normalize_coordinates_many),
+            ('dec_to_dms', utils.dec_to_dms, utils.dec_to_dms_many),
+            ('dms_to_dec', utils.dms_to_dec, utils.dms_to_dec_many),
+        ):
+            if name in ('parse_coordinates', 'normalize_coordinates'):
+                args = coordinates
+            else:
+                args = values
+            
+            single_time, single_results = _timed(lambda: map(single, args))
+            many_time, many_results = _timed(many, args)
+            if single_results != many_results:
+                raise CommandError("%s_many gave different results" % name)
+            print "%s: %.3fs one at a time, %.3fs in one batch" % (name, single_time, many_time)
+            
+            if name == 'dec_to_dms':
+                values = many_results
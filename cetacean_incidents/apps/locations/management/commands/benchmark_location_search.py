@@ -0,0 +1,121 @@
+from optparse import make_option
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import (
+    connection,
+    transaction,
+)
+
+from cetacean_incidents.apps.locations.models import (
+    in_box_q,
+    Location,
+    within_distance_q,
+)
+
+def _insert_locations(count, rand):
+    # one executemany, since saving 100k Locations one at a time would take
+    # longer than the searches being measured
+    fields = [Location._meta.get_field(f) for f in (
+        'description',
+        'waters',
+        'coordinates',
+        'latitude',
+        'longitude',
+        'import_notes',
+    )]
+    rows = []
+    for i in range(count):
+        # roughly the western North Atlantic
+        lat = rand.uniform(20, 50)
+        lng = rand.uniform(-85, -55)
+        rows.append((u'', 0, u'%s,%s' % (lat, lng), lat, lng, u''))
+    
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(Location._meta.db_table),
+        ', '.join([qn(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields)),
+    )
+    connection.cursor().executemany(sql, rows)
+
+def _scan_box(south, west, north, east):
+    # what a box search took before: parse every Location's coordinates
+    pks = []
+    for pk, coordinates in Location.objects.values_list('pk', 'coordinates').iterator():
+        if not coordinates:
+            continue
+        lat, lng = map(float, coordinates.split(','))
+        if south <= lat <= north and west <= lng <= east:
+            pks.append(pk)
+    return pks
+
+def _timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return (time.time() - start, result)
+
+class Command(BaseCommand):
+    help = 'Times searching locations by area with the latitude and longitude indexes, against parsing every location\'s coordinates. The test locations are added inside a transaction that\'s rolled back afterwards.'
+    
+    option_list = BaseCommand.option_list + (
+        make_option('--count',
+            type= 'int',
+            dest= 'count',
+            default= 100000,
+            help= 'How many locations to add for the test.',
+        ),
+        make_option('--searches',
+            type= 'int',
+            dest= 'searches',
+            default= 20,
+            help= 'How many areas to search for.',
+        ),
+    )
+    
+    def handle(self, **options):
+        rand = random.Random(44)
+        
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            elapsed, result = _timed(_insert_locations, options['count'], rand)
+            print "inserted %d locations in %.2fs" % (options['count'], elapsed)
+            
+            totals = {
+                'scan': 0.0,
+                'box': 0.0,
+                'circle': 0.0,
+            }
+            for i in range(options['searches']):
+                south = rand.uniform(20, 49)
+                west = rand.uniform(-85, -56)
+                box = (south, west, south + 1, west + 1)
+                
+                elapsed, scanned = _timed(_scan_box, *box)
+                totals['scan'] += elapsed
+                
+                elapsed, found = _timed(lambda: list(
+                    Location.objects.filter(in_box_q(*box)).values_list('pk', flat=True)
+                ))
+                totals['box'] += elapsed
+                if set(found) != set(scanned):
+                    print "box %r: the index found %d locations, the scan %d" % (box, len(found), len(scanned))
+                
+                elapsed, found = _timed(lambda: list(
+                    Location.objects.filter(
+                        within_distance_q(south + 0.5, west + 0.5, 50000)
+                    ).values_list('pk', flat=True)
+                ))
+                totals['circle'] += elapsed
+            
+            for name, description in (
+                ('scan', 'parsing coordinates'),
+                ('box', 'box search'),
+                ('circle', '50 km circle search'),
+            ):
+                print "%s: %.4fs per search" % (description, totals[name] / options['searches'])
+        finally:
+            transaction.rollback()
+            transaction.leave_transaction_management()
@@ -0,0 +1,11 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from cetacean_incidents.apps.locations.models import update_all_lat_lng
+
+class Command(NoArgsCommand):
+    help = 'Sets the numeric latitude and longitude of every location from its coordinates. Run this after adding those columns to an existing database.'
+    
+    def handle_noargs(self, **options):
+        count = transaction.commit_on_success(update_all_lat_lng)()
+        print "%d locations updated" % count
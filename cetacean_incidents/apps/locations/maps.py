@@ -0,0 +1,411 @@
+'''\
+Drawing small maps of Locations on the server, instead of having browsers
+fetch them from an outside map service. Maps are in the Web Mercator
+projection, with each marker's roughness drawn as a circle around it, over a
+base layer of land polygons read from a GeoJSON file. By default that's the
+low-resolution Natural Earth land layer in data/, but
+settings.MAP_COASTLINE_FILE can name a more detailed one, or be None for maps
+with just a grid of latitude and longitude lines.
+
+Rendered maps are kept on disk, named by a hash of their markers, size, zoom,
+and land layer, so each map is only drawn once. That hash is also in the map's
+URL, so browsers can cache maps indefinitely. Drawing them needs PIL.
+'''
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
+import math
+import os
+from os import path
+from urllib import urlencode
+
+try:
+    from PIL import (
+        Image,
+        ImageDraw,
+    )
+except ImportError:
+    try:
+        import Image
+        import ImageDraw
+    except ImportError:
+        Image = None
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+from utils import EARTH_RADIUS
+
+# bump this whenever the drawing changes, so that cached maps are redrawn
+RENDER_VERSION = 1
+
+# the zoom used for a single marker, and the most used for several
+DEFAULT_ZOOM = 6
+# the edge length of a Web Mercator tile at zoom 0, in pixels
+TILE_SIZE = 256
+# how many pixels to leave between the outermost markers and the map's edges
+MARGIN = 12
+# the largest allowed map, in pixels
+MAX_SIZE = (640, 640)
+# how many decimal places of the coordinates are kept; 6 is about 10 cm
+COORDINATE_PLACES = 6
+
+OCEAN_COLOR = (168, 200, 230)
+LAND_COLOR = (234, 228, 206)
+COAST_COLOR = (150, 140, 110)
+GRID_COLOR = (140, 170, 200)
+MARKER_COLOR = (255, 220, 0)
+MARKER_OUTLINE_COLOR = (0, 0, 0)
+ROUGHNESS_COLOR = (200, 60, 40)
+MARKER_RADIUS = 4
+
+# Web Mercator can't show the poles
+MAX_LATITUDE = 85.0511
+
+_maps_dir = path.join(settings.MEDIA_ROOT, 'maps')
+
+# Natural Earth's 1:110m land polygons (public domain), with the coordinates
+# rounded to hundredths of a degree
+DEFAULT_COASTLINE_FILE = path.join(
+    path.dirname(__file__),
+    'data',
+    'ne_110m_land.json',
+)
+
+def can_render():
+    '''\
+    Returns True if maps can be drawn (i.e. PIL is installed).
+    '''
+
+    return Image is not None
+
+def _coastline_file():
+    return getattr(settings, 'MAP_COASTLINE_FILE', DEFAULT_COASTLINE_FILE)
+
+def _coastline_source():
+    # the coastline file and its modification time, or None for each if there
+    # isn't one
+    coastline = _coastline_file()
+    coastline_mtime = None
+    if coastline and path.exists(coastline):
+        coastline_mtime = int(os.stat(coastline).st_mtime)
+    return (coastline, coastline_mtime)
+
+# the land polygons, loaded the first time they're needed: a list of
+# (<bounding box>, <ring>) tuples, where the bounding box is (west, south,
+# east, north) and the ring is a list of (<lng>, <lat>) points
+_land = None
+# the _coastline_source() _land was loaded from
+_land_source = None
+
+def _rings(geometry):
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return geometry['coordinates']
+    if geometry['type'] == 'MultiPolygon':
+        rings = []
+        for polygon in geometry['coordinates']:
+            rings.extend(polygon)
+        return rings
+    if geometry['type'] == 'GeometryCollection':
+        rings = []
+        for g in geometry['geometries']:
+            rings.extend(_rings(g))
+        return rings
+    return []
+
+def _load_land():
+    global _land, _land_source
+    source = _coastline_source()
+    if _land is not None and _land_source == source:
+        return _land
+
+    _land = []
+    _land_source = source
+    filename, mtime = source
+    if mtime is None:
+        return _land
+
+    f = open(filename)
+    try:
+        data = json.load(f)
+    finally:
+        f.close()
+
+    if data['type'] == 'FeatureCollection':
+        geometries = [feature['geometry'] for feature in data['features']]
+    elif data['type'] == 'Feature':
+        geometries = [data['geometry']]
+    else:
+        geometries = [data]
+
+    for geometry in geometries:
+        for ring in _rings(geometry):
+            points = [(p[0], p[1]) for p in ring]
+            if len(points) < 3:
+                continue
+            lngs = [p[0] for p in points]
+            lats = [p[1] for p in points]
+            _land.append(((min(lngs), min(lats), max(lngs), max(lats)), points))
+
+    return _land
+
+def _world_size(zoom):
+    return TILE_SIZE * (2 ** zoom)
+
+def _project(lat, lng, zoom):
+    # returns the (x, y) world pixel coordinates of the point
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    size = _world_size(zoom)
+    x = (lng + 180.0) / 360.0 * size
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * size
+    return (x, y)
+
+def _unproject(x, y, zoom):
+    # returns the (lat, lng) of world pixel coordinates
+    size = _world_size(zoom)
+    lng = x / size * 360.0 - 180.0
+    n = math.pi - 2 * math.pi * y / size
+    lat = math.degrees(math.atan(math.sinh(n)))
+    return (lat, lng)
+
+def _meters_per_pixel(lat, zoom):
+    return (
+        math.cos(math.radians(lat)) * 2 * math.pi * EARTH_RADIUS
+        / _world_size(zoom)
+    )
+
+def normalize_markers(markers):
+    '''\
+    Given an iterable of (<lat>, <lng>, <roughness>) tuples, where roughness
+    may be None, returns a sorted tuple of them with duplicates removed and the
+    coordinates rounded, so that the same set of markers always makes the same
+    map.
+    '''
+
+    result = set()
+    for lat, lng, roughness in markers:
+        lat = round(float(lat), COORDINATE_PLACES)
+        lng = round(float(lng), COORDINATE_PLACES)
+        if roughness is not None:
+            roughness = round(float(roughness))
+        result.add((lat, lng, roughness))
+    return tuple(sorted(result))
+
+def _center(markers, zoom):
+    xs = []
+    ys = []
+    for lat, lng, roughness in markers:
+        x, y = _project(lat, lng, zoom)
+        xs.append(x)
+        ys.append(y)
+    return ((min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2)
+
+def fit_zoom(markers, size):
+    '''\
+    Returns the highest zoom, no higher than DEFAULT_ZOOM, at which all the
+    given markers fit in a map of the given (<width>, <height>) size.
+    '''
+
+    width, height = size
+    for zoom in range(DEFAULT_ZOOM, -1, -1):
+        xs = []
+        ys = []
+        for lat, lng, roughness in markers:
+            x, y = _project(lat, lng, zoom)
+            xs.append(x)
+            ys.append(y)
+        if (
+            max(xs) - min(xs) <= width - 2 * MARGIN
+            and max(ys) - min(ys) <= height - 2 * MARGIN
+        ):
+            return zoom
+    return 0
+
+def parse_size(size):
+    '''\
+    Given a size as a u'<width>x<height>' string, returns a (<width>,
+    <height>) tuple. Raises ValueError if it's malformed or bigger than
+    MAX_SIZE.
+    '''
+
+    width, height = map(int, size.split('x'))
+    if not (0 < width <= MAX_SIZE[0] and 0 < height <= MAX_SIZE[1]):
+        raise ValueError("map size out of range: %s" % size)
+    return (width, height)
+
+def map_query_url(markers, size, zoom):
+    '''\
+    Returns the URL of the location_map view for the given normalized markers,
+    size, and zoom. The URL includes the map's map_key, so that it changes
+    whenever the map would be drawn differently.
+    '''
+
+    params = []
+    for lat, lng, roughness in markers:
+        if roughness is None:
+            roughness = u''
+        else:
+            roughness = u'%d' % roughness
+        params.append(('m', u'%r,%r,%s' % (lat, lng, roughness)))
+    params.append(('size', u'%dx%d' % size))
+    params.append(('zoom', zoom))
+    params.append(('key', map_key(markers, size, zoom)))
+    return reverse('location_map') + '?' + urlencode(params)
+
+def parse_map_query(query):
+    '''\
+    The inverse of map_query_url: given the QueryDict of its GET string,
+    returns a (<markers>, <size>, <zoom>) tuple. Raises ValueError if any of
+    them are malformed. The 'key' parameter is ignored; see location_map.
+    '''
+
+    markers = []
+    for m in query.getlist('m'):
+        lat, lng, roughness = m.split(',')
+        if roughness == u'':
+            roughness = None
+        markers.append((float(lat), float(lng), roughness))
+    if not markers:
+        raise ValueError("no markers")
+    markers = normalize_markers(markers)
+
+    size = parse_size(query.get('size', u''))
+    zoom = int(query.get('zoom', u''))
+    if not 0 <= zoom <= DEFAULT_ZOOM:
+        raise ValueError("zoom out of range: %d" % zoom)
+    return (markers, size, zoom)
+
+def map_key(markers, size, zoom):
+    '''\
+    Returns the name the map with the given normalized markers, size, and zoom
+    is cached under.
+    '''
+
+    coastline, coastline_mtime = _coastline_source()
+    key = repr((RENDER_VERSION, coastline, coastline_mtime, markers, size, zoom))
+    return sha1(key).hexdigest()
+
+def _draw_land(draw, origin, size, zoom):
+    width, height = size
+    ox, oy = origin
+    # the bounds of the map, to skip the polygons that aren't on it
+    north, west = _unproject(ox, oy, zoom)
+    south, east = _unproject(ox + width, oy + height, zoom)
+
+    for (r_west, r_south, r_east, r_north), ring in _load_land():
+        if r_east < west or r_west > east or r_north < south or r_south > north:
+            continue
+        points = []
+        for lng, lat in ring:
+            x, y = _project(lat, lng, zoom)
+            points.append((x - ox, y - oy))
+        draw.polygon(points, fill=LAND_COLOR, outline=COAST_COLOR)
+
+def _grid_step(zoom):
+    # degrees between grid lines
+    if zoom >= 7:
+        return 1
+    if zoom >= 5:
+        return 5
+    if zoom >= 3:
+        return 10
+    return 30
+
+def _draw_grid(draw, origin, size, zoom):
+    width, height = size
+    ox, oy = origin
+    north, west = _unproject(ox, oy, zoom)
+    south, east = _unproject(ox + width, oy + height, zoom)
+    step = _grid_step(zoom)
+
+    lng = int(math.floor(west / step)) * step
+    while lng <= east:
+        x, y = _project(0, lng, zoom)
+        draw.line([(x - ox, 0), (x - ox, height)], fill=GRID_COLOR)
+        lng += step
+
+    lat = int(math.floor(south / step)) * step
+    while lat <= north:
+        x, y = _project(lat, 0, zoom)
+        draw.line([(0, y - oy), (width, y - oy)], fill=GRID_COLOR)
+        lat += step
+
+def render(markers, size, zoom):
+    '''\
+    Returns a PIL Image of a map with the given normalized markers, of the
+    given (<width>, <height>) size, at the given zoom.
+    '''
+
+    width, height = size
+    cx, cy = _center(markers, zoom)
+    origin = (cx - width / 2.0, cy - height / 2.0)
+    ox, oy = origin
+
+    img = Image.new('RGB', size, OCEAN_COLOR)
+    draw = ImageDraw.Draw(img)
+    _draw_land(draw, origin, size, zoom)
+    _draw_grid(draw, origin, size, zoom)
+
+    # all the roughness circles first, so that they don't cover any markers
+    for lat, lng, roughness in markers:
+        if not roughness:
+            continue
+        x, y = _project(lat, lng, zoom)
+        r = roughness / _meters_per_pixel(lat, zoom)
+        if r < MARKER_RADIUS:
+            continue
+        x -= ox
+        y -= oy
+        draw.ellipse((x - r, y - r, x + r, y + r), outline=ROUGHNESS_COLOR)
+
+    for lat, lng, roughness in markers:
+        x, y = _project(lat, lng, zoom)
+        x -= ox
+        y -= oy
+        r = MARKER_RADIUS
+        draw.ellipse(
+            (x - r, y - r, x + r, y + r),
+            fill= MARKER_COLOR,
+            outline= MARKER_OUTLINE_COLOR,
+        )
+
+    return img
+
+def map_file(markers, size, zoom):
+    '''\
+    Returns the path to the PNG file of the map with the given normalized
+    markers, size, and zoom, drawing it if it hasn't been drawn before.
+    Returns None if maps can't be drawn.
+    '''
+
+    if not can_render() or not markers:
+        return None
+
+    name = map_key(markers, size, zoom)
+    map_dir = path.join(_maps_dir, name[:2])
+    map_path = path.join(map_dir, name + '.png')
+
+    if not path.exists(map_path):
+        for d in (_maps_dir, map_dir):
+            if not path.isdir(d):
+                try:
+                    os.mkdir(d)
+                except OSError:
+                    # made by another request in the meantime
+                    pass
+        # write to a temporary name first, so other requests never see a
+        # partial map
+        tmp_path = map_path + '.%d.tmp' % os.getpid()
+        render(markers, size, zoom).save(tmp_path, 'PNG')
+        os.rename(tmp_path, map_path)
+
+    return map_path
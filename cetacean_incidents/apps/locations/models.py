@@ -2,19 +2,31 @@
 
 from decimal import Decimal
 import operator
-import re
 
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 
 from cetacean_incidents.apps.countries.models import Country
 
+from cetacean_incidents.apps.clean_cache.stamps import register_global
+
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
 from utils import (
-    dec_to_dms,
-    dms_to_dec,
+    bounding_box,
+    dec_to_dms_many,
+    distance,
+    dms_to_dec_many,
+    normalize_coordinates,
+    parse_coordinates,
+    parse_coordinates_many,
 )
 
+# how many ids to put in each IN clause, since some databases limit the number
+# of items in one
+PK_CHUNK_SIZE = 1000
+
 # although Django's contrib.localflavor module would seem to work here, it's
 # really intended as a field for addresses. It includes a lot of states we don't
 # need (they have no marine waters, and as of Django 1.3, includes military
@@ -128,7 +140,7 @@ class Location(models.Model):
     def _get_dms_coords_pair(self):
         if self.coordinates is None:
             return None
-        return tuple(map( dec_to_dms, self.coords_pair))
+        return tuple(dec_to_dms_many(self.coords_pair))
     def _set_dms_coords_pair(self, pair):
         if not pair:
             self.coords_pair = None
@@ -136,29 +148,50 @@ class Location(models.Model):
         if not len(pair) >= 2:
             # TODO throw an exception?
             return
-        self.coords_pair = map(dms_to_dec, pair)
+        self.coords_pair = dms_to_dec_many(pair)
     dms_coords_pair = property(_get_dms_coords_pair, _set_dms_coords_pair)
     
+    # 'coordinates' as numbers, so that locations can be searched by area with
+    # an index instead of parsing every row. These are only ever set by save(),
+    # from 'coordinates'. See in_box_q and within_distance_q.
+    latitude = models.FloatField(
+        blank= True,
+        null= True,
+        editable= False,
+        db_index= True,
+    )
+    longitude = models.FloatField(
+        blank= True,
+        null= True,
+        editable= False,
+        db_index= True,
+    )
+    
+    def update_lat_lng(self):
+        '''\
+        Sets latitude and longitude from coordinates. Returns True if they
+        changed.
+        '''
+        
+        lat_lng = None
+        if self.coordinates:
+            lat_lng = parse_coordinates(self.coordinates)
+        if lat_lng is None:
+            lat_lng = (None, None)
+        
+        changed = (self.latitude, self.longitude) != lat_lng
+        self.latitude, self.longitude = lat_lng
+        return changed
+    
     def clean(self):
         # clean_coordinates
         if not self.coordinates:
             self.coordinates = ''
         else:
-            (lat, lng) = re.search("(-?[\d\.]+)\s*,\s*(-?[\d\.]+)", self.coordinates).group(1, 2)
-
-            lat = Decimal(lat)
-            lat = max(lat, -90)
-            lat = min(lat, 90)
-            
-            lng = Decimal(lng)
-            # add 180 so that 179 E is now 359 E and 180 W is zero
-            lng += 180
-            # take it mod 360
-            lng %= 360
-            # and subtract the 180 back off
-            lng -= 180
-            
-            self.coordinates = "%s,%s" % (lat,lng)
+            try:
+                self.coordinates = normalize_coordinates(self.coordinates)
+            except ValueError, e:
+                raise ValidationError(unicode(e))
     
     # TODO validation will be essential for this field!
     roughness = models.FloatField(
@@ -183,6 +216,10 @@ class Location(models.Model):
             bool(self.coordinates),
         ))
     
+    def save(self, *args, **kwargs):
+        self.update_lat_lng()
+        return super(Location, self).save(*args, **kwargs)
+    
     def __unicode__(self):
         if self.coordinates:
             return unicode(self.coordinates)
@@ -191,3 +228,89 @@ class Location(models.Model):
     
 guard_deletes(Country, Location, 'country')
 
+register_global(Country)
+
+def _lookup(prefix, name):
+    if prefix is None:
+        return name
+    return prefix + '__' + name
+
+def in_box_q(south, west, north, east, prefix=None):
+    '''\
+    Returns a Q object for the Locations with coordinates in the given box, in
+    decimal degrees. If west is greater than east, the box is taken to cross
+    the 180th meridian. The prefix is for filtering other models by their
+    Locations, as in QueryField.query.
+    '''
+    
+    q = Q(**{
+        _lookup(prefix, 'latitude__gte'): south,
+        _lookup(prefix, 'latitude__lte'): north,
+    })
+    if west <= east:
+        q &= Q(**{
+            _lookup(prefix, 'longitude__gte'): west,
+            _lookup(prefix, 'longitude__lte'): east,
+        })
+    else:
+        q &= (
+            Q(**{_lookup(prefix, 'longitude__gte'): west})
+            | Q(**{_lookup(prefix, 'longitude__lte'): east})
+        )
+    return q
+
+def within_distance_q(latitude, longitude, meters, prefix=None):
+    '''\
+    Returns a Q object for the Locations with coordinates within the given
+    number of meters of the given point. Making it takes one query: the
+    Locations in the bounding-box of the circle are fetched with the index,
+    and only the ones actually in the circle are kept.
+    '''
+    
+    candidates = Location.objects.filter(
+        in_box_q(*bounding_box(latitude, longitude, meters))
+    ).values_list('pk', 'latitude', 'longitude')
+    pks = [
+        pk for pk, lat, lng in candidates
+        if distance(latitude, longitude, lat, lng) <= meters
+    ]
+    
+    # note that an empty list matches nothing
+    q = Q(**{_lookup(prefix, 'pk__in'): pks[:PK_CHUNK_SIZE]})
+    for i in range(PK_CHUNK_SIZE, len(pks), PK_CHUNK_SIZE):
+        q |= Q(**{_lookup(prefix, 'pk__in'): pks[i:i + PK_CHUNK_SIZE]})
+    return q
+
+def update_all_lat_lng():
+    '''\
+    Brings the latitude and longitude of every Location up-to-date with its
+    coordinates, for Locations saved before those fields existed or changed
+    without save(). Returns the number of Locations that were updated.
+    '''
+    
+    def _update(rows):
+        count = 0
+        pairs = parse_coordinates_many([row[1] for row in rows])
+        for (pk, coordinates, lat, lng), pair in zip(rows, pairs):
+            if pair is None:
+                pair = (None, None)
+            if (lat, lng) != pair:
+                Location.objects.filter(pk=pk).update(
+                    latitude= pair[0],
+                    longitude= pair[1],
+                )
+                count += 1
+        return count
+    
+    count = 0
+    rows = []
+    for row in Location.objects.values_list(
+        'pk', 'coordinates', 'latitude', 'longitude',
+    ).iterator():
+        rows.append(row)
+        if len(rows) == PK_CHUNK_SIZE:
+            count += _update(rows)
+            rows = []
+    count += _update(rows)
+    return count
+
@@ -1,10 +1,9 @@
-from urllib import urlencode, quote
-
 from django import template
-from django.conf import settings
 
 from cetacean_incidents.apps.generic_templates.templatetags.generic_field_display import display_row
 
+from cetacean_incidents.apps.locations import maps
+
 register = template.Library()
 
 @register.inclusion_tag('locations/display_coord_dec_row.html')
@@ -41,11 +40,48 @@ def display_coord_dms_row(location, lat_or_lng):
     
     return context
 
+def _markers(obj):
+    # returns a list of (<lat>, <lng>, <roughness>) tuples for the Locations
+    # of the given object
+    
+    from cetacean_incidents.apps.locations.models import Location
+    
+    if isinstance(obj, Location):
+        try:
+            pair = obj.coords_pair
+        except ValueError:
+            pair = None
+        if not pair:
+            return []
+        return [(pair[0], pair[1], obj.roughness)]
+    
+    from cetacean_incidents.apps.incidents.models import Observation
+    
+    if isinstance(obj, Observation):
+        return _markers(obj.location)
+    
+    # Cases and Animals
+    if hasattr(obj, 'observation_set'):
+        return list(Location.objects.filter(
+            observation__in= obj.observation_set.all(),
+            latitude__isnull= False,
+        ).values_list('latitude', 'longitude', 'roughness'))
+    
+    try:
+        objs = iter(obj)
+    except TypeError:
+        raise TypeError("can't map a %s" % type(obj))
+    markers = []
+    for o in objs:
+        markers += _markers(o)
+    return markers
+
 @register.simple_tag
 def map_url(obj, size=u'200x150'):
     '''\
-    Returns a url of a map image with a marker or markers for the location
-    indicated by the argument.
+    Returns the url of a map image with a marker or markers for the location
+    indicated by the argument, or an empty string if there's nothing to map or
+    maps can't be drawn. See maps.py.
     
     Given a Location, uses location's coordinates.
     
@@ -58,40 +94,27 @@ def map_url(obj, size=u'200x150'):
     Given an iterable of any of the above, uses all of them.
     '''
     
-    map_base = u'https://maps.google.com/maps/api/staticmap?'
-    marker_base = u'http://chart.apis.google.com/chart?'
+    if not maps.can_render():
+        return u''
     
-    from cetacean_incidents.apps.locations.models import Location
-
-    if isinstance(obj, Location):
-        return map_base + urlencode({
-            'center': obj.coordinates,
-            'zoom': 6,
-            'size': size,
-            'maptype': u'terrain',
-            'markers': (u'size:small|color:yellow|%s' % obj.coordinates,),
-            'sensor': u'false',
-        }, doseq=True)
+    markers = maps.normalize_markers(_markers(obj))
+    if not markers:
+        return u''
     
-    from cetacean_incidents.apps.incidents.models import Observation
+    size = maps.parse_size(size)
+    if len(markers) == 1:
+        zoom = maps.DEFAULT_ZOOM
+    else:
+        zoom = maps.fit_zoom(markers, size)
+    
+    return maps.map_query_url(markers, size, zoom)
 
-    if isinstance(obj, Observation):
-        loc = obj.location
-        marker_url = marker_base + urlencode({
-            'chst': u'd_map_xpin_icon',
-            'chld': u'pin|aquarium|ADDE63',
-        })
-        print marker_url
-        map_url = map_base + urlencode({
-            'center': loc.coordinates,
-            'zoom': 6,
-            'sensor': u'false',
-            'language': settings.LANGUAGE_CODE,
-            'maptype': u'terrain',
-            'size': size,
-            'markers': u'icon:%s|%s' % (marker_url, loc.coordinates),
-        })
-        print map_url
-        return map_url
-    
-    raise NotImplementedError
+@register.inclusion_tag('locations/map_img.html')
+def map_img(obj, size=u'200x150'):
+    '''\
+    Renders an img element for map_url, or nothing if there's no map.
+    '''
+    
+    return {
+        'url': map_url(obj, size),
+    }
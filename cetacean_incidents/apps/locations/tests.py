@@ -4,7 +4,13 @@ from django.test import TestCase
 
 from utils import (
     dms_to_dec,
+    dms_to_dec_many,
     dec_to_dms,
+    dec_to_dms_many,
+    normalize_coordinates,
+    normalize_coordinates_many,
+    parse_coordinates,
+    parse_coordinates_many,
 )
 
 class UtilsTestCase(TestCase):
@@ -15,6 +21,25 @@ class UtilsTestCase(TestCase):
             dms_to_dec((False, 32, 19, 24.04)).quantize(D('0.000001')),
             (D('32') + (D('19') / 60) + (D('24.04') / (60 * 60))).quantize(D('0.000001'))
         )
+    
+    def testMany(self):
+        decs = [D('-70.5'), D('42.323342'), 71.5, 0, D('-0.0000001')]
+        self.assertEquals(dec_to_dms_many(decs), map(dec_to_dms, decs))
+        
+        dmss = [(True, 70, 30, 0), (False, 32, 19, 24.04)] + map(dec_to_dms, decs)
+        self.assertEquals(dms_to_dec_many(dmss), map(dms_to_dec, dmss))
+        
+        coordinates = [u'42.36,-71.06', u'', u'1,2,3', u'north', u' 4 , 5e1', u'-95,190']
+        self.assertEquals(
+            parse_coordinates_many(coordinates),
+            [parse_coordinates(c) if c else None for c in coordinates],
+        )
+        self.assertEquals(parse_coordinates_many(coordinates)[4], (4.0, 50.0))
+        self.assertEquals(
+            normalize_coordinates_many(coordinates[:1] + coordinates[-1:]),
+            map(normalize_coordinates, coordinates[:1] + coordinates[-1:]),
+        )
+        self.assertEquals(normalize_coordinates(u'-95,190'), '-90,-170')
 
 from models import Location
 
@@ -63,3 +88,111 @@ class NiceLocationFormTestCase(TestCase):
         })
         loc = form.save()
 
+
+from models import (
+    in_box_q,
+    within_distance_q,
+)
+from utils import (
+    bounding_box,
+    distance,
+)
+
+class AreaSearchTestCase(TestCase):
+    def setUp(self):
+        self.boston = Location.objects.create(coordinates='42.36,-71.06')
+        self.provincetown = Location.objects.create(coordinates='42.05,-70.19')
+        self.fiji = Location.objects.create(coordinates='-17.8,179.9')
+        self.nowhere = Location.objects.create()
+    
+    def _search(self, q):
+        return set(Location.objects.filter(q).values_list('pk', flat=True))
+    
+    def testSave(self):
+        self.assertEquals(self.boston.latitude, 42.36)
+        self.assertEquals(self.boston.longitude, -71.06)
+        self.assertEquals(self.nowhere.latitude, None)
+        
+        self.boston.coordinates = ''
+        self.boston.save()
+        self.assertEquals(Location.objects.get(pk=self.boston.pk).latitude, None)
+    
+    def testDistance(self):
+        # about 80 km
+        d = distance(42.36, -71.06, 42.05, -70.19)
+        self.assertEquals(78000 < d < 80000, True)
+        
+        (south, west, north, east) = bounding_box(0, 179.9, 50000)
+        self.assertEquals(west > east, True)
+    
+    def testBox(self):
+        self.assertEquals(
+            self._search(in_box_q(42, -72, 43, -70)),
+            set([self.boston.pk, self.provincetown.pk]),
+        )
+        # across the 180th meridian
+        self.assertEquals(
+            self._search(in_box_q(-20, 179, -15, -179)),
+            set([self.fiji.pk]),
+        )
+    
+    def testCircle(self):
+        self.assertEquals(
+            self._search(within_distance_q(42.36, -71.06, 50000)),
+            set([self.boston.pk]),
+        )
+        self.assertEquals(
+            self._search(within_distance_q(42.36, -71.06, 100000)),
+            set([self.boston.pk, self.provincetown.pk]),
+        )
+
+from django.conf import settings
+from django.http import QueryDict
+
+import maps
+
+class MapsTestCase(TestCase):
+    def testQueryRoundTrip(self):
+        markers = maps.normalize_markers([
+            (42.36, -71.06, 1000),
+            (42.05, -70.19, None),
+            (42.05, -70.19, None),
+        ])
+        self.assertEquals(len(markers), 2)
+        
+        url = maps.map_query_url(markers, (200, 150), 6)
+        query = QueryDict(url.split('?', 1)[1])
+        self.assertEquals(maps.parse_map_query(query), (markers, (200, 150), 6))
+        
+        self.assertRaises(ValueError, maps.parse_size, u'2000x150')
+    
+    def testFitZoom(self):
+        near = maps.normalize_markers([
+            (42.36, -71.06, None),
+            (42.05, -70.19, None),
+        ])
+        far = maps.normalize_markers([
+            (42.36, -71.06, None),
+            (25.77, -80.19, None),
+        ])
+        self.assertEquals(maps.fit_zoom(near, (200, 150)), maps.DEFAULT_ZOOM)
+        self.assertEquals(maps.fit_zoom(far, (200, 150)) < maps.DEFAULT_ZOOM, True)
+    
+    def testCoastline(self):
+        markers = maps.normalize_markers([(42.36, -71.06, None)])
+        
+        old_file = getattr(settings, 'MAP_COASTLINE_FILE', maps.DEFAULT_COASTLINE_FILE)
+        try:
+            settings.MAP_COASTLINE_FILE = maps.DEFAULT_COASTLINE_FILE
+            self.assertEquals(len(maps._load_land()) > 0, True)
+            with_land = maps.map_query_url(markers, (200, 150), 6)
+            
+            settings.MAP_COASTLINE_FILE = None
+            self.assertEquals(maps._load_land(), [])
+            without_land = maps.map_query_url(markers, (200, 150), 6)
+        finally:
+            settings.MAP_COASTLINE_FILE = old_file
+        
+        # a different land layer makes a different URL, so browsers don't keep
+        # showing the old map
+        self.assertNotEquals(with_land, without_land)
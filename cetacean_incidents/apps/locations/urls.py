@@ -0,0 +1,9 @@
+from django.conf.urls.defaults import patterns
+
+import views
+
+urlpatterns = patterns('',
+    (r'^search_json$', views.location_search_json, {}, 'location_search_json'),
+    (r'^map.png$', views.location_map, {}, 'location_map'),
+)
+
@@ -1,5 +1,11 @@
 from decimal import Decimal as D
 import math
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # FYI the unicode code-points for degrees, minutes, seconds are
 # U+00B0 U+2032 U+2033
@@ -38,3 +44,204 @@ def dms_to_dec(dms):
     
     return decimal_degrees
 
+# The *_many functions below do the same conversions for a whole sequence of
+# values in one call, for the places that handle lots of coordinates at once
+# (e.g. updating every Location, or importing a file). Their results are
+# exactly the same as calling the single-value functions on each value. That's
+# why the Decimal conversions aren't done with NumPy: its floats wouldn't round
+# the same way.
+
+_D60 = D('60')
+_D3600 = D('3600')
+
+def _to_decimal(x):
+    # the same as D(unicode(x)), without the round-trip through a string for
+    # Decimals and ints
+    if isinstance(x, D):
+        return x
+    if isinstance(x, (int, long)):
+        return D(x)
+    return D(unicode(x))
+
+def dec_to_dms_many(values):
+    '''\
+    Returns a list of dec_to_dms of each of the given values.
+    '''
+    
+    results = []
+    for value in values:
+        value = _to_decimal(value)
+        negative = bool(value < 0)
+        value = abs(value)
+        degrees = int(value)
+        minutes = int((value * _D60) - (degrees * _D60))
+        seconds = (value * _D60 * _D60) - (degrees * _D60 * _D60) - (minutes * _D60)
+        results.append((negative, degrees, minutes, seconds))
+    return results
+
+def dms_to_dec_many(dmss):
+    '''\
+    Returns a list of dms_to_dec of each of the given (neg,deg,min,sec)
+    tuples.
+    '''
+    
+    results = []
+    for (negative, degrees, minutes, seconds) in dmss:
+        seconds = _to_decimal(seconds)
+        seconds += _to_decimal(minutes) * _D60
+        seconds += _to_decimal(degrees) * _D60 * _D60
+        decimal_degrees = seconds / _D3600
+        if negative: decimal_degrees = - decimal_degrees
+        results.append(decimal_degrees)
+    return results
+
+_coordinates_re = re.compile(r"(-?[\d\.]+)\s*,\s*(-?[\d\.]+)")
+
+def normalize_coordinates(coordinates):
+    '''\
+    Given a u'<lat>,<lng>' string, returns it with the latitude limited to
+    -90 to 90 and the longitude wrapped to -180 to 180, in decimal degrees.
+    Raises ValueError if it can't be parsed.
+    '''
+    
+    match = _coordinates_re.search(coordinates)
+    if not match:
+        raise ValueError("can't parse coordinates: %s" % coordinates)
+    (lat, lng) = match.group(1, 2)
+    
+    lat = D(lat)
+    lat = max(lat, -90)
+    lat = min(lat, 90)
+    
+    lng = D(lng)
+    # add 180 so that 179 E is now 359 E and 180 W is zero
+    lng += 180
+    # take it mod 360
+    lng %= 360
+    # and subtract the 180 back off
+    lng -= 180
+    
+    return "%s,%s" % (lat, lng)
+
+def normalize_coordinates_many(coordinates):
+    '''\
+    Returns a list of normalize_coordinates of each of the given strings,
+    with None for the ones that can't be parsed.
+    '''
+    
+    results = []
+    for c in coordinates:
+        try:
+            results.append(normalize_coordinates(c))
+        except ValueError:
+            results.append(None)
+    return results
+
+def parse_coordinates(coordinates):
+    '''\
+    Given a u'<lat>,<lng>' string, returns a (<lat>, <lng>) tuple of floats,
+    the same as Location.coords_pair, or None if it isn't a pair of numbers.
+    '''
+    
+    try:
+        pair = tuple(map(float, coordinates.split(',')))
+    except ValueError:
+        return None
+    if len(pair) != 2:
+        return None
+    return pair
+
+_number = r'\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*'
+_pair_re = re.compile('^' + _number + ',' + _number + '$')
+
+def parse_coordinates_many(coordinates):
+    '''\
+    Returns a list of parse_coordinates of each of the given strings, with
+    None for the empty ones.
+    
+    If NumPy is available, all the strings are parsed with one call to
+    numpy.fromstring. Both it and float() round to the nearest float, so the
+    results are the same either way.
+    '''
+    
+    coordinates = list(coordinates)
+    if numpy is None:
+        return [c and parse_coordinates(c) or None for c in coordinates]
+    
+    # only the strings that are plainly two numbers are handed to numpy; the
+    # rest get parsed one at a time
+    results = [None] * len(coordinates)
+    batch = []
+    for i, c in enumerate(coordinates):
+        if not c:
+            continue
+        if _pair_re.match(c):
+            batch.append(i)
+        else:
+            results[i] = parse_coordinates(c)
+    if not batch:
+        return results
+    
+    numbers = numpy.fromstring(
+        ','.join([str(coordinates[i]) for i in batch]),
+        sep= ',',
+    )
+    if len(numbers) != 2 * len(batch) or not numpy.isfinite(numbers).all():
+        # one of the strings wasn't a pair of numbers, which numpy doesn't
+        # say. Rather than find it, do them all the slow way.
+        for i in batch:
+            results[i] = parse_coordinates(coordinates[i])
+        return results
+    
+    numbers = numbers.tolist()
+    for j, i in enumerate(batch):
+        results[i] = (numbers[2 * j], numbers[2 * j + 1])
+    return results
+
+
+# the mean radius of the Earth, in meters
+EARTH_RADIUS = 6371009.0
+
+def distance(lat1, lng1, lat2, lng2):
+    '''\
+    Returns the great-circle distance in meters between two points given in
+    decimal degrees, using the haversine formula.
+    '''
+    
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(latitude, longitude, meters):
+    '''\
+    Returns a (south, west, north, east) tuple, in decimal degrees, for the
+    smallest box that contains every point within the given number of meters
+    of the given point. If the box crosses the 180th meridian, west will be
+    greater than east.
+    '''
+    
+    angle = meters / EARTH_RADIUS
+    d_lat = math.degrees(angle)
+    south = latitude - d_lat
+    north = latitude + d_lat
+    
+    # a circle around a pole includes every longitude
+    if south <= -90 or north >= 90:
+        return (max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+    
+    x = math.sin(angle) / math.cos(math.radians(latitude))
+    if x >= 1:
+        return (south, -180.0, north, 180.0)
+    d_lng = math.degrees(math.asin(x))
+    
+    west = longitude - d_lng
+    if west < -180:
+        west += 360
+    east = longitude + d_lng
+    if east > 180:
+        east -= 360
+    return (south, west, north, east)
+
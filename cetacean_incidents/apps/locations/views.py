@@ -0,0 +1,121 @@
+try:
+    import json
+except ImportError:
+    import simplejson as json # for python 2.5 compat.
+
+from django import forms
+from django.core.urlresolvers import reverse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotModified,
+)
+
+from django.contrib.auth.decorators import login_required
+
+import maps
+from forms import (
+    BoxField,
+    CircleField,
+)
+from models import (
+    in_box_q,
+    Location,
+    within_distance_q,
+)
+
+# the most Locations an area search returns
+SEARCH_JSON_LIMIT = 1000
+
+@login_required
+def location_search_json(request):
+    '''\
+    Returns a JSON list of the observations' Locations in an area, given in
+    the GET string as either 'box' (south, west, north, east) or 'circle'
+    (latitude, longitude, km). Each entry has the Location's id, latitude,
+    and longitude, and the id and URL of its observation. Bad or missing
+    areas get a 400 response with the error messages.
+    '''
+    
+    try:
+        if 'box' in request.GET:
+            (south, west, north, east) = BoxField().clean(request.GET['box'])
+            q = in_box_q(south, west, north, east)
+        elif 'circle' in request.GET:
+            (lat, lng, km) = CircleField().clean(request.GET['circle'])
+            q = within_distance_q(lat, lng, km * 1000)
+        else:
+            raise forms.ValidationError(u"give either a 'box' or a 'circle'")
+    except forms.ValidationError, e:
+        return HttpResponse(
+            json.dumps({'errors': e.messages}),
+            mimetype= 'application/json',
+            status= 400,
+        )
+    
+    # only observations' Locations; others (e.g. LocationGearSets) may be
+    # confidential
+    locations = list(Location.objects.filter(q).filter(
+        observation__isnull= False,
+    ).values_list('id', 'latitude', 'longitude')[:SEARCH_JSON_LIMIT])
+    
+    # avoid circular imports
+    from cetacean_incidents.apps.incidents.models import Observation
+    observation_ids = dict(Observation.objects.filter(
+        location__in= [l[0] for l in locations],
+    ).values_list('location', 'id'))
+    
+    entries = []
+    for id, lat, lng in locations:
+        observation_id = observation_ids[id]
+        entries.append({
+            'id': id,
+            'latitude': lat,
+            'longitude': lng,
+            'observation_id': observation_id,
+            'observation_url': reverse('observation_detail', args=[observation_id]),
+        })
+    
+    return HttpResponse(json.dumps(entries), mimetype='application/json')
+
+@login_required
+def location_map(request):
+    '''\
+    Returns the PNG map image described by the GET string, which is made by
+    maps.map_query_url. The image is drawn the first time it's asked for and
+    kept on disk. The GET string includes the map's key, so as long as that's
+    still the current one, the response can be cached by browsers
+    indefinitely.
+    '''
+    
+    try:
+        (markers, size, zoom) = maps.parse_map_query(request.GET)
+    except ValueError, e:
+        return HttpResponseBadRequest(unicode(e))
+    
+    if not maps.can_render():
+        raise Http404
+    
+    key = maps.map_key(markers, size, zoom)
+    etag = '"%s"' % key
+    if etag in [e.strip() for e in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    map_path = maps.map_file(markers, size, zoom)
+    f = open(map_path, 'rb')
+    try:
+        response = HttpResponse(f.read(), content_type='image/png')
+    finally:
+        f.close()
+    response['ETag'] = etag
+    # only logged-in users can see the maps
+    if request.GET.get('key') == key:
+        response['Cache-Control'] = 'private, max-age=31536000'
+    else:
+        # an old URL, from before the land layer or the drawing changed
+        response['Cache-Control'] = 'private, max-age=0'
+    return response
+
@@ -1,11 +1,19 @@
+import logging
+import time
+
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django import forms
 from django.utils.safestring import mark_safe
 
+from relations import (
+    m2m_pks_from,
+    relation_map,
+)
 from templatetags.merge_display import display_merge_row
 
+logger = logging.getLogger(__name__)
+
 class FieldlessModel(models.Model):
     class Meta:
         abstract= True
@@ -26,8 +34,38 @@ class MergeForm(forms.ModelForm):
 
     # TODO could this be a mix-in superclass for ModelForms?
     
-    @staticmethod    
-    def _get_fk_refs_to(instance):
+    def _refs_to(self, instance):
+        '''\
+        Returns the references to the given instance, as returned by
+        RelationMap.refs_to. The references to the source and destination are
+        fetched together, once per form.
+        '''
+        
+        if instance is self.source or instance is self.destination:
+            if self._refs is None:
+                # {<class>: [<pk>, ...]}, so that each relation is only
+                # queried once even if the source and destination are
+                # instances of different classes
+                pks = {}
+                for obj in (self.source, self.destination):
+                    pks.setdefault(obj.__class__, []).append(obj.pk)
+                self._refs = {}
+                for cls, cls_pks in pks.items():
+                    for pk, refs in relation_map(cls).refs_to(cls_pks).items():
+                        self._refs[(cls, pk)] = refs
+            key = (instance.__class__, instance.pk)
+            if key in self._refs:
+                return self._refs[key]
+        
+        # allow passing in of unsaved instances
+        return relation_map(instance.__class__).refs_to([instance.pk]).get(instance.pk, {
+            'fk': {},
+            'o2o': {},
+            'parent_links': {},
+            'm2m': {},
+        })
+    
+    def _get_fk_refs_to(self, instance):
         '''\
         Get every instance with a ForeignKey field (that isn't a OneToOneField) that refers to the given instance. Return is of the form: 
         {
@@ -37,31 +75,9 @@ class MergeForm(forms.ModelForm):
         }
         '''
         
-        results = {}
-        def _results_add(other_model, other_instance, other_field):
-            # It's important to store only the primary key since we 
-            # don't want to have multiple in-memory instances of the same
-            # object in the database
-            pk = other_instance.pk
-            if not other_model in results:
-                results[other_model] = {}
-            if not pk in results[other_model]:
-                results[other_model][pk] = []
-            results[other_model][pk].append(other_field)
-        
-        for ro in instance._meta.get_all_related_objects():
-            # note that OneToOneFields are also ForeignKeys
-            if isinstance(ro.field, models.OneToOneField):
-                continue
-
-            other_queryset = getattr(instance, ro.get_accessor_name())
-            for other_instance in other_queryset.all():
-                _results_add(ro.model, other_instance, ro.field)
-        
-        return results
+        return self._refs_to(instance)['fk']
     
-    @staticmethod
-    def _get_other_model_o2o_refs_to(instance):
+    def _get_other_model_o2o_refs_to(self, instance):
         '''\
         Get every instance that isn't of the same model as the given instance, and has a OneToOneField that refers to the given instance. Return is of the form:
         {
@@ -71,46 +87,20 @@ class MergeForm(forms.ModelForm):
         }
         '''
         
-        results = {}
-        def _results_add(other_model, other_instance, other_field):
-            # It's important to store only the primary key since we 
-            # don't want to have multiple in-memory instances of the same
-            # object in the database
-            pk = other_instance.pk
-            if not other_model in results:
-                results[other_model] = {}
-            if not pk in results[other_model]:
-                results[other_model][pk] = []
-            results[other_model][pk].append(other_field)        
-        
-        for ro in instance._meta.get_all_related_objects():
-            if not isinstance(ro.field, models.OneToOneField):
-                continue
-            # TODO this test really belongs in MergeForm.__init__
-            if isinstance(instance, ro.model):
-                raise NotImplementedError("can't merge Models with OneToOneFields references themselves.")
-            
-            # this may be the 'parent_link' field used to implement multi-
-            # table inheritance.
-            if ro.field.rel.parent_link:
-                # if so, there must not be anything on the other side of
-                # the relation, since that would mean this instance isn't
-                # the most specific one
-                # TODO this test really belongs in MergeForm.__init__
-                try:
-                    getattr(instance, ro.get_accessor_name())
-                    # TODO not the best error message
-                    raise ValueError("Can't merge instances of non-abstract superclasses unless there is no data for any subclass.")
-                except ObjectDoesNotExist:
-                    pass
-            else:
-                try:
-                    other_instance = getattr(instance, ro.get_accessor_name())
-                    _results_add(ro.model, other_instance, ro.field)
-                except ObjectDoesNotExist:
-                    pass
+        # TODO this test really belongs in MergeForm.__init__
+        if relation_map(instance.__class__).self_o2o:
+            raise NotImplementedError("can't merge Models with OneToOneFields references themselves.")
         
-        return results
+        refs = self._refs_to(instance)
+        # a 'parent_link' field used to implement multi-table inheritance
+        # must not have anything on the other side of the relation, since that
+        # would mean this instance isn't the most specific one
+        # TODO this test really belongs in MergeForm.__init__
+        if refs['parent_links']:
+            # TODO not the best error message
+            raise ValueError("Can't merge instances of non-abstract superclasses unless there is no data for any subclass.")
+        
+        return refs['o2o']
     
     @staticmethod
     def _get_o2o_refs_from(instance):
@@ -120,12 +110,9 @@ class MergeForm(forms.ModelForm):
         '''
         
         results = {}
-        inheritance_fields = instance._meta.parents.values()
         for field in instance._meta.fields:
             if isinstance(field, models.OneToOneField):
                 if not field.auto_created:
-                    ro = field.related
-                    other_instance = getattr(instance, field.name)
                     results[field.name] = field
         
         return results
@@ -156,8 +143,7 @@ class MergeForm(forms.ModelForm):
         
         return results
     
-    @staticmethod
-    def _get_m2m_refs_to(instance):
+    def _get_m2m_refs_to(self, instance):
         '''
         Get all the instances that reference the given instance via a ManyToManyField in their Models. Return is of the form:
         {
@@ -167,60 +153,52 @@ class MergeForm(forms.ModelForm):
         }
         '''
         
-        results = {}
-        def _results_add(other_model, other_instance, other_field):
-            # It's important to store only the primary key since we 
-            # don't want to have multiple in-memory instances of the same
-            # object in the database
-            pk = other_instance.pk
-            if not other_model in results:
-                results[other_model] = {}
-            if not pk in results[other_model]:
-                results[other_model][pk] = []
-            results[other_model][pk].append(other_field)
-        
-        for ro in instance._meta.get_all_related_many_to_many_objects():
-            other_queryset = getattr(instance, ro.get_accessor_name()).all()
-            for other_instance in other_queryset:
-                _results_add(
-                    ro.model,
-                    other_instance,
-                    ro.field,
-                )
-        
-        return results
+        return self._refs_to(instance)['m2m']
     
-    @staticmethod
-    def _refs_to_display(instance):
-
-        results = {}
-        def _results_add(other_model, other_instance_pk, other_field):
-            modelname = other_model._meta.verbose_name_plural
-            if not modelname in results:
-                results[modelname] = {}
-            other_instance = other_model.objects.get(pk=other_instance_pk)
-            if not other_instance in results[modelname]:
-                results[modelname][other_instance] = []
-            results[modelname][other_instance].append(other_field.verbose_name)
+    def _refs_to_display(self, instance):
         
         # allow passing in of unsaved instances
         if not instance.pk:
-            return results
+            return {}
         
-        fk = MergeForm._get_fk_refs_to(instance)
-        for model in fk.keys():
-            for pk in fk[model]:
-                for fieldname in fk[model][pk]:
-                    _results_add(model, pk, fieldname)
+        refs = {}
+        for kind in ('fk', 'm2m'):
+            for other_model, other_refs in self._refs_to(instance)[kind].items():
+                model_refs = refs.setdefault(other_model, {})
+                for other_pk, fields in other_refs.items():
+                    model_refs.setdefault(other_pk, []).extend(fields)
         
-        m2m = MergeForm._get_m2m_refs_to(instance)
-        for model in m2m.keys():
-            for pk in m2m[model]:
-                for fieldname in m2m[model][pk]:
-                    _results_add(model, pk, fieldname)
+        # fetch the referring instances with one query per model
+        results = {}
+        for other_model, other_refs in refs.items():
+            modelname = other_model._meta.verbose_name_plural
+            if not modelname in results:
+                results[modelname] = {}
+            other_instances = other_model._default_manager.in_bulk(other_refs.keys())
+            for other_pk, fields in other_refs.items():
+                if not other_pk in other_instances:
+                    continue
+                other_instance = other_instances[other_pk]
+                if not other_instance in results[modelname]:
+                    results[modelname][other_instance] = []
+                results[modelname][other_instance] += [f.verbose_name for f in fields]
         
         return results
     
+    def m2m_pks(self, instance, field_name):
+        '''\
+        Returns the set of primary keys of the instances referred to by the
+        given ManyToManyField of the source or destination. The values for both
+        are fetched together, once per field.
+        '''
+        
+        if not field_name in self._m2m_pks:
+            self._m2m_pks[field_name] = m2m_pks_from(
+                [obj for obj in (self.destination, self.source) if obj.pk is not None and field_name in [f.name for f in obj._meta.many_to_many]],
+                field_name,
+            )
+        return self._m2m_pks[field_name].get(instance.pk, set())
+    
     # useful in templates
     def refs_to_source_display(self):
         return self._refs_to_display(self.source)
@@ -246,6 +224,9 @@ class MergeForm(forms.ModelForm):
         super(MergeForm, self).__init__(data, instance=destination, **kwargs)
         self.source = source
         self.destination = destination
+        # see _refs_to and m2m_pks
+        self._refs = None
+        self._m2m_pks = {}
         
         # TODO start the transaction here? We're getting queryset of other
         # instances to display, then later saving changes to those instances.
@@ -349,46 +330,120 @@ class MergeForm(forms.ModelForm):
                 
         return ok
     
+    def _add_timing(self, description, started):
+        if not hasattr(self, 'timings'):
+            self.timings = []
+        self.timings.append((description, time.time() - started))
+    
+    def timing_summary(self):
+        '''\
+        Returns a description of how long each step of the last save() and
+        delete() took. It's logged (at the INFO level) at the end of delete().
+        '''
+        
+        return u'; '.join([
+            u"%s: %.3fs" % (description, seconds)
+            for description, seconds in getattr(self, 'timings', [])
+        ])
+    
+    def _move_refs(self):
+        '''\
+        Changes all the references to the source to refs to the destination,
+        with one UPDATE query per ForeignKey or ManyToManyField, without
+        instantiating or saving the referring instances. Returns a dictionary
+        of the referring models to sets of the primary keys of the instances
+        that were changed.
+        '''
+        
+        moved = {}
+        def _moved_add(other_model, pks):
+            if pks:
+                moved.setdefault(other_model, set()).update(pks)
+        
+        relations = relation_map(self.source.__class__)
+        
+        for ro in relations.fk:
+            refs = ro.model._default_manager.filter(**{
+                ro.field.name: self.source.pk,
+            })
+            pks = set(refs.values_list('pk', flat=True))
+            if not pks:
+                continue
+            refs.update(**{
+                ro.field.name: self.destination.pk,
+            })
+            _moved_add(ro.model, pks)
+            
+            # keep the in-memory source and destination consistent with the
+            # database
+            for obj in (self.destination, self.source):
+                if isinstance(obj, ro.model) and obj.pk in pks:
+                    setattr(obj, ro.field.name, self.destination)
+        
+        # m2m refs are merged, i.e. the set of refs to the source is unioned
+        # with the set of refs to the destination.
+        for ro in relations.m2m:
+            through = ro.field.rel.through
+            from_name = ro.field.m2m_field_name()
+            to_name = ro.field.m2m_reverse_field_name()
+            
+            rows = through._default_manager.filter(**{
+                to_name: self.source.pk,
+            })
+            pks = set(rows.values_list(from_name, flat=True))
+            if not pks:
+                continue
+            # rows for instances that already refer to the destination are
+            # left to be deleted along with the source
+            already = through._default_manager.filter(**{
+                to_name: self.destination.pk,
+                from_name + '__in': list(pks),
+            }).values_list(from_name, flat=True)
+            rows.exclude(**{
+                from_name + '__in': list(already),
+            }).update(**{
+                to_name: self.destination.pk,
+            })
+            _moved_add(ro.model, pks)
+        
+        return moved
+    
+    def _refs_moved(self, moved):
+        '''\
+        Since _move_refs doesn't save the instances it changes, no signals are
+        sent for them. Instead, this adds them to the current revision (if
+        there is one) and clears the cache entries and integrity checks that
+        depend on them, with one query per model. Subclasses whose derived
+        data depends on the references should extend this.
+        '''
+        
+        # avoid circular imports
+        from reversion import revision
+        from cetacean_incidents.apps.clean_cache.clearing_cache import cache
+        from cetacean_incidents.apps.integrity import models_changed
+        
+        for other_model, pks in moved.items():
+            instances = other_model._default_manager.in_bulk(list(pks)).values()
+            if revision.is_active() and revision.is_registered(other_model):
+                for inst in instances:
+                    revision.add(inst)
+            cache.clearer.instances_changed(instances)
+        models_changed(moved.keys())
+    
     def save(self, commit=True):
         # FIXME uncommited saving is uncertain
         if not commit:
             raise NotImplementedError("uncommited saving of MergeForms is not yet implemented")
         
+        self.timings = []
+        
+        moved = {}
         if self.source.pk:
             # change refs to source to refs to destination
-            refs_from = self._get_m2m_refs_to(self.source)
-            for other_model in refs_from.keys():
-                for other_pk, fields in refs_from[other_model].items():
-                    other_obj = other_model.objects.get(pk=other_pk)
-                    # make sure we're not instantiating an object for the source
-                    # or destination
-                    # TODO if other_obj == self.source, don't bother changing 
-                    # anything
-                    for obj in (self.destination, self.source):
-                        if other_model == obj.__class__:
-                            if not obj.pk is None:
-                                if other_pk == obj.pk:
-                                    other_obj = obj
-                    for field in fields:
-                        accessor = getattr(other_obj, field.name)
-                        accessor.add(self.destination)
-            
-            refs_from = self._get_fk_refs_to(self.source)
-            for other_model in refs_from.keys():
-                for other_pk, fields in refs_from[other_model].items():
-                    other_obj = other_model.objects.get(pk=other_pk)
-                    # make sure we're not instantiating an object for the source
-                    # or destination
-                    for obj in (self.destination, self.source):
-                        if other_model == obj.__class__:
-                            if not obj.pk is None:
-                                if other_pk == obj.pk:
-                                    other_obj = obj
-                    for field in fields:
-                        # switch fk refs from the source to the destination
-                        setattr(other_obj, field.name, self.destination)
-                    other_obj.save()
-            
+            started = time.time()
+            moved = self._move_refs()
+            self._add_timing('moving references', started)
+        
         # handle o2o refs from this model
         for fieldname in self.subforms.keys():
             if fieldname in self.has_field_names:
@@ -404,7 +459,13 @@ class MergeForm(forms.ModelForm):
                 # TODO is this setattr call necessary?
                 setattr(self.destination, fieldname, saved_instance)
         
+        started = time.time()
         result = super(MergeForm, self).save(commit=commit)
+        self._add_timing('saving %s' % self.destination._meta.verbose_name, started)
+        
+        started = time.time()
+        self._refs_moved(moved)
+        self._add_timing('updating moved references', started)
         
         return result
 
@@ -413,6 +474,8 @@ class MergeForm(forms.ModelForm):
         save() saves the destination, delete() deletes the source
         '''
         
+        source_pk = self.source.pk
+        
         if self.source.pk:
             # change refs to source to refs to destination
             # don't remove self.source from m2m refs to it. the references
@@ -437,29 +500,43 @@ class MergeForm(forms.ModelForm):
                             accessor.remove(self.source)
             
             # set o2o refs to self.source to None
-            refs_from = self._get_other_model_o2o_refs_to(self.source)
-            for other_model in refs_from.keys():
-                for other_pk, fields in refs_from[other_model].items():
-                    other_obj = other_model.objects.get(pk=other_pk)
-                    # make sure we're not instantiating an object for the source
-                    # or destination
-                    for obj in (self.destination, self.source):
-                        if other_model == obj.__class__:
-                            if not obj.pk is None:
-                                if other_pk == obj.pk:
-                                    other_obj = obj
-                    for field in fields:
-                        try:
-                            # set o2o refs to the source to None, if possible
-                            setattr(other_obj, field.name, None)
-                        except ValueError:
-                            pass
-                    other_obj.save()
+            started = time.time()
+            relations = relation_map(self.source.__class__)
+            if relations.self_o2o:
+                raise NotImplementedError("can't merge Models with OneToOneFields references themselves.")
+            for ro in relations.parent_links:
+                # there must not be anything on the other side of the
+                # relation, since that would mean the source isn't the most
+                # specific instance
+                if ro.model._default_manager.filter(**{
+                    ro.field.name: self.source.pk,
+                }).exists():
+                    raise ValueError("Can't merge instances of non-abstract superclasses unless there is no data for any subclass.")
+            for ro in relations.o2o:
+                # o2o refs that can't be set to None are left alone, and will
+                # be deleted along with the source
+                if not ro.field.null:
+                    continue
+                ro.model._default_manager.filter(**{
+                    ro.field.name: self.source.pk,
+                }).update(**{
+                    ro.field.name: None,
+                })
+            self._add_timing('clearing one-to-one references', started)
             
         if self.source.pk:
+            started = time.time()
             self.source.delete()
+            self._add_timing('deleting %s' % self.source._meta.verbose_name, started)
 
         # handle o2o refs from this model
         for fieldname in self.subforms.keys():
             self.subforms[fieldname].delete()
+        
+        logger.info(u"merged %s %s into %s: %s" % (
+            self.destination._meta.verbose_name,
+            source_pk,
+            self.destination.pk,
+            self.timing_summary(),
+        ))
 
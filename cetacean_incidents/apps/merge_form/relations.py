@@ -0,0 +1,138 @@
+'''\
+Maps of the relations that refer to each model, and fetching the references
+along them for several instances at once.
+
+A model's related objects (in its _meta) are only complete once all the models
+have been loaded, so each map is built the first time it's needed, and then
+kept for the life of the process.
+'''
+
+from django.db import models
+
+# model -> RelationMap
+_relation_maps = {}
+
+class RelationMap(object):
+    '''\
+    The relations from other models to a model, sorted by kind. Each is a list
+    of RelatedObjects:
+
+        fk: ForeignKeys that aren't OneToOneFields
+        o2o: OneToOneFields that aren't parent links
+        parent_links: OneToOneFields used for multi-table inheritance, from
+            subclasses of the model
+        m2m: ManyToManyFields
+    '''
+
+    def __init__(self, model):
+        self.model = model
+        self.fk = []
+        self.o2o = []
+        self.parent_links = []
+        self.m2m = []
+        # set if one of the o2o refs is from the model itself
+        self.self_o2o = False
+
+        for ro in model._meta.get_all_related_objects():
+            # note that OneToOneFields are also ForeignKeys
+            if not isinstance(ro.field, models.OneToOneField):
+                self.fk.append(ro)
+            elif ro.field.rel.parent_link:
+                # the parent links of the model's own superclasses are
+                # included with their related objects, but those just refer
+                # to other parts of the same instance
+                if not issubclass(model, ro.model):
+                    self.parent_links.append(ro)
+            else:
+                if issubclass(model, ro.model):
+                    self.self_o2o = True
+                self.o2o.append(ro)
+
+        for ro in model._meta.get_all_related_many_to_many_objects():
+            self.m2m.append(ro)
+
+    def refs_to(self, pks):
+        '''\
+        Returns the references to the instances with the given primary keys,
+        using one query per relation. Return is of the form:
+        {
+            <pk>: {
+                'fk': {<other model>: {<other pk>: [<field>, ...]}},
+                'o2o': {<other model>: {<other pk>: [<field>, ...]}},
+                'parent_links': {<other model>: {<other pk>: [<field>, ...]}},
+                'm2m': {<other model>: {<other pk>: [<field>, ...]}},
+            }
+        }
+        '''
+
+        pks = filter(lambda pk: pk is not None, pks)
+        results = {}
+        for pk in pks:
+            results[pk] = {
+                'fk': {},
+                'o2o': {},
+                'parent_links': {},
+                'm2m': {},
+            }
+        if not pks:
+            return results
+
+        def _results_add(kind, pk, other_model, other_pk, other_field):
+            refs = results[pk][kind].setdefault(other_model, {})
+            refs.setdefault(other_pk, []).append(other_field)
+
+        for kind in ('fk', 'o2o', 'parent_links'):
+            for ro in getattr(self, kind):
+                other_refs = ro.model._default_manager.filter(**{
+                    ro.field.name + '__in': pks,
+                }).values_list(ro.field.name, 'pk')
+                for pk, other_pk in other_refs:
+                    _results_add(kind, pk, ro.model, other_pk, ro.field)
+
+        for ro in self.m2m:
+            through = ro.field.rel.through
+            from_name = ro.field.m2m_field_name()
+            to_name = ro.field.m2m_reverse_field_name()
+            rows = through._default_manager.filter(**{
+                to_name + '__in': pks,
+            }).values_list(to_name, from_name)
+            for pk, other_pk in rows:
+                _results_add('m2m', pk, ro.model, other_pk, ro.field)
+
+        return results
+
+def relation_map(model):
+    '''\
+    Returns the RelationMap for the given model.
+    '''
+
+    if not model in _relation_maps:
+        _relation_maps[model] = RelationMap(model)
+    return _relation_maps[model]
+
+def m2m_pks_from(instances, field_name):
+    '''\
+    Returns a dictionary of the primary keys of the given instances to sets of
+    the primary keys of the instances they refer to via the given
+    ManyToManyField, using one query. The instances must all be of models with
+    that field.
+    '''
+
+    results = {}
+    for inst in instances:
+        if inst.pk is not None:
+            results[inst.pk] = set()
+    if not results:
+        return results
+
+    field = instances[0]._meta.get_field(field_name)
+    through = field.rel.through
+    from_name = field.m2m_field_name()
+    to_name = field.m2m_reverse_field_name()
+    rows = through._default_manager.filter(**{
+        from_name + '__in': results.keys(),
+    }).values_list(from_name, to_name)
+    for pk, other_pk in rows:
+        results[pk].add(other_pk)
+
+    return results
@@ -44,12 +44,11 @@ def display_merge_row(destination, source, merge_form, field_name, cell_template
     
     if in_source:
         if isinstance(destination_value, models.Manager):
-            def _pks_set(manager):
-                return set(manager.values_list('pk', flat=True))
+            # the merge form fetches the refs of both with one query
             if isinstance(source_value, models.Manager):
-                differ = not bool(_pks_set(destination_value) == _pks_set(source_value))
+                differ = not bool(merge_form.m2m_pks(destination, field_name) == merge_form.m2m_pks(source, field_name))
             else:
-                differ = not bool(_pks_set(destination_value) == set(source_value))
+                differ = not bool(merge_form.m2m_pks(destination, field_name) == set(source_value))
         else:
             differ = not bool(destination_value == source_value)
     else:
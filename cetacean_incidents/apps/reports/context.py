@@ -0,0 +1,129 @@
+'''\
+Loading the cases a report is rendered for, along with the related entries
+report templates commonly use, in a fixed number of queries no matter how
+many cases there are.
+
+Report templates should use case.observations instead of
+case.observation_set.all, since the former is already loaded. Each
+observation's get_observation_extensions is already loaded as well, along with
+the gear body locations of entanglement observations.
+'''
+
+from django.conf import settings
+from django.db import connection
+
+from cetacean_incidents.apps.incidents.models import (
+    Case,
+    Observation,
+)
+
+# the relations followed with select_related when loading cases and their
+# observations
+CASE_RELATED = (
+    'animal__determined_taxon',
+    'current_yearnumber',
+)
+OBSERVATION_RELATED = (
+    'animal__determined_taxon',
+    'taxon',
+    'location',
+    'observer',
+    'reporter',
+    'observer_vessel',
+)
+
+def query_count():
+    '''\
+    Returns the number of queries this thread has made, or None if they aren't
+    being recorded (i.e. settings.DEBUG is False).
+    '''
+
+    if not settings.DEBUG:
+        return None
+    return len(connection.queries)
+
+def _specific_instances(model, ids, related):
+    # returns a dictionary of ids to instances of the most-specific subclasses
+    # of 'model', using one query per subclass. See
+    # Specificable.specific_instance.
+    instances = {}
+    for subclass in model.__subclasses__():
+        if subclass._meta.abstract or subclass._meta.proxy:
+            continue
+        sub_ids = [i for i in ids if not i in instances]
+        if not sub_ids:
+            break
+        instances.update(_specific_instances(subclass, sub_ids, related))
+
+    rest = [i for i in ids if not i in instances]
+    if rest:
+        for inst in model.objects.filter(id__in=rest).select_related(*related):
+            instances[inst.id] = inst
+
+    return instances
+
+def _load_observation_extensions(observations):
+    # avoid circular imports
+    from cetacean_incidents.apps.entanglements.models import (
+        EntanglementObservation,
+        load_gear_body_locations,
+    )
+    from cetacean_incidents.apps.shipstrikes.models import ShipstrikeObservation
+
+    extensions = {}
+    for oe_class in (EntanglementObservation, ShipstrikeObservation):
+        oes = oe_class.objects.filter(observation_ptr__in=observations.keys())
+        if oe_class is EntanglementObservation:
+            oes = load_gear_body_locations(oes)
+        for oe in oes:
+            extensions.setdefault(oe.observation_ptr_id, []).append(oe)
+
+    for o in observations.values():
+        oes = extensions.get(o.id, [])
+        o._observation_extensions = tuple(oes)
+        for oe in oes:
+            # skip the query for observation_ptr
+            oe._observation_ptr_cache = o
+
+def load_cases(case_ids):
+    '''\
+    Returns a list of the cases with the given ids, in the same order, as
+    instances of their most-specific classes. Each case has an 'observations'
+    attribute with a list of its observations, in the order they were
+    observed. An observation that's in several of the cases is the same
+    instance in each.
+    '''
+
+    case_ids = list(case_ids)
+    cases = _specific_instances(Case, case_ids, CASE_RELATED)
+
+    observation_ids = {}
+    for case_id, observation_id in Observation.cases.through.objects.filter(
+        case__in= case_ids,
+    ).values_list('case', 'observation'):
+        observation_ids.setdefault(case_id, []).append(observation_id)
+
+    all_ids = set()
+    for ids in observation_ids.values():
+        all_ids.update(ids)
+    # the position of each observation in order of observation
+    order = {}
+    observations = {}
+    for i, o in enumerate(Observation.objects.filter(
+        id__in= list(all_ids),
+    ).select_related(*OBSERVATION_RELATED).order_by('datetime_observed', 'id')):
+        order[o.id] = i
+        observations[o.id] = o
+    _load_observation_extensions(observations)
+
+    result = []
+    for case_id in case_ids:
+        if not case_id in cases:
+            continue
+        c = cases[case_id]
+        ids = [i for i in observation_ids.get(case_id, []) if i in observations]
+        ids.sort(key=lambda i: order[i])
+        c.observations = [observations[i] for i in ids]
+        result.append(c)
+
+    return result
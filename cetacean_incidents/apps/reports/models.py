@@ -1,18 +1,37 @@
 import cStringIO as StringIO
-import xhtml2pdf.pisa as pisa
-
+import logging
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+import os
 from os import path
+import time
+
+import xhtml2pdf.pisa as pisa
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.db.models import Max
 from django.template import (
     Context,
     Template,
 )
+from django.utils.html import escape
 
 from django.contrib.auth.models import User
 
+from reversion.models import Revision
+
+from cetacean_incidents.apps.clean_cache import CACHE_TIMEOUT
+
+from context import (
+    load_cases,
+    query_count,
+)
+
 from cetacean_incidents.apps.documents.models import Specificable
 
 # FIXME are we duplicateing settings.MEDIA_ROOT?
@@ -28,23 +47,136 @@ reports_storage = FileSystemStorage(
     base_url= _reports_url,
 )
 
+logger = logging.getLogger(__name__)
+
+# rendered reports and PDFs bigger than this aren't cached, since memcached
+# won't store items over 1MB
+ARTIFACT_CACHE_MAX_SIZE = 1000 * 1000
+
+# report id -> (<template key>, <compiled Template>). Compiling is the slow
+# part of using a template, so each process keeps the last compiled version
+# of each report's template.
+_compiled_templates = {}
+
+def _html_to_pdf(html):
+    # takes and returns a string of bytes
+    result = StringIO.StringIO()
+    pisa.pisaDocument(StringIO.StringIO(html), result)
+    return result.getvalue()
+
 class Report(Specificable):
     
-    def render(self, context):
+    def compiled_template(self):
+        '''\
+        Returns template(), compiling it only if the template has changed since
+        it was last compiled in this process.
+        '''
+        
+        key = self.template_key()
+        if self.id in _compiled_templates:
+            compiled_key, t = _compiled_templates[self.id]
+            if compiled_key == key:
+                return t
         t = self.template()
+        if self.id is not None:
+            _compiled_templates[self.id] = (key, t)
+        return t
+    
+    def render(self, context):
+        started = time.time()
+        queries_before = query_count()
+        
+        t = self.compiled_template()
         if isinstance(context, dict):
             context = Context(context)
-        return t.render(context)
+        result = t.render(context)
+        
+        queries = None
+        if queries_before is not None:
+            queries = query_count() - queries_before
+        logger.info(u"rendered report %s with %s queries in %.3fs" % (
+            self.id,
+            queries is None and u'(unrecorded)' or queries,
+            time.time() - started,
+        ))
+        
+        return result
+    
+    def render_for_cases(self, cases):
+        '''\
+        Renders the report for the given cases, after loading them and the
+        entries they refer to with load_cases.
+        '''
+        
+        return self.render({
+            'cases': load_cases([c.id for c in cases]),
+        })
+    
+    def _pdf_source(self, contents):
+        # the HTML to give to pisa for the given rendered contents
+        if self.format == 'text/html':
+            return contents.encode('utf-8')
+        elif self.format == 'text':
+            return (u'<pre>%s</pre>' % escape(contents)).encode('utf-8')
+        raise NotImplementedError("can't make a PDF from a %s report" % self.format)
 
     def render_to_pdf(self, context):
-        contents = self.render(context)
-        if self.format == 'text/html':
-            result = StringIO.StringIO()
-            pdf = pisa.pisaDocument(StringIO.StringIO(contents.encode("utf-8")), result)
-            return result.getvalue()
-        elif self.format == 'image/svg+xml':
-            raise NotImplementedError
-        return pdf_contents
+        return _html_to_pdf(self._pdf_source(self.render(context)))
+    
+    def render_cases_to_pdf(self, cases):
+        '''\
+        Renders a PDF of the report for the given cases. The template is
+        rendered once for all of them, so headers and totals in it come out
+        the same as in the HTML version.
+        
+        Note that this runs in the calling process, i.e. in the web request
+        for the case search's PDF option, so a PDF of many cases takes as
+        long as the request lasts. Converting separate chunks of cases in
+        other processes would repeat the template's headers and totals in
+        each chunk.
+        '''
+        
+        return _html_to_pdf(self._pdf_source(self.render_for_cases(cases)))
+    
+    def _artifact_cache_key(self, cases, kind):
+        # any change to the data is saved in a revision, so the latest
+        # revision's id stands in for the state of all the cases
+        latest_revision = Revision.objects.aggregate(Max('id'))['id__max']
+        case_ids = u','.join(sorted([unicode(c.id) for c in cases]))
+        digest = sha1(u'|'.join((
+            unicode(self.template_key()),
+            unicode(latest_revision),
+            case_ids,
+        )).encode('utf-8')).hexdigest()
+        return u'report_artifact_%s_%s_%s' % (kind, self.id, digest)
+    
+    def render_cases(self, cases, pdf=False):
+        '''\
+        Returns the rendered report (or a PDF of it, if 'pdf' is True) for the
+        given cases. Results up to ARTIFACT_CACHE_MAX_SIZE bytes are cached
+        until the report's template or any data changes; bigger ones are
+        rendered every time.
+        '''
+        
+        cache_key = self._artifact_cache_key(cases, pdf and 'pdf' or 'rendered')
+        result = cache.get(cache_key)
+        if result is None:
+            if pdf:
+                result = self.render_cases_to_pdf(cases)
+            else:
+                result = self.render_for_cases(cases)
+            size = len(result)
+            if isinstance(result, unicode):
+                size = len(result.encode('utf-8'))
+            if size <= ARTIFACT_CACHE_MAX_SIZE:
+                cache.set(cache_key, result, CACHE_TIMEOUT)
+            else:
+                logger.info(u"not caching report %s for %d cases: %d bytes" % (
+                    self.id,
+                    len(cases),
+                    size,
+                ))
+        return result
     
     name = models.CharField(
         max_length= 256,
@@ -57,6 +189,13 @@ class Report(Specificable):
     
     def template(self):
         raise NotImplementedError
+    
+    def template_key(self):
+        '''\
+        Returns a value that changes whenever template() would return a
+        different template.
+        '''
+        raise NotImplementedError
 
     def __unicode__(self):
         return self.name
@@ -69,6 +208,9 @@ class StringReport(Report):
     
     def template(self):
         return Template(self.template_text)
+    
+    def template_key(self):
+        return sha1(self.template_text.encode('utf-8')).hexdigest()
 
 class FileReport(Report):
 
@@ -86,6 +228,11 @@ class FileReport(Report):
             contents = u"{# The template system assumes you want HTML escaping. Since we're not  generating HTML, turn it off. #}{% autoescape off %}" + contents + u"{% endautoescape %}"
             
         return Template(contents)
+    
+    def template_key(self):
+        # a new upload gets a new name, and an edited file a new mtime
+        stat = os.stat(self.template_file.path)
+        return (self.template_file.name, stat.st_mtime, stat.st_size, self.format)
 
     format = models.CharField(
         max_length= 1000, # TODO just how long can a mimetype be?
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from reversion.models import Revision
+
+from cetacean_incidents.apps.entanglements.models import Entanglement
+
+from cetacean_incidents.apps.incidents.models import (
+    Animal,
+    Case,
+    Observation,
+)
+
+from cetacean_incidents.apps.uncertain_datetimes import UncertainDateTime
+
+import models
+from models import StringReport
+
+class RenderCasesTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.report = StringReport.objects.create(
+            name= 'count',
+            template_text= u'{{ cases|length }} cases',
+        )
+        a = Animal.objects.create()
+        self.cases = [
+            Case.objects.create(animal=a),
+            Case.objects.create(animal=a),
+        ]
+
+    def test_cache_key(self):
+        key = self.report._artifact_cache_key(self.cases, 'rendered')
+
+        # the order of the cases doesn't matter
+        self.assertEqual(
+            key,
+            self.report._artifact_cache_key(list(reversed(self.cases)), 'rendered'),
+        )
+        self.assertNotEqual(
+            key,
+            self.report._artifact_cache_key(self.cases[:1], 'rendered'),
+        )
+        self.assertNotEqual(
+            key,
+            self.report._artifact_cache_key(self.cases, 'pdf'),
+        )
+
+        # any new revision means the data may have changed
+        Revision.objects.create()
+        self.assertNotEqual(
+            key,
+            self.report._artifact_cache_key(self.cases, 'rendered'),
+        )
+
+    def test_invalidation(self):
+        self.assertEqual(self.report.render_cases(self.cases), u'2 cases')
+        key = self.report._artifact_cache_key(self.cases, 'rendered')
+        self.assertEqual(cache.get(key), u'2 cases')
+
+        # a changed template is rendered again
+        self.report.template_text = u'{{ cases|length }} entries'
+        self.report.save()
+        self.assertEqual(self.report.render_cases(self.cases), u'2 entries')
+
+    def test_too_big(self):
+        old_max = models.ARTIFACT_CACHE_MAX_SIZE
+        models.ARTIFACT_CACHE_MAX_SIZE = 5
+        try:
+            self.assertEqual(self.report.render_cases(self.cases), u'2 cases')
+        finally:
+            models.ARTIFACT_CACHE_MAX_SIZE = old_max
+        key = self.report._artifact_cache_key(self.cases, 'rendered')
+        self.assertEqual(cache.get(key), None)
+
+class RenderForCasesTestCase(TestCase):
+
+    def setUp(self):
+        self.report = StringReport.objects.create(
+            name= 'observations',
+            template_text= u'''\
+{% for c in cases %}
+{{ c.name }} {{ c.animal.determined_taxon }}
+{% for o in c.observations %}
+{{ o.datetime_observed }} {{ o.location }} {{ o.observer }}
+{% for oe in o.get_observation_extensions %}{{ oe.id }}{% endfor %}
+{% endfor %}
+{% endfor %}''',
+        )
+        self.cases = []
+        for i in range(4):
+            a = Animal.objects.create()
+            if i % 2:
+                c = Entanglement.objects.create(animal=a)
+            else:
+                c = Case.objects.create(animal=a)
+            for year in (2010, 2011):
+                o = Observation.objects.create(
+                    animal= a,
+                    datetime_observed= UncertainDateTime(year),
+                    datetime_reported= UncertainDateTime(year),
+                )
+                o.cases.add(c)
+            self.cases.append(c)
+
+    def _queries(self, cases):
+        old_debug = settings.DEBUG
+        settings.DEBUG = True
+        try:
+            before = len(connection.queries)
+            self.report.render_for_cases(cases)
+            return len(connection.queries) - before
+        finally:
+            settings.DEBUG = old_debug
+
+    def test_query_count(self):
+        # the same number of queries however many cases there are
+        self.assertEqual(
+            self._queries(self.cases[:2]),
+            self._queries(self.cases),
+        )
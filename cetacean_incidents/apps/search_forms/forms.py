@@ -30,6 +30,33 @@ class SubmitDetectingForm(forms.Form):
         initial= 'yes',
     )
 
+class LookupForm(SubmitDetectingForm):
+    '''\
+    A SubmitDetectingForm for looking up entries. Subclasses' results() returns
+    the entries found.
+    '''
+    
+    # enough to tell if there's only one
+    FIRST_RESULTS_COUNT = 2
+    
+    def _check_found(self, results, message):
+        # for clean methods: raises a ValidationError with the given message
+        # if 'results' is empty, fetching the first_results while checking
+        self._first_results = list(results[:self.FIRST_RESULTS_COUNT])
+        if not self._first_results:
+            raise forms.ValidationError(message)
+        return results
+    
+    def first_results(self):
+        '''\
+        Returns a list of the first FIRST_RESULTS_COUNT results, e.g. for
+        checking whether there's only one.
+        '''
+        
+        if not hasattr(self, '_first_results'):
+            self._first_results = list(self.results()[:self.FIRST_RESULTS_COUNT])
+        return self._first_results
+
 def caching_media_property(cls):
     def _media(self):
         if hasattr(self, '_media_cache'):
@@ -1,7 +1,10 @@
 from django import forms
 from django.template.loader import render_to_string
 
-from cetacean_incidents.apps.contacts.forms import ContactForm
+from cetacean_incidents.apps.contacts.forms import (
+    ContactAutocomplete,
+    ContactForm,
+)
 from cetacean_incidents.apps.contacts.models import Contact
 
 from cetacean_incidents.apps.incidents.forms import (
@@ -63,6 +66,7 @@ class StrikingVesselInfoForm(VesselInfoForm):
     _f = StrikingVesselInfo._meta.get_field('captain')
     existing_captain = forms.ModelChoiceField(
         queryset= Contact.objects.all(),
+        widget= ContactAutocomplete,
         required= False,
         help_text= _f.help_text,
         label= _f.verbose_name.capitalize(),
@@ -1,6 +1,8 @@
 from django.core.urlresolvers import reverse
 from django.db import models
 
+from cetacean_incidents.apps.clean_cache.stamps import register_dependents
+
 from cetacean_incidents.apps.contacts.models import Contact
 
 from cetacean_incidents.apps.delete_guard import guard_deletes
@@ -9,6 +11,7 @@ from cetacean_incidents.apps.incidents.models import (
     Case,
     Observation,
     ObservationExtension,
+    register_observation_extension,
 )
 
 from cetacean_incidents.apps.vessels.models import VesselInfo
@@ -55,6 +58,9 @@ class StrikingVesselInfo(VesselInfo):
     )
 
 guard_deletes(Contact, StrikingVesselInfo, 'captain')
+register_dependents(Contact, lambda c: StrikingVesselInfo.objects.filter(
+    captain= c,
+))
     
 class Shipstrike(Case):
 
@@ -84,53 +90,10 @@ class ShipstrikeObservation(ObservationExtension):
 
 guard_deletes(StrikingVesselInfo, ShipstrikeObservation, 'striking_vessel')
 
-# TODO generalize this for all ObservationExtensions
-def add_shipstrike_extension_handler(sender, **kwargs):
-    # sender shoulde be Observation.cases.through
-    action = kwargs['action']
-    if action == 'post_add':
-        reverse = kwargs['reverse']
-        if not reverse:
-            # observation.cases.add(<some cases>)
-            # kwargs['instance'] is observation
-            # kwargs['model'] is Case
-            # kwargs['pk_set'] is a iterable of Case PK's
-            obs = kwargs['instance']
-            # do we already have an E.OE.
-            try:
-                obs.shipstrikes_shipstrikeobservation
-                return
-            except ShipstrikeObservation.DoesNotExist:
-                # are any of the cases Shipstrikes
-                if Shipstrike.objects.filter(pk__in=kwargs['pk_set']):
-                    # be sure not to overwrite an existing extension
-                    try:
-                        obs.shipstrikes_shipstrikeobservation
-                    except ShipstrikeObservation.DoesNotExist:
-                        ShipstrikeObservation.objects.create(
-                            observation_ptr=obs,
-                        )
-        else:
-            # shipstrike.observation_set.add(<some observations>)
-            # kwargs['instance'] is shipstrike
-            # kwargs['model'] is Observation
-            # kwargs['pk_set'] is a iterable of Observation PK's
-            case = kwargs['instance']
-            if not isinstance(case, Shipstrike):
-                return
-            # add E.OE. to any obs that don't already have them
-            for o in Observation.objects.filter(pk__in=kwargs['pk_set']):
-                # be sure not to overwrite an existing extension
-                try:
-                    o.shipstrikes_shipstrikeobservation
-                except ShipstrikeObservation.DoesNotExist:
-                    ShipstrikeObservation.objects.create(
-                        observation_ptr=o,
-                    )
-
-models.signals.m2m_changed.connect(
-    sender= Observation.cases.through,
-    receiver= add_shipstrike_extension_handler,
-    dispatch_uid= 'observation_cases__add_shipstrike_extension__m2m_changed',
+register_observation_extension(ShipstrikeObservation, Shipstrike)
+
+register_dependents(ShipstrikeObservation, lambda so: [so.observation_ptr])
+register_dependents(StrikingVesselInfo, lambda svi:
+    ShipstrikeObservation.objects.filter(striking_vessel=svi)
 )
 
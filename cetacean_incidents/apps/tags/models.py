@@ -2,6 +2,8 @@ from django.db import models
 
 from django.contrib.auth.models import User
 
+from cetacean_incidents.apps.clean_cache.stamps import register_dependents
+
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
 from cetacean_incidents.apps.documents.models import Documentable
@@ -31,3 +33,4 @@ class Tag(models.Model):
 # Allow deletion of a Documentable to casecade to Tags view Tags.entry
 guard_deletes(User, Tag, 'user')
 
+register_dependents(Tag, lambda t: [t.entry.specific_instance()])
@@ -6,6 +6,7 @@ from cetacean_incidents.apps.clean_cache import (
     CacheDependency,
     TestList,
 )
+from cetacean_incidents.apps.clean_cache.stamps import register_global
 
 from cetacean_incidents.apps.delete_guard import guard_deletes
 
@@ -269,3 +270,4 @@ class Taxon(models.Model):
 
 guard_deletes(Taxon, Taxon, 'supertaxon')
 
+register_global(Taxon)
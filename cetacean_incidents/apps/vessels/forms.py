@@ -5,7 +5,10 @@ from django.forms.util import flatatt
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
 
-from cetacean_incidents.apps.contacts.forms import ContactForm
+from cetacean_incidents.apps.contacts.forms import (
+    ContactAutocomplete,
+    ContactForm,
+)
 from cetacean_incidents.apps.contacts.models import Contact
 
 from cetacean_incidents.apps.countries.models import Country
@@ -95,6 +98,7 @@ class VesselInfoForm(forms.ModelForm):
     _f = VesselInfo._meta.get_field('contact')
     existing_contact = forms.ModelChoiceField(
         queryset= Contact.objects.all(),
+        widget= ContactAutocomplete,
         required= False,
         help_text= _f.help_text,
         label= _f.verbose_name.capitalize(),
@@ -164,6 +168,10 @@ class VesselInfoForm(forms.ModelForm):
         
     # note that we don't need to override has_changed to handle self.new_contact
     
+    @property
+    def media(self):
+        return super(VesselInfoForm, self).media + self.new_contact.media
+    
     def save(self, commit=True):
         
         vi = super(VesselInfoForm, self).save(commit=False)
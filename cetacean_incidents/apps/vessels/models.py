@@ -1,5 +1,7 @@
 from django.db import models
 
+from cetacean_incidents.apps.clean_cache.stamps import register_global
+
 from cetacean_incidents.apps.contacts.models import Contact
 
 from cetacean_incidents.apps.countries.models import Country
@@ -80,3 +82,4 @@ class VesselInfo(models.Model):
 guard_deletes(Contact, VesselInfo, 'contact')
 guard_deletes(Country, VesselInfo, 'flag')
 
+register_global(VesselTag)
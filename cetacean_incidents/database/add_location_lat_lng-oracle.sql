@@ -0,0 +1,8 @@
+alter table LOCATIONS_LOCATION
+  add ("LATITUDE" DOUBLE PRECISION NULL, "LONGITUDE" DOUBLE PRECISION NULL)
+;
+create index LOCATIONS_LOCATION_LATITUDE on LOCATIONS_LOCATION ("LATITUDE")
+;
+create index LOCATIONS_LOCATION_LONGITUDE on LOCATIONS_LOCATION ("LONGITUDE")
+;
+-- then run 'manage.py update_location_coordinates' to fill them in
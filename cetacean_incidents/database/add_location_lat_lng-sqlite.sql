@@ -0,0 +1,11 @@
+alter table "locations_location"
+  add "latitude" real NULL
+;
+alter table "locations_location"
+  add "longitude" real NULL
+;
+create index "locations_location_latitude" on "locations_location" ("latitude")
+;
+create index "locations_location_longitude" on "locations_location" ("longitude")
+;
+-- then run 'manage.py update_location_coordinates' to fill them in
@@ -0,0 +1,63 @@
+CREATE TABLE "INCIDENTS_CASEYEAR" (
+    "ID" NUMBER(11) NOT NULL PRIMARY KEY,
+    "CASE_ID" NUMBER(11) NOT NULL REFERENCES "INCIDENTS_CASE" ("DOCUMENTABLE_PTR_ID") DEFERRABLE INITIALLY DEFERRED,
+    "YEAR" NUMBER(11) NOT NULL,
+    UNIQUE ("CASE_ID", "YEAR")
+)
+;
+
+DECLARE
+    i INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO i FROM USER_CATALOG
+        WHERE TABLE_NAME = 'INCIDENTS_CASEYEAR_SQ' AND TABLE_TYPE = 'SEQUENCE';
+    IF i = 0 THEN
+        EXECUTE IMMEDIATE 'CREATE SEQUENCE "INCIDENTS_CASEYEAR_SQ"';
+    END IF;
+END;
+/
+
+CREATE OR REPLACE TRIGGER "INCIDENTS_CASEYEAR_TR"
+BEFORE INSERT ON "INCIDENTS_CASEYEAR"
+FOR EACH ROW
+WHEN (new."ID" IS NULL)
+    BEGIN
+        SELECT "INCIDENTS_CASEYEAR_SQ".nextval
+        INTO :new."ID" FROM dual;
+    END;
+/
+
+create index INCIDENTS_CASEYEAR_CASE_ID on INCIDENTS_CASEYEAR ("CASE_ID")
+;
+create index INCIDENTS_CASEYEAR_YEAR on INCIDENTS_CASEYEAR ("YEAR")
+;
+
+CREATE TABLE "INCIDENTS_YEARSUMMARY" (
+    "ID" NUMBER(11) NOT NULL PRIMARY KEY,
+    "YEAR" NUMBER(11) NOT NULL UNIQUE,
+    "CASE_COUNT" NUMBER(11) NOT NULL,
+    "OBSERVATION_COUNT" NUMBER(11) NOT NULL
+)
+;
+
+DECLARE
+    i INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO i FROM USER_CATALOG
+        WHERE TABLE_NAME = 'INCIDENTS_YEARSUMMARY_SQ' AND TABLE_TYPE = 'SEQUENCE';
+    IF i = 0 THEN
+        EXECUTE IMMEDIATE 'CREATE SEQUENCE "INCIDENTS_YEARSUMMARY_SQ"';
+    END IF;
+END;
+/
+
+CREATE OR REPLACE TRIGGER "INCIDENTS_YEARSUMMARY_TR"
+BEFORE INSERT ON "INCIDENTS_YEARSUMMARY"
+FOR EACH ROW
+WHEN (new."ID" IS NULL)
+    BEGIN
+        SELECT "INCIDENTS_YEARSUMMARY_SQ".nextval
+        INTO :new."ID" FROM dual;
+    END;
+/
+-- then run 'manage.py update_year_index' to fill them in
@@ -0,0 +1,19 @@
+CREATE TABLE "incidents_caseyear" (
+    "id" integer NOT NULL PRIMARY KEY,
+    "case_id" integer NOT NULL REFERENCES "incidents_case" ("documentable_ptr_id"),
+    "year" integer NOT NULL,
+    UNIQUE ("case_id", "year")
+)
+;
+create index "incidents_caseyear_case_id" on "incidents_caseyear" ("case_id")
+;
+create index "incidents_caseyear_year" on "incidents_caseyear" ("year")
+;
+CREATE TABLE "incidents_yearsummary" (
+    "id" integer NOT NULL PRIMARY KEY,
+    "year" integer NOT NULL UNIQUE,
+    "case_count" integer NOT NULL,
+    "observation_count" integer NOT NULL
+)
+;
+-- then run 'manage.py update_year_index' to fill them in
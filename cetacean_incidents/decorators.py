@@ -1,7 +1,17 @@
+from datetime import datetime
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1 # for python 2.5 compat.
+
 from django.conf import settings
+from django.views.decorators.http import condition
 
+from django.contrib import messages
 from django.contrib.auth.decorators import permission_required as old_permission_required
 
+from cetacean_incidents.apps.clean_cache.stamps import instance_stamps
+
 def permission_required(perm, login_url=None):
     '''\
     Like Django's permission_required, but the login_url defaults to the value
@@ -16,3 +26,43 @@ def global_etag(request, *args, **kwargs):
         if hasattr(settings, 'GLOBAL_ETAG'):
             return settings.GLOBAL_ETAG
 
+def stamped_condition(instances):
+    '''\
+    Like Django's condition decorator, but with an ETag and Last-Modified time
+    made from the version stamps of the model instances returned by
+    instances(request, *args, **kwargs) and the requesting user. The instances
+    only need their primary keys set. See clean_cache.stamps.
+
+    Nothing is sent for anonymous users or while there are messages waiting to
+    be shown, since those pages differ from the usual ones.
+    '''
+
+    def _stamps(request, *args, **kwargs):
+        # the ETag and Last-Modified functions both need the stamps, so only
+        # look them up once per request
+        if not hasattr(request, '_instance_stamps'):
+            request._instance_stamps = None
+            if (
+                request.method in ('GET', 'HEAD')
+                and request.user.is_authenticated()
+                and not len(messages.get_messages(request))
+            ):
+                insts = list(instances(request, *args, **kwargs))
+                insts.append(request.user)
+                request._instance_stamps = instance_stamps(insts)
+        return request._instance_stamps
+
+    def _etag(request, *args, **kwargs):
+        stamps = _stamps(request, *args, **kwargs)
+        if stamps is None:
+            return None
+        tokens = [token for token, made in stamps]
+        return sha1(repr((request.user.pk, tokens))).hexdigest()
+
+    def _last_modified(request, *args, **kwargs):
+        stamps = _stamps(request, *args, **kwargs)
+        if stamps is None:
+            return None
+        return datetime.utcfromtimestamp(max([made for token, made in stamps]))
+
+    return condition(etag_func=_etag, last_modified_func=_last_modified)
@@ -68,6 +68,8 @@ MIDDLEWARE_CLASSES = (
     #'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.doc.XViewMiddleware',
+    # must come before TransactionMiddleware
+    'cetacean_incidents.apps.clean_cache.stamps.StampMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     'reversion.middleware.RevisionMiddleware',
 )
@@ -106,6 +108,9 @@ INSTALLED_APPS = (
     'cetacean_incidents.apps.describe_fields',
     'cetacean_incidents.apps.documents',
     'cetacean_incidents.apps.csv_import',
+    'cetacean_incidents.apps.duplicates',
+    'cetacean_incidents.apps.integrity',
+    'cetacean_incidents.apps.counters',
     'cetacean_incidents.apps.clean_cache',
     'cetacean_incidents.apps.search_forms',
     'cetacean_incidents.apps.reports',
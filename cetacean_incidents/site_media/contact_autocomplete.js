@@ -0,0 +1,74 @@
+// note that these need to be set before the sources are used
+var contact_autocomplete_source_url = undefined;
+var organization_autocomplete_source_url = undefined;
+
+var _contact_autocomplete_suggests = function(entries) {
+    var suggests = []
+    for(var i = 0; i < entries.length; i++) {
+        suggests[i] = {};
+        suggests[i].label = entries[i].plain_name;
+        suggests[i].html_label = entries[i].html_name;
+        suggests[i].value = entries[i].id;
+    }
+    return suggests;
+}
+
+var contact_autocomplete_source = function (request, response) {
+    // request.term has the search term
+    // response is a function that takes the results as it's only arg
+    
+    $.getJSON(
+        // TODO error-handling!
+        contact_autocomplete_source_url,
+        { q: request.term},
+        function(contacts) {
+            response(_contact_autocomplete_suggests(contacts));
+        }
+    );
+}
+
+var organization_autocomplete_source = function (request, response) {
+    $.getJSON(
+        // TODO error-handling!
+        organization_autocomplete_source_url,
+        { q: request.term},
+        function(orgs) {
+            response(_contact_autocomplete_suggests(orgs));
+        }
+    );
+}
+
+var OrganizationsAutocomplete = {
+    // the chosen organizations are kept as hidden inputs named 'name' in the
+    // list with the id '<id>-chosen'
+    init: function(id, name) {
+        var chosen = $('#' + id + '-chosen');
+        chosen.delegate('button.remove', 'click', function() {
+            $(this).parent().remove();
+            return false;
+        });
+        
+        $('#' + id).autocomplete({
+            minLength: 2,
+            source: organization_autocomplete_source,
+            focus: function(event, ui) {
+                $(this).val(ui.item.label);
+                return false;
+            },
+            select: function(event, ui) {
+                if (!chosen.find('input[value="' + ui.item.value + '"]').length) {
+                    var li = $('<li></li>').text(ui.item.label);
+                    var input = $('<input type="hidden">');
+                    input.attr('name', name);
+                    input.val(ui.item.value);
+                    li.append(input);
+                    li.append('<button type="button" class="remove">remove</button>');
+                    chosen.append(li);
+                }
+                $(this).val('');
+                return false;
+            }
+        });
+    }
+}
+
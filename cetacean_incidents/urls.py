@@ -23,6 +23,7 @@ urlpatterns = patterns('',
     (r'^entanglements/', include('cetacean_incidents.apps.entanglements.urls')),
     (r'^shipstrikes/', include('cetacean_incidents.apps.shipstrikes.urls')),
     (r'^tags/', include('cetacean_incidents.apps.tags.urls')),
+    (r'^locations/', include('cetacean_incidents.apps.locations.urls')),
     
     (r'^manual/', include('cetacean_incidents.apps.manual.urls')),
     (r'^problems/', views.odd_entries, {}, 'odd_entries'),
@@ -53,6 +54,7 @@ urlpatterns += patterns('cetacean_incidents.generic_views',
 urlpatterns += patterns('',
     (r'^new_case$', views.new_case, {}, 'new_case'),
     (r'^revisions/(?P<rev_id>\d+)/$', views.revision_detail, {}, 'revision_detail'),
+    (r'^revisions/versions/(?P<ver_id>\d+)/diff$', views.version_diff, {}, 'version_diff'),
     (r'^revisions/object_history/(?P<content_type_id>\d+)/$', views.object_history, {}, 'object_history'),
     (r'^revisions/object_history/(?P<content_type_id>\d+)/(?P<object_id>\d+)/$', views.object_history, {}, 'object_history'),
     
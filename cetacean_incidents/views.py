@@ -1,14 +1,17 @@
 from difflib import SequenceMatcher
-import re
-from itertools import chain
 import json
 import numbers
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import (
+    EmptyPage,
+    InvalidPage,
+    Paginator,
+)
 from django.core.urlresolvers import NoReverseMatch
 from django.db import models
 from django.db.models import Q
-from django.db.models.query import QuerySet
 from django.forms import Media
 from django.http import HttpResponse
 from django.shortcuts import (
@@ -16,7 +19,7 @@ from django.shortcuts import (
     render_to_response,
 )
 from django.template import RequestContext
-from django.utils.datastructures import SortedDict
+from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
 
 from django.contrib.auth.decorators import (
@@ -36,13 +39,13 @@ from forms import (
     CaseTypeForm_factory,
 )
 
-from cetacean_incidents.apps.contacts.models import (
-    Contact,
-    Organization,
-)
+from cetacean_incidents.apps import counters
+
+from cetacean_incidents.apps.csv_export import UnicodeDictWriter
+
+from cetacean_incidents.apps.duplicates import models as duplicates
 
 from cetacean_incidents.apps.entanglements.forms import EntanglementNMFSIDLookupForm
-from cetacean_incidents.apps.entanglements.models import Entanglement
 from cetacean_incidents.apps.entanglements.views import add_entanglementobservation
 
 from cetacean_incidents.apps.incidents.forms import (
@@ -58,7 +61,8 @@ from cetacean_incidents.apps.incidents.models import (
 )
 from cetacean_incidents.apps.incidents.views import add_observation
 
-from cetacean_incidents.apps.shipstrikes.models import Shipstrike
+from cetacean_incidents.apps import integrity
+
 from cetacean_incidents.apps.shipstrikes.views import add_shipstrikeobservation
 
 from cetacean_incidents.apps.taxons.views import import_search as unsecured_import_taxon
@@ -80,19 +84,20 @@ def home(request):
         forms[form_name] = form_class(prefix=form_name, **kwargs)
         if '%s-submitted' % form_name in request.GET:
             if forms[form_name].is_valid():
-                r = forms[form_name].results()
-                if (isinstance(r, QuerySet) and r.count() == 1) or len(r) == 1:
-                    return redirect(r[0])
-                results[form_name] = r
+                # redirect if there's only one result
+                first = forms[form_name].first_results()
+                if len(first) == 1:
+                    return redirect(first[0])
+                results[form_name] = forms[form_name].results()
     
     template_media = Media()
     
     return render_to_response(
         'home.html',
         {
-            'animal_count': Animal.objects.count(),
-            'case_count': Case.objects.count(),
-            'observation_count': Observation.objects.count(),
+            'animal_count': counters.get_counter('animals').count(),
+            'case_count': counters.get_counter('cases').count(),
+            'observation_count': counters.get_counter('observations').count(),
             'forms': forms,
             'results': results,
             'media': reduce(lambda m, f: m + f.media, forms.values(), template_media),
@@ -169,32 +174,92 @@ def html_diff(old, new):
     else:
         return "<i>%s -> %s</i>" % map(unicode, (old.__class__, new.__class__))
 
+def _version_neighbors(versions):
+    '''\
+    Given a list of Versions, returns a dictionary mapping each one's id to a
+    dictionary with 'old' and 'new' keys, each either None or a dictionary
+    with the 'id' and 'revision_id' of the version of the same object saved
+    just before or after it. Uses one query.
+    '''
+    
+    object_ids = {}
+    for ver in versions:
+        object_ids.setdefault(ver.content_type_id, set()).add(ver.object_id)
+    
+    versions_query = Q()
+    for content_type_id, ids in object_ids.items():
+        versions_query |= Q(content_type=content_type_id, object_id__in=ids)
+    if not versions_query: # bool(Q()) is False
+        return {}
+    
+    histories = {}
+    for ver_id, content_type_id, object_id, revision_id, date_created in Version.objects.filter(
+        versions_query,
+    ).values_list('id', 'content_type', 'object_id', 'revision', 'revision__date_created'):
+        histories.setdefault((content_type_id, object_id), []).append({
+            'id': ver_id,
+            'revision_id': revision_id,
+            'date_created': date_created,
+        })
+    
+    neighbors = {}
+    for ver in versions:
+        history = histories[(ver.content_type_id, ver.object_id)]
+        date_created = filter(lambda h: h['id'] == ver.id, history)[0]['date_created']
+        older = filter(lambda h: h['date_created'] < date_created, history)
+        newer = filter(lambda h: h['date_created'] > date_created, history)
+        neighbors[ver.id] = {
+            'old': older and max(older, key=lambda h: h['date_created']) or None,
+            'new': newer and min(newer, key=lambda h: h['date_created']) or None,
+        }
+    
+    return neighbors
+
+def _version_fields(ver):
+    # reading the JSON directly is much faster than deserializing the object
+    if ver.format == 'json':
+        data = json.loads(ver.serialized_data)
+        if len(data) == 1:
+            return data[0]['fields']
+    return ver.get_field_dict()
+
+REVISION_VERSIONS_PER_PAGE = 50
+# the changed versions of revisions with no more versions than this start out
+# with their field diffs shown
+REVISION_EXPAND_LIMIT = 10
+
 @login_required
 def revision_detail(request, rev_id):
     
     rev = Revision.objects.get(id=rev_id)
     
-    # annotate the versions with a reference to their previous versions
-    annotated_versions = rev.version_set.all()
+    version_pages = Paginator(rev.version_set.order_by('id'), REVISION_VERSIONS_PER_PAGE)
+    
+    # Make sure page request is an int. If not, deliver first page.
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    
+    # If page request (9999) is out of range, deliver last page of results.
+    try:
+        versions = version_pages.page(page)
+    except (EmptyPage, InvalidPage):
+        versions = version_pages.page(version_pages.num_pages)
+    
+    annotated_versions = list(versions.object_list)
+    
+    # annotate the versions with references to their previous and next
+    # versions
+    neighbors = _version_neighbors(annotated_versions)
+    old_versions = Version.objects.in_bulk(
+        [n['old']['id'] for n in neighbors.values() if n['old']]
+    )
     
     for ver in annotated_versions:
-        ver.old_version = None
-        old_versions = Version.objects.filter(
-            content_type= ver.content_type,
-            object_id= ver.object_id,
-            revision__date_created__lt= ver.revision.date_created,
-        ).order_by('-revision__date_created')
-        if old_versions.count():
-            ver.old_version = old_versions[0]
-        ver.new_version = None
-        new_versions = Version.objects.filter(
-            content_type= ver.content_type,
-            object_id= ver.object_id,
-            revision__date_created__gt= ver.revision.date_created,
-        ).order_by('revision__date_created')
-        if new_versions.count():
-            ver.new_version = new_versions[0]
-        else:
+        ver.old_version = neighbors[ver.id]['old']
+        ver.new_version = neighbors[ver.id]['new']
+        if ver.new_version is None:
             # this is either the current version or was deleted
             # if it's current we don't need to worry about intervening schemata
             # changes and can safely vivify it to get the URL of it's page
@@ -204,99 +269,209 @@ def revision_detail(request, rev_id):
                     ver.url = instance.get_absolute_url()
                 except NoReverseMatch:
                     pass
-
-        fields = {}
-        for name, value in ver.get_field_dict().items():
-            fields[name] = {'new': value, 'old': None}
-
-        if ver.old_version:
-            for name, value in ver.old_version.get_field_dict().items():
-                if not name in fields.keys():
-                    fields[name] = {'new': None, 'old': None}
-                fields[name]['old'] = value
         
-        # compute diffs
-        ver.differs = False
-        for f in fields.values():
-            if f['new'] != f['old']:
-                ver.differs = True
-                f['differ'] = True
-            f['diff'] = mark_safe(html_diff(f['old'], f['new']))
-        
-        ver.fields = fields
+        # the field diffs themselves are only rendered if they're asked for;
+        # see version_diff
+        if ver.old_version:
+            ver.differs = _version_fields(ver) != _version_fields(old_versions[ver.old_version['id']])
+        else:
+            ver.differs = True
+        ver.expand = ver.differs and version_pages.count <= REVISION_EXPAND_LIMIT
     
     return render_to_response('reversion/revision_detail.html', {
         'rev': rev,
+        'page': versions,
         'annotated_versions': annotated_versions,
         'media': Media(js=(settings.JQUERY_FILE, 'checkboxhider.js')),
     }, RequestContext(request))
-    
+
+# versions are never changed, so their diffs can be cached for a long time
+VERSION_DIFF_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
 @login_required
-def object_history(request, content_type_id, object_id=None):
-    content_type = ContentType.objects.get(id=content_type_id)
+def version_diff(request, ver_id):
+    '''\
+    Returns an HTML table of the differences between the given version and the
+    previous version of the same object. These are cached by the ids of the
+    two versions.
+    '''
     
-    versions = Version.objects.filter(content_type=content_type).order_by('revision__date_created')
-    if not object_id is None:
-        versions = versions.filter(object_id=object_id)
+    ver = Version.objects.get(id=ver_id)
+    old_version = _version_neighbors([ver])[ver.id]['old']
     
-    meta_keys = set()
-    field_keys = set()
+    cache_key = u'version_diff_%d_%s' % (ver.id, old_version and old_version['id'] or 'none')
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return HttpResponse(cached)
     
-    flat_versions = []
+    if old_version:
+        old_version = Version.objects.get(id=old_version['id'])
     
-    for v in versions:
-        if not v.format == 'json':
-            print "!!! non-JSON version %d !!!" % v.id
-            continue
-        
-        data = json.loads(v.serialized_data)
-        if len(data) != 1:
-            print "!!! weird list in version %d !!!" % v.id
-            continue
-        data = data[0]
-        
-        meta_keys.update(data.keys())
-        
-        fields = data['fields']
-        field_keys.update(fields.keys())
+    fields = {}
+    for name, value in ver.get_field_dict().items():
+        fields[name] = {'new': value, 'old': None}
+    
+    if old_version:
+        for name, value in old_version.get_field_dict().items():
+            if not name in fields.keys():
+                fields[name] = {'new': None, 'old': None}
+            fields[name]['old'] = value
+    
+    # compute diffs
+    for f in fields.values():
+        if f['new'] != f['old']:
+            f['differ'] = True
+            f['diff'] = mark_safe(html_diff(f['old'], f['new']))
+    
+    rendered = render_to_string('reversion/version_diff_include.html', {
+        'ver': ver,
+        'old_version': old_version,
+        'fields': fields,
+    })
+    cache.set(cache_key, rendered, VERSION_DIFF_CACHE_TIMEOUT)
+    
+    return HttpResponse(rendered)
+
+# content type id -> list of serialized field names
+_history_schemata = {}
+
+def _history_schema(content_type):
+    '''\
+    Returns the names of the fields that are serialized in the versions of
+    the given ContentType's model, in the same order as Django's serializers
+    use.
+    '''
+    
+    if not content_type.id in _history_schemata:
+        model = content_type.model_class()
+        if model is None:
+            schema = None
+        else:
+            schema = [f.name for f in model._meta.local_fields if f.serialize]
+            schema += [f.name for f in model._meta.many_to_many if f.serialize]
+        _history_schemata[content_type.id] = schema
+    return _history_schemata[content_type.id]
+
+# version id -> the parsed contents of its serialized_data. versions are never
+# changed, so this never needs invalidating, just trimming.
+_parsed_versions = {}
+_PARSED_VERSIONS_LIMIT = 10000
+
+def _parse_version(v):
+    if not v.id in _parsed_versions:
+        if len(_parsed_versions) >= _PARSED_VERSIONS_LIMIT:
+            _parsed_versions.clear()
+        data = None
+        if v.format == 'json':
+            data = json.loads(v.serialized_data)
+            if len(data) == 1:
+                data = data[0]
+            else:
+                data = None
+        _parsed_versions[v.id] = data
+    return _parsed_versions[v.id]
 
-    meta_keys.remove('fields')
+HISTORY_META_KEYS = ('pk', 'model', 'user', 'datetime')
 
+def _history_rows(versions, field_keys):
+    '''\
+    Yields a list of values for each of the versions, in the order of
+    HISTORY_META_KEYS and then field_keys. Versions that aren't a single
+    JSON-serialized object are skipped.
+    '''
+    
     for v in versions:
-        if not v.format == 'json':
-            print "!!! non-JSON version %d !!!" % v.id
+        data = _parse_version(v)
+        if data is None:
             continue
         
-        data = json.loads(v.serialized_data)
-        if len(data) != 1:
-            print "!!! weird list in version %d !!!" % v.id
-            continue
-        data = data[0]
-
-        flat_version = []
-
-        for k in meta_keys:
-            flat_version.append(data[k])
-        flat_version.append(v.revision.user)
-        flat_version.append(v.revision.date_created)
-
+        row = [
+            data.get('pk'),
+            data.get('model'),
+            v.revision.user,
+            v.revision.date_created,
+        ]
         fields = data['fields']
-        for k in field_keys:
-            flat_version.append(fields[k])
-        flat_versions.append(flat_version)
+        # versions from before a field was added won't have it
+        row += [fields.get(k) for k in field_keys]
+        yield row
+
+class _Chunks(list):
+    # a file-like object that just collects what's written to it
+    write = list.append
+
+def _history_csv(keys, rows):
+    chunks = _Chunks()
+    writer = UnicodeDictWriter(chunks, fieldnames=keys, dialect='excel', encoding='utf-8')
+    writer.writerow(dict(zip(keys, keys)))
+    for row in rows:
+        writer.writerow(dict(zip(
+            keys,
+            [v is not None and unicode(v) or u'' for v in row],
+        )))
+        for chunk in chunks:
+            yield chunk
+        del chunks[:]
+    # the header row, if there were no rows
+    for chunk in chunks:
+        yield chunk
+
+HISTORY_VERSIONS_PER_PAGE = 100
+
+@login_required
+def object_history(request, content_type_id, object_id=None):
+    content_type = ContentType.objects.get(id=content_type_id)
+    
+    versions = Version.objects.filter(
+        content_type= content_type,
+    ).select_related('revision__user').order_by('revision__date_created', 'id')
+    if not object_id is None:
+        versions = versions.filter(object_id=object_id)
+    
+    field_keys = _history_schema(content_type)
+    if field_keys is None:
+        # the model's gone, so go by the fields in its last version
+        field_keys = []
+        for v in versions.order_by('-revision__date_created', '-id')[:1]:
+            data = _parse_version(v)
+            if not data is None:
+                field_keys = sorted(data['fields'].keys())
+    
+    if request.GET.get('format') == 'csv':
+        keys = map(lambda k: 'meta:' + k, HISTORY_META_KEYS) + field_keys
+        response = HttpResponse(
+            _history_csv(keys, _history_rows(versions.iterator(), field_keys)),
+            mimetype= 'text/csv',
+        )
+        filename = content_type.model
+        if not object_id is None:
+            filename += '_%s' % object_id
+        response['Content-Disposition'] = 'attachment; filename=%s_history.csv' % filename
+        return response
+    
+    version_pages = Paginator(versions, HISTORY_VERSIONS_PER_PAGE)
+    
+    # Make sure page request is an int. If not, deliver first page.
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        page = 1
+    
+    # If page request (9999) is out of range, deliver last page of results.
+    try:
+        page = version_pages.page(page)
+    except (EmptyPage, InvalidPage):
+        page = version_pages.page(version_pages.num_pages)
     
-    meta_keys.add('user')
-    meta_keys.add('datetime')
-        
     return render_to_response(
         'reversion/object_history.html', 
         {
             'object_id': object_id,
             'content_type': content_type,
-            'meta_keys': map(lambda k: k.replace('_', ' '), meta_keys),
+            'meta_keys': HISTORY_META_KEYS,
             'field_keys': map(lambda k: k.replace('_', ' '), field_keys),
-            'flat_versions': flat_versions,
-            'versions': versions,
+            'flat_versions': _history_rows(page.object_list, field_keys),
+            'page': page,
         },
         RequestContext(request),
     )
@@ -374,73 +549,23 @@ def import_taxon(request):
     
     return unsecured_import_taxon(request)
 
-_unimportant = re.compile(r'\W', re.UNICODE)
-def _search_key(string):
-    # maps a string to a search key to find similiar ones
-    return _unimportant.sub('', string).lower()
-
-def _find_similiar(fields):
-    '''\
-    given an iterable of tuples of the form (Model, fieldname), returns a
-    dictionary keyed to a search key whose values are the instances of those models
-    whose fields match that search key.
-    '''
-    
-    all_objs = tuple()
-    for Model, fieldname in fields:
-        all_objs = chain(all_objs, Model.objects.exclude(
-            Q(**{fieldname: ''}) | Q(**{fieldname + '__isnull': True}),
-        ))
-    
-    search_keys = {}
-    for obj in all_objs:
-        key = _search_key(getattr(obj, fieldname))
-        if not key in search_keys.keys():
-            search_keys[key] = []
-        search_keys[key].append(obj)
-    
-    # same_value is just search_keys, but with the keys in order and the values
-    # below a certain length removed
-    same_value = SortedDict()
-    for key in sorted(search_keys.keys()):
-        objs = search_keys[key]
-        if len(objs) > 1:
-            same_value[key] = objs
-    
-    return same_value
-
 @login_required
 def odd_entries(request):
     
-    contacts_same_name = _find_similiar(((Contact, 'name'), (Organization, 'name')))
+    contacts_same_name = duplicates.same_key('contact_name')
     
-    animals_same_number = _find_similiar(((Animal, 'field_number'),))
+    animals_same_number = duplicates.same_key('animal_field_number')
     
-    animal_names = sorted(map(_search_key, Animal.objects.exclude(Q(name='') | Q(name__isnull=True)).values_list('name', flat=True)))
-    animals_same_name = SortedDict()
-    for name in animal_names:
-        animals = Animal.objects.filter(name__icontains=name)
-        if animals.count() > 1:
-            animals_same_name[name] = animals
-        
-    no_cases = Animal.objects.filter(case__id__isnull=True)
-    
-    entanglements_same_nmfs = _find_similiar(((Entanglement, 'nmfs_id'),))
+    animals_same_name = duplicates.contained_key('animal_name')
     
-    no_obs = Case.objects.filter(observation__id__isnull=True)
+    entanglements_same_nmfs = duplicates.same_key('entanglement_nmfs_id')
     
-    ent_ids = Entanglement.objects.values_list('pk', flat=True)
-    ss_ids = Shipstrike.objects.values_list('pk', flat=True)
-    no_ent_obs_ext = Observation.objects.filter(
-        cases__pk__in= ent_ids,
-    ).filter(
-        entanglements_entanglementobservation__isnull= True,
-    )
-    no_ss_obs_ext = Observation.objects.filter(
-        cases__pk__in= ss_ids,
-    ).filter(
-        shipstrikes_shipstrikeobservation__isnull= True,
-    )
+    # see the integrity app
+    failed_checks = []
+    for check in integrity.all_checks():
+        entries = check.entries()
+        if entries:
+            failed_checks.append((check, entries))
 
     return render_to_response(
         'odd_entries.html',
@@ -448,11 +573,8 @@ def odd_entries(request):
             'contacts_same_name': contacts_same_name,
             'animals_same_number': animals_same_number,
             'animals_same_name': animals_same_name,
-            'animals_no_cases': no_cases,
-            'cases_no_observations': no_obs,
             'entanglements_same_nmfs': entanglements_same_nmfs,
-            'observations_no_ent': no_ent_obs_ext,
-            'observations_no_ss': no_ss_obs_ext,
+            'failed_checks': failed_checks,
         },
         context_instance= RequestContext(request),
     )